@@ -0,0 +1,229 @@
+# activity_curves.py
+# Vectorized insulin and carbohydrate activity curves shared by feature engineering and the models
+
+import numpy as np
+from typing import TYPE_CHECKING, Callable, Union
+
+# pandas is only named in annotations, so serving code can import this module without it
+if TYPE_CHECKING:
+    import pandas as pd
+
+ArrayLike = Union[np.ndarray, 'pd.Series']
+
+# Insulin action: rises to a peak at 75 minutes, then decays exponentially
+INSULIN_PEAK_MINUTES = 75
+INSULIN_DECAY_MINUTES = 50
+
+# Carb absorption: rises linearly to a peak at 30 minutes, then decays exponentially
+CARB_PEAK_MINUTES = 30
+CARB_DECAY_MINUTES = 150
+
+# Duration of insulin action and carb absorption, and the grid step events are convolved on
+INSULIN_ACTION_MINUTES = 300
+CARB_ABSORPTION_MINUTES = 240
+ACTIVITY_GRID_MINUTES = 5
+
+def _as_float_array(values: ArrayLike) -> np.ndarray:
+    """Convert values to a float64 array (curves are evaluated in double precision)."""
+    return np.asarray(values, dtype=np.float64)
+
+def insulin_activity(minutes: ArrayLike, cutoff: float = np.inf,
+                     zero_non_positive: bool = True) -> np.ndarray:
+    """
+    Fraction of insulin activity at each time since a dose.
+
+    Before the peak the curve is (m / peak) * exp(-(m - peak) / decay), after it
+    exp(-(m - peak) / decay). Missing times and times at or past the cutoff give 0.
+
+    Args:
+        minutes: Minutes since the insulin dose
+        cutoff: Duration of insulin action in minutes
+        zero_non_positive: Whether times of 0 minutes or less give 0
+
+    Returns:
+        Array of activity values
+    """
+    minutes = _as_float_array(minutes)
+
+    with np.errstate(over='ignore', invalid='ignore'):
+        decay = np.exp(-(minutes - INSULIN_PEAK_MINUTES) / INSULIN_DECAY_MINUTES)
+        activity = np.where(minutes < INSULIN_PEAK_MINUTES, (minutes / INSULIN_PEAK_MINUTES) * decay, decay)
+
+    inactive = np.isnan(minutes) | (minutes >= cutoff)
+    if zero_non_positive:
+        inactive |= minutes <= 0
+
+    return np.where(inactive, 0, activity)
+
+def carb_activity(minutes: ArrayLike, cutoff: float = np.inf,
+                  zero_non_positive: bool = True) -> np.ndarray:
+    """
+    Fraction of carbohydrate absorption activity at each time since a meal.
+
+    Before the peak the curve rises linearly as m / peak, after it decays as
+    exp(-(m - peak) / decay). Missing times and times at or past the cutoff give 0.
+
+    Args:
+        minutes: Minutes since the carb intake
+        cutoff: Duration of carb absorption in minutes
+        zero_non_positive: Whether times of 0 minutes or less give 0
+
+    Returns:
+        Array of activity values
+    """
+    minutes = _as_float_array(minutes)
+
+    with np.errstate(over='ignore', invalid='ignore'):
+        activity = np.where(minutes < CARB_PEAK_MINUTES, minutes / CARB_PEAK_MINUTES,
+                            np.exp(-(minutes - CARB_PEAK_MINUTES) / CARB_DECAY_MINUTES))
+
+    inactive = np.isnan(minutes) | (minutes >= cutoff)
+    if zero_non_positive:
+        inactive |= minutes <= 0
+
+    return np.where(inactive, 0, activity)
+
+def scaled_activity(amounts: ArrayLike, activity: np.ndarray) -> np.ndarray:
+    """
+    Scale activity values by the dose or carb amount, treating missing amounts as 0.
+
+    Args:
+        amounts: Insulin doses or carb amounts
+        activity: Activity values from insulin_activity or carb_activity
+
+    Returns:
+        Array of active amounts
+    """
+    amounts = _as_float_array(amounts)
+    return np.where(np.isnan(amounts) | (amounts == 0), 0.0, amounts * activity)
+
+def insulin_on_board_hours(hours: ArrayLike, doses: ArrayLike, cutoff: float = 5) -> np.ndarray:
+    """
+    Active insulin from the previous dose using a piecewise decay over hours.
+
+    The dose is mostly active for the first hour (1 - 0.05h), decays linearly
+    until 3 hours (0.95 - 0.25(h - 1)) and exponentially after (0.45 * exp(-(h - 3))).
+
+    Args:
+        hours: Hours since the previous dose
+        doses: Previous insulin doses
+        cutoff: Hours after which no insulin is active
+
+    Returns:
+        Array of active insulin values
+    """
+    hours = _as_float_array(hours)
+
+    with np.errstate(over='ignore', invalid='ignore'):
+        factor = np.select(
+            [hours <= 1, hours <= 3],
+            [1.0 - 0.05 * hours, 0.95 - 0.25 * (hours - 1)],
+            0.45 * np.exp(-(hours - 3))
+        )
+
+    factor = np.where(np.isnan(hours) | (hours >= cutoff), 0.0, factor)
+    return scaled_activity(doses, factor)
+
+def activity_kernel(curve: Callable, duration: float, step: float = ACTIVITY_GRID_MINUTES) -> np.ndarray:
+    """
+    Sample an activity curve on the event grid, up to the end of its duration.
+
+    Events are placed on the grid step at or after their time and queries on the step
+    at or before theirs, so grid lag k stands for (k + 1) steps on average; the curve
+    is sampled there.
+
+    Args:
+        curve: insulin_activity or carb_activity
+        duration: Duration of action in minutes
+        step: Grid step in minutes
+
+    Returns:
+        Activity per grid lag
+    """
+    return curve(np.arange(step, duration, step), cutoff=duration)
+
+def on_board_kernel(curve: Callable, duration: float, step: float = ACTIVITY_GRID_MINUTES) -> np.ndarray:
+    """
+    Fraction of an event still to act per grid lag: one minus the normalized cumulative activity.
+
+    Args:
+        curve: insulin_activity or carb_activity
+        duration: Duration of action in minutes
+        step: Grid step in minutes
+
+    Returns:
+        Remaining fraction per grid lag (sampled like activity_kernel)
+    """
+    activity = curve(np.arange(0, duration, step), cutoff=duration)
+    return 1 - np.cumsum(activity)[1:] / activity.sum()
+
+INSULIN_ACTIVITY_KERNEL = activity_kernel(insulin_activity, INSULIN_ACTION_MINUTES)
+INSULIN_ON_BOARD_KERNEL = on_board_kernel(insulin_activity, INSULIN_ACTION_MINUTES)
+CARB_ACTIVITY_KERNEL = activity_kernel(carb_activity, CARB_ABSORPTION_MINUTES)
+CARBS_ON_BOARD_KERNEL = on_board_kernel(carb_activity, CARB_ABSORPTION_MINUTES)
+
+def convolve_events(impulses: np.ndarray, kernel: np.ndarray) -> np.ndarray:
+    """
+    Convolve event impulses on a grid with a response kernel.
+
+    The sum at each step only involves the kernel taps and the impulses within the
+    kernel's reach, always added in the same order, so the result at a step does not
+    depend on how long the grid is.
+
+    Args:
+        impulses: Event amounts at their grid step; the last axis is time
+        kernel: Response per grid step after an event
+
+    Returns:
+        Array of the summed responses, same shape as impulses
+    """
+    response = np.zeros_like(impulses)
+    steps = impulses.shape[-1]
+
+    # One vectorized pass per kernel tap, over all steps (and rows) at once
+    for lag, weight in enumerate(kernel[:steps]):
+        if weight != 0:
+            response[..., lag:] += weight * impulses[..., :steps - lag]
+
+    return response
+
+def events_on_board(event_seconds: ArrayLike, amounts: ArrayLike, query_seconds: ArrayLike,
+                    kernel: np.ndarray, exclusive: bool = False) -> np.ndarray:
+    """
+    Sum the kernel response of every prior event at each query time.
+
+    Events are placed on the grid step at or after their time and queries on the step
+    at or before theirs, so an event never counts before it happened. The cost is one
+    convolution over the grid steps within the kernel's reach of an event or query,
+    rather than one curve per event and query.
+
+    Args:
+        event_seconds: Event times in epoch seconds, ascending
+        amounts: Insulin doses or carb amounts (missing amounts count as 0)
+        query_seconds: Times to evaluate, in epoch seconds
+        kernel: Response per grid step, e.g. INSULIN_ON_BOARD_KERNEL
+        exclusive: Leave out events at the query time itself (e.g. the dose being evaluated)
+
+    Returns:
+        Array with the summed response at each query time
+    """
+    step = ACTIVITY_GRID_MINUTES * 60
+    event_seconds = np.asarray(event_seconds, dtype=np.int64)
+    query_seconds = np.asarray(query_seconds, dtype=np.int64)
+    amounts = np.nan_to_num(_as_float_array(amounts))
+
+    if len(query_seconds) == 0 or len(event_seconds) == 0:
+        return np.zeros(len(query_seconds))
+
+    event_steps = -(-event_seconds // step)
+    query_steps = -(-query_seconds // step) - 1 if exclusive else query_seconds // step
+
+    # Shrink gaps longer than the kernel between event and query steps: no event reaches
+    # a query across them, and every shorter lag is kept, so the grid stays small
+    steps = np.union1d(event_steps, query_steps)
+    positions = np.cumsum(np.minimum(np.diff(steps, prepend=steps[0]), len(kernel)))
+    event_positions = positions[np.searchsorted(steps, event_steps)]
+    query_positions = positions[np.searchsorted(steps, query_steps)]
+
+    impulses = np.bincount(event_positions, weights=amounts, minlength=positions[-1] + 1)
+    return convolve_events(impulses, kernel)[query_positions]
@@ -33,8 +33,10 @@
 # Enhanced Flask API for diabetes tracking system
 
 import os
+import gc
 import sys
 import time
+import signal
 import json
 import logging
 import traceback
@@ -47,6 +49,8 @@ from flask_cors import CORS
 # Import custom modules
 from insulin_prediction import InsulinPredictionModel
 from glucose_prediction_model import GlucosePredictionModel
+from compiled_pipeline import INFERENCE_BLAS_THREADS, limit_inference_threads
+from model_registry import ModelRegistry
 
 # Configure logging
 logging.basicConfig(
@@ -70,32 +74,56 @@ GLUCOSE_MODEL_60MIN_PATH = os.path.join(MODELS_DIR, 'glucose_model_60min.joblib'
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 
-# Initialize models
-insulin_model = InsulinPredictionModel(model_path=INSULIN_MODEL_PATH)
-glucose_model_30min = GlucosePredictionModel(model_path=GLUCOSE_MODEL_30MIN_PATH, prediction_horizon=30)
-glucose_model_60min = GlucosePredictionModel(model_path=GLUCOSE_MODEL_60MIN_PATH, prediction_horizon=60)
+# Limit BLAS/OpenMP threads per server process; large prediction batches still fan out
+# over INFERENCE_N_JOBS workers (see compiled_pipeline.py)
+limit_inference_threads(INFERENCE_BLAS_THREADS)
 
-# Load models
-try:
-    insulin_model_loaded = insulin_model.load_model()
-    logger.info(f"Insulin model loaded: {insulin_model_loaded}")
-except Exception as e:
-    logger.error(f"Error loading insulin model: {str(e)}")
-    insulin_model_loaded = False
+# Seconds a prediction request waits for its model to finish loading before answering 503
+MODEL_READY_TIMEOUT = float(os.environ.get('MODEL_READY_TIMEOUT', 30))
 
-try:
-    glucose_model_30min_loaded = glucose_model_30min.load_model()
-    logger.info(f"30-min glucose model loaded: {glucose_model_30min_loaded}")
-except Exception as e:
-    logger.error(f"Error loading 30-min glucose model: {str(e)}")
-    glucose_model_30min_loaded = False
+# Process start, for the uptime reported by the health check
+STARTED_AT = time.monotonic()
 
-try:
-    glucose_model_60min_loaded = glucose_model_60min.load_model()
-    logger.info(f"60-min glucose model loaded: {glucose_model_60min_loaded}")
-except Exception as e:
-    logger.error(f"Error loading 60-min glucose model: {str(e)}")
-    glucose_model_60min_loaded = False
+# Synthetic requests predicted by every model version before it is served, so no real request is cold
+WARMUP_REQUESTS = {
+    'insulin_model': {'blood_glucose': 180, 'carb_intake': 45, 'exercise_time': 0, 'weight': 70,
+                      'current_insulin_dosage': 0},
+    'glucose_model': {'current_glucose': 140, 'insulin_dose': 2, 'carb_intake': 30,
+                      'exercise_duration': 0, 'exercise_intensity': 2}
+}
+
+# Models are loaded in the background and hot-reloaded when their artifacts change
+# (see model_registry.py); requests read the current version with model_registry.get
+model_registry = ModelRegistry()
+model_registry.register('insulin_model', 'Insulin model',
+                        lambda path: InsulinPredictionModel(model_path=path),
+                        INSULIN_MODEL_PATH, WARMUP_REQUESTS['insulin_model'])
+model_registry.register('glucose_model_30min', '30-min glucose model',
+                        lambda path: GlucosePredictionModel(model_path=path, prediction_horizon=30),
+                        GLUCOSE_MODEL_30MIN_PATH, WARMUP_REQUESTS['glucose_model'])
+model_registry.register('glucose_model_60min', '60-min glucose model',
+                        lambda path: GlucosePredictionModel(model_path=path, prediction_horizon=60),
+                        GLUCOSE_MODEL_60MIN_PATH, WARMUP_REQUESTS['glucose_model'])
+
+def start_model_loading() -> None:
+    """Start loading the models in the background and polling for new versions (once per process)."""
+    model_registry.start()
+
+def model_loading_response(name: str) -> Response:
+    """503 response for a request whose model has not finished loading."""
+    response = jsonify({
+        'error': 'Model is still loading',
+        'model': name,
+        'status': model_registry.entries[name].status()
+    })
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
+
+@app.before_request
+def ensure_model_loading() -> None:
+    """Start background model loading on the first request, when the server did not start it."""
+    start_model_loading()
 
 @app.before_request
 def log_request_info() -> None:
@@ -121,15 +149,15 @@ def home() -> Response:
         'timestamp': datetime.now().isoformat(),
         'models': {
             'insulin_model': {
-                'loaded': insulin_model_loaded,
+                'loaded': model_registry.entries['insulin_model'].loaded,
                 'path': INSULIN_MODEL_PATH
             },
             'glucose_model_30min': {
-                'loaded': glucose_model_30min_loaded,
+                'loaded': model_registry.entries['glucose_model_30min'].loaded,
                 'path': GLUCOSE_MODEL_30MIN_PATH
             },
             'glucose_model_60min': {
-                'loaded': glucose_model_60min_loaded,
+                'loaded': model_registry.entries['glucose_model_60min'].loaded,
                 'path': GLUCOSE_MODEL_60MIN_PATH
             }
         }
@@ -140,14 +168,20 @@ def health_check() -> Response:
     """Health check endpoint for monitoring."""
     return jsonify({
         'status': 'healthy',
-        'uptime': time.time(),
-        'models': {
-            'insulin_model': insulin_model_loaded,
-            'glucose_model_30min': glucose_model_30min_loaded,
-            'glucose_model_60min': glucose_model_60min_loaded
-        }
+        'uptime': round(time.monotonic() - STARTED_AT, 3),
+        'ready': model_registry.is_ready(),
+        'models': model_registry.status()
     })
 
+@app.route('/api/ready', methods=['GET'])
+def readiness_check() -> Response:
+    """Readiness endpoint for load balancers: 503 until every model is loaded and warmed up."""
+    ready = model_registry.is_ready()
+    return jsonify({
+        'ready': ready,
+        'models': model_registry.status()
+    }), 200 if ready else 503
+
 @app.route('/api/predict-insulin', methods=['POST'])
 def predict_insulin() -> Response:
     """
@@ -208,7 +242,11 @@ def predict_insulin() -> Response:
             **additional_params
         }
         
-        prediction_result = insulin_model.predict(**prediction_args)
+        # Wait for the model rather than answering with the fallback while it loads
+        if not model_registry.entries['insulin_model'].ready.wait(MODEL_READY_TIMEOUT):
+            return model_loading_response('insulin_model')
+        
+        prediction_result = model_registry.get('insulin_model').predict(**prediction_args)
         
         # Add timing information
         elapsed_time = time.time() - start_time
@@ -237,6 +275,8 @@ def predict_glucose() -> Response:
     - exerciseDuration: Exercise duration (minutes)
     - exerciseIntensity: Exercise intensity (1-3)
     - predictionHorizon: Prediction horizon in minutes (30 or 60)
+    - Optional: insulin_history and carb_history, lists of [minutes ago, amount] pairs
+      for every recent dose and meal (active and on-board amounts add up across them)
     - Optional: Additional parameters for more accurate prediction
     
     Returns:
@@ -283,10 +323,12 @@ def predict_glucose() -> Response:
                                         'exerciseDuration', 'exerciseIntensity', 'predictionHorizon']}
         
         # Select the appropriate model based on prediction horizon
-        if prediction_horizon == 30:
-            model = glucose_model_30min
-        else:
-            model = glucose_model_60min
+        model_name = 'glucose_model_30min' if prediction_horizon == 30 else 'glucose_model_60min'
+        
+        # Wait for the model rather than answering with the fallback while it loads
+        if not model_registry.entries[model_name].ready.wait(MODEL_READY_TIMEOUT):
+            return model_loading_response(model_name)
+        model = model_registry.get(model_name)
         
         # Make prediction
         prediction_args = {
@@ -325,50 +367,36 @@ def model_info() -> Response:
     if model_type in ['all', 'insulin']:
         # Insulin model info
         info['insulin_model'] = {
-            'loaded': insulin_model_loaded,
+            'loaded': model_registry.entries['insulin_model'].loaded,
+            'version': model_registry.entries['insulin_model'].version,
             'type': 'Gradient Boosting Regressor',
-            'features': [
-                'blood_glucose', 'carb_intake', 'exercise_time', 'weight',
-                'insulin_sensitivity_factor', 'insulin_to_carb_ratio',
-                'previous_insulin_dose', 'hours_since_last_insulin',
-                'is_morning', 'is_afternoon', 'is_evening', 'is_night',
-                'is_weekend', 'is_correction_dose'
-            ],
+            'features': model_registry.get('insulin_model').get_input_features(),
             'path': INSULIN_MODEL_PATH,
+            'inference': model_registry.get('insulin_model').get_inference_path(),
             'prediction_type': 'regression'
         }
     
     if model_type in ['all', 'glucose']:
         # Glucose model info (30 min)
         info['glucose_model_30min'] = {
-            'loaded': glucose_model_30min_loaded,
+            'loaded': model_registry.entries['glucose_model_30min'].loaded,
+            'version': model_registry.entries['glucose_model_30min'].version,
             'type': 'Random Forest Regressor',
-            'features': [
-                'current_glucose', 'recent_insulin_dose', 'recent_carb_intake',
-                'recent_exercise_intensity', 'recent_exercise_duration',
-                'minutes_since_insulin', 'minutes_since_carbs', 'minutes_since_exercise',
-                'glucose_lag_1', 'glucose_lag_2', 'glucose_lag_3',
-                'glucose_velocity', 'glucose_rolling_mean', 'glucose_rolling_std',
-                'hour', 'is_morning', 'is_afternoon', 'is_evening', 'is_night'
-            ],
+            'features': model_registry.get('glucose_model_30min').get_input_features(),
             'path': GLUCOSE_MODEL_30MIN_PATH,
+            'inference': model_registry.get('glucose_model_30min').get_inference_path(),
             'prediction_horizon': 30,
             'prediction_type': 'regression'
         }
         
         # Glucose model info (60 min)
         info['glucose_model_60min'] = {
-            'loaded': glucose_model_60min_loaded,
+            'loaded': model_registry.entries['glucose_model_60min'].loaded,
+            'version': model_registry.entries['glucose_model_60min'].version,
             'type': 'Random Forest Regressor',
-            'features': [
-                'current_glucose', 'recent_insulin_dose', 'recent_carb_intake',
-                'recent_exercise_intensity', 'recent_exercise_duration',
-                'minutes_since_insulin', 'minutes_since_carbs', 'minutes_since_exercise',
-                'glucose_lag_1', 'glucose_lag_2', 'glucose_lag_3',
-                'glucose_velocity', 'glucose_rolling_mean', 'glucose_rolling_std',
-                'hour', 'is_morning', 'is_afternoon', 'is_evening', 'is_night'
-            ],
+            'features': model_registry.get('glucose_model_60min').get_input_features(),
             'path': GLUCOSE_MODEL_60MIN_PATH,
+            'inference': model_registry.get('glucose_model_60min').get_inference_path(),
             'prediction_horizon': 60,
             'prediction_type': 'regression'
         }
@@ -400,18 +428,65 @@ def internal_server_error(error) -> Response:
         'message': 'An internal server error occurred'
     }), 500
 
+def serve(host: str = '0.0.0.0', port: int = 5002, workers: int = 1) -> None:
+    """
+    Run the API server, optionally as preforked worker processes sharing the models.
+    
+    The models load concurrently in the background. With one process the server accepts
+    requests meanwhile (see /api/ready); with several, loading finishes before any worker
+    is forked, so the workers share the models' memory pages copy-on-write. With
+    SHARED_MODEL_LOADING the forests are memory-mapped lite artifacts shared through the
+    page cache as well. Every process hot-reloads new artifact versions on its own.
+    
+    Args:
+        host: Interface to listen on
+        port: Port to listen on
+        workers: Number of worker processes accepting on the shared socket
+    """
+    if workers <= 1:
+        start_model_loading()
+        app.run(host=host, port=port, debug=False)
+        return
+    
+    # Loader and poller threads do not survive a fork: finish loading first, and let
+    # every worker poll for new versions itself
+    model_registry.wait()
+    
+    from werkzeug.serving import make_server
+    
+    server = make_server(host, port, app, threaded=True)
+    
+    # Keep the loaded objects out of garbage collection passes, which would touch
+    # (and so copy) the pages holding them in every worker
+    gc.freeze()
+    
+    children = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                model_registry.start_polling()
+                server.serve_forever()
+            finally:
+                os._exit(0)
+        children.append(pid)
+    
+    logger.info(f"Started {workers} API workers on port {port}: {children}")
+    server.socket.close()
+    
+    try:
+        for pid in children:
+            os.waitpid(pid, 0)
+    except KeyboardInterrupt:
+        for pid in children:
+            os.kill(pid, signal.SIGTERM)
+
 if __name__ == '__main__':
-    # Get port from environment or use default
+    # Get port and worker processes from environment or use defaults
     port = int(os.environ.get('PORT', 5002))
-    
-    # Check if models are loaded
-    if not insulin_model_loaded:
-        logger.warning("Insulin model not loaded. API will use fallback calculation.")
-        
-    if not glucose_model_30min_loaded or not glucose_model_60min_loaded:
-        logger.warning("One or more glucose models not loaded. API will use fallback calculation.")
+    workers = int(os.environ.get('API_WORKERS', 1))
     
     logger.info(f"Starting API server on port {port}")
     
     # Run Flask app
-    app.run(host='0.0.0.0', port=port, debug=False)
\ No newline at end of file
+    serve(port=port, workers=workers)
\ No newline at end of file
@@ -0,0 +1,557 @@
+# benchmark.py
+# Script to benchmark feature engineering stages on the raw CSV exports, single-row model inference
+# and per-worker memory of forked model servers
+
+import os
+import glob
+import time
+import logging
+import numpy as np
+import pandas as pd
+from datetime import timedelta
+from typing import Callable, Dict, List
+
+from feature_engineering import DiabetesDataProcessor, CGM_MAX_GAP_MINUTES
+from activity_curves import ACTIVITY_GRID_MINUTES, INSULIN_ON_BOARD_KERNEL, events_on_board
+from glucose_trends import (TREND_WINDOW_MINUTES, TREND_EWMA_HALF_LIVES, TREND_WINDOW_MARGIN_MINUTES,
+                            glucose_trend_features)
+from glucose_prediction_model import GlucosePredictionModel, MODEL_PATH as GLUCOSE_MODEL_PATH
+from insulin_prediction import InsulinPredictionModel, MODEL_PATH as INSULIN_MODEL_PATH
+
+# Define paths
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+RAW_DATA_DIR = os.path.join(BASE_DIR, 'data', 'raw')
+
+# Private memory a forked API worker may add when the models are shared (see benchmark_worker_memory)
+WORKER_MEMORY_LIMIT_MB = 5
+
+def time_call(func: Callable, repeat: int = 3) -> float:
+    """
+    Time a function call, returning the best of several runs.
+
+    Args:
+        func: Zero-argument callable to time
+        repeat: Number of runs
+
+    Returns:
+        Best wall-clock time in seconds
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def time_calls(func: Callable, calls: int = 1000) -> np.ndarray:
+    """
+    Time each of many calls of a function, after one warm-up call.
+
+    Args:
+        func: Zero-argument callable to time
+        calls: Number of timed calls
+
+    Returns:
+        Array of per-call wall-clock times in seconds
+    """
+    func()
+    times = np.empty(calls)
+    for index in range(calls):
+        start = time.perf_counter()
+        func()
+        times[index] = time.perf_counter() - start
+    return times
+
+def load_insulin_events(processor: DiabetesDataProcessor, file_paths: List[str], scale: int = 1) -> pd.DataFrame:
+    """
+    Load insulin dose events from raw CSV files.
+
+    The raw exports store bolus timestamps in the first ts_begin* column of
+    the dose block, so that column is used as the dose timestamp here.
+
+    Args:
+        processor: Data processor used for timestamp parsing
+        file_paths: Paths to raw CSV files
+        scale: Number of times to repeat the dose history back to back
+
+    Returns:
+        DataFrame with sorted timestamp and dose columns
+    """
+    events = []
+
+    for file_path in file_paths:
+        df = pd.read_csv(file_path, low_memory=False)
+        doses = df[df['dose'].notna()]
+
+        # Dose timestamps live in the ts_begin* column populated for dose rows
+        ts_cols = [col for col in doses.columns if col.startswith('ts_begin') and doses[col].notna().any()]
+        if not ts_cols:
+            continue
+
+        timestamps = processor.parse_datetime_column(doses[ts_cols[0]])
+        events.append(pd.DataFrame({'timestamp': timestamps, 'dose': doses['dose']}).dropna())
+
+    if not events:
+        return pd.DataFrame(columns=['timestamp', 'dose'])
+
+    base = pd.concat(events, ignore_index=True).sort_values('timestamp')
+    span = base['timestamp'].max() - base['timestamp'].min() + timedelta(days=1)
+
+    # Repeat the history to emulate longer exports
+    copies = [base.assign(timestamp=base['timestamp'] + span * i) for i in range(scale)]
+    insulin_df = pd.concat(copies, ignore_index=True).sort_values('timestamp').reset_index(drop=True)
+
+    insulin_df['hours_since_last_insulin'] = insulin_df['timestamp'].diff().dt.total_seconds() / 3600
+    insulin_df['hours_since_last_insulin'] = insulin_df['hours_since_last_insulin'].fillna(8)
+    insulin_df['previous_insulin_dose'] = insulin_df['dose'].shift(1).fillna(0)
+
+    return insulin_df
+
+def legacy_total_insulin_past_24h(insulin_df: pd.DataFrame) -> List[float]:
+    """Per-row 24h insulin totals as computed before the rolling-window engine."""
+    daily_totals = []
+
+    for i, row in insulin_df.iterrows():
+        current_time = row['timestamp']
+        past_24h = current_time - timedelta(hours=24)
+
+        past_doses = insulin_df[
+            (insulin_df['timestamp'] < current_time) &
+            (insulin_df['timestamp'] >= past_24h)
+        ]
+
+        daily_totals.append(past_doses['dose'].sum() if not past_doses.empty else 0)
+
+    return daily_totals
+
+def looped_insulin_on_board(seconds: np.ndarray, doses: np.ndarray) -> np.ndarray:
+    """Per-dose insulin on board from every earlier dose, one pass over all doses per dose."""
+    step = ACTIVITY_GRID_MINUTES * 60
+    event_steps = -(-seconds // step)
+    query_steps = event_steps - 1
+    iob = np.zeros(len(seconds))
+    
+    for i in range(len(seconds)):
+        lags = query_steps[i] - event_steps
+        active = (lags >= 0) & (lags < len(INSULIN_ON_BOARD_KERNEL))
+        iob[i] = np.sum(doses[active] * INSULIN_ON_BOARD_KERNEL[lags[active]])
+    
+    return iob
+
+def benchmark_insulin_history(file_paths: List[str], scale: int = 1, repeat: int = 3) -> Dict[str, float]:
+    """
+    Benchmark 24h insulin totals and insulin on board, loops vs vectorized.
+
+    Args:
+        file_paths: Paths to raw CSV files
+        scale: Number of times to repeat the dose history
+        repeat: Number of timing runs
+
+    Returns:
+        Dictionary with timings in seconds
+    """
+    processor = DiabetesDataProcessor(output_dir=os.path.join(BASE_DIR, 'data', 'processed'))
+    insulin_df = load_insulin_events(processor, file_paths, scale)
+
+    if insulin_df.empty:
+        print("No insulin events found")
+        return {}
+
+    # Check both implementations agree before timing them
+    legacy_totals = np.asarray(legacy_total_insulin_past_24h(insulin_df), dtype=float)
+    vector_totals = processor._rolling_dose_total(insulin_df['timestamp'], insulin_df['dose'])
+    np.testing.assert_allclose(vector_totals, legacy_totals, rtol=1e-9, atol=1e-9)
+
+    seconds = processor._epoch_seconds(insulin_df['timestamp'])
+    doses = insulin_df['dose'].to_numpy(dtype=np.float64)
+    convolved_iob = lambda: events_on_board(seconds, doses, seconds, INSULIN_ON_BOARD_KERNEL, exclusive=True)
+    np.testing.assert_allclose(convolved_iob(), looped_insulin_on_board(seconds, doses), rtol=1e-9, atol=1e-9)
+
+    results = {
+        'doses': len(insulin_df),
+        'legacy_24h_total': time_call(lambda: legacy_total_insulin_past_24h(insulin_df), repeat),
+        'rolling_24h_total': time_call(
+            lambda: processor._rolling_dose_total(insulin_df['timestamp'], insulin_df['dose']), repeat
+        ),
+        'looped_iob': time_call(lambda: looped_insulin_on_board(seconds, doses), repeat),
+        'convolved_iob': time_call(convolved_iob, repeat)
+    }
+
+    print(f"\n=== Insulin History Benchmark ({results['doses']} doses) ===")
+    print(f"24h total:  legacy {results['legacy_24h_total'] * 1000:.1f} ms, "
+          f"rolling {results['rolling_24h_total'] * 1000:.1f} ms "
+          f"({results['legacy_24h_total'] / results['rolling_24h_total']:.0f}x)")
+    print(f"IOB:        looped {results['looped_iob'] * 1000:.1f} ms, "
+          f"convolved {results['convolved_iob'] * 1000:.1f} ms "
+          f"({results['looped_iob'] / results['convolved_iob']:.0f}x)")
+    print("===============================\n")
+
+    return results
+
+def benchmark_timestamp_parsing(file_paths: List[str], scale: int = 1, repeat: int = 3) -> Dict[str, float]:
+    """
+    Benchmark per-value timestamp parsing against the column-level parser.
+
+    Args:
+        file_paths: Paths to raw CSV files
+        scale: Number of times to repeat the timestamp columns
+        repeat: Number of timing runs
+
+    Returns:
+        Dictionary with timings in seconds
+    """
+    processor = DiabetesDataProcessor(output_dir=os.path.join(BASE_DIR, 'data', 'processed'))
+
+    # Collect every timestamp column of the raw exports into one string column
+    columns = []
+    for file_path in file_paths:
+        df = pd.read_csv(file_path, low_memory=False)
+        ts_cols = [col for col in df.columns if col.startswith(('ts', 'tbegin', 'tend'))]
+        columns.extend(df[col].dropna() for col in ts_cols)
+
+    if not columns:
+        print("No timestamp columns found")
+        return {}
+
+    values = pd.concat(columns * scale, ignore_index=True)
+
+    legacy = values.apply(processor.parse_datetime)
+    vectorized = processor.parse_datetime_column(values)
+    pd.testing.assert_series_equal(vectorized, legacy.astype('datetime64[ns]'), check_names=False)
+
+    results = {
+        'values': len(values),
+        'legacy_parse': time_call(lambda: values.apply(processor.parse_datetime), repeat),
+        'column_parse': time_call(lambda: processor.parse_datetime_column(values), repeat)
+    }
+
+    print(f"\n=== Timestamp Parsing Benchmark ({results['values']} values) ===")
+    print(f"Parse:      legacy {results['legacy_parse'] * 1000:.1f} ms, "
+          f"column {results['column_parse'] * 1000:.1f} ms "
+          f"({results['legacy_parse'] / results['column_parse']:.0f}x)")
+    print("===============================\n")
+
+    return results
+
+def legacy_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """Rebuild a frame with the dtypes used before the compact dtype policy."""
+    legacy = {}
+
+    for column in df.columns:
+        series = df[column]
+        if column == 'timestamp_epoch':
+            legacy['timestamp_str'] = pd.to_datetime(series, unit='s').dt.strftime('%Y-%m-%d %H:%M:%S')
+        elif isinstance(series.dtype, pd.CategoricalDtype):
+            legacy[column] = series.astype(series.cat.categories.dtype)
+        elif series.dtype == np.float32:
+            legacy[column] = series.astype(np.float64)
+        elif series.dtype in (np.int8, np.uint8):
+            legacy[column] = series.astype(np.int64)
+        else:
+            legacy[column] = series
+
+    return pd.DataFrame(legacy)
+
+def benchmark_dataset_memory(file_paths: List[str]) -> Dict[str, float]:
+    """
+    Compare training dataset memory under the compact dtype policy and the legacy dtypes.
+
+    Args:
+        file_paths: Paths to raw CSV files
+
+    Returns:
+        Dictionary with memory in bytes per dataset
+    """
+    processor = DiabetesDataProcessor(output_dir=os.path.join(BASE_DIR, 'data', 'processed'))
+    datasets = processor.create_training_datasets(*processor.process_csv_files(file_paths))
+
+    results = {}
+    print("\n=== Training Dataset Memory ===")
+    for name, df in datasets.items():
+        compact = processor.memory_report(df)['bytes'].sum()
+        legacy = processor.memory_report(legacy_dtypes(df))['bytes'].sum()
+        results[f'{name}_compact'] = compact
+        results[f'{name}_legacy'] = legacy
+
+        print(f"{name.capitalize():<11} {len(df)} rows: legacy {legacy / 1024 ** 2:.2f} MB, "
+              f"compact {compact / 1024 ** 2:.2f} MB ({legacy / compact:.1f}x)")
+        print(processor.memory_report(df).head(5).to_string())
+    print("===============================\n")
+
+    return results
+
+def rolling_trend_features(glucose_df: pd.DataFrame) -> Dict[str, np.ndarray]:
+    """Trend features with one pandas time-based rolling call per window and statistic."""
+    features = {}
+    
+    for _, patient in glucose_df.groupby('patient_id', observed=True, sort=False):
+        series = patient.set_index('timestamp')['value'].astype(np.float64)
+        for window in TREND_WINDOW_MINUTES:
+            rolling = series.rolling(f'{window - TREND_WINDOW_MARGIN_MINUTES}min')
+            for stat in ['mean', 'std', 'min', 'max']:
+                features.setdefault(f'glucose_{stat}_{window}min', []).append(getattr(rolling, stat)().to_numpy())
+        for half_life in TREND_EWMA_HALF_LIVES:
+            ewma = series.ewm(halflife=f'{half_life}min', times=series.index).mean()
+            features.setdefault(f'glucose_ewma_{half_life}min', []).append(ewma.to_numpy())
+    
+    return {name: np.concatenate(parts) for name, parts in features.items()}
+
+def one_pass_trend_features(processor: DiabetesDataProcessor, glucose_df: pd.DataFrame) -> Dict[str, np.ndarray]:
+    """Trend features from the one-pass stage, split into segments at sensor gaps."""
+    features = {}
+    
+    for _, patient in glucose_df.groupby('patient_id', observed=True, sort=False):
+        seconds = processor._epoch_seconds(patient['timestamp'])
+        segments = np.cumsum(np.diff(seconds, prepend=seconds[0]) > CGM_MAX_GAP_MINUTES * 60)
+        for name, values in glucose_trend_features(seconds, patient['value'], segments).items():
+            features.setdefault(name, []).append(values)
+    
+    return {name: np.concatenate(parts) for name, parts in features.items()}
+
+def benchmark_trend_features(file_paths: List[str], repeat: int = 3) -> Dict[str, float]:
+    """
+    Benchmark the one-pass trend features against per-window pandas rolling calls.
+    
+    Args:
+        file_paths: Paths to raw CSV files
+        repeat: Number of timing runs
+        
+    Returns:
+        Dictionary with timings in seconds
+    """
+    processor = DiabetesDataProcessor(output_dir=os.path.join(BASE_DIR, 'data', 'processed'))
+    glucose_df, _ = processor.process_csv_files(file_paths)
+    
+    if glucose_df.empty:
+        print("No glucose readings found")
+        return {}
+    
+    glucose_df = glucose_df.sort_values(['patient_id', 'timestamp'], kind='stable').reset_index(drop=True)
+    
+    # The rolling calls do not stop at sensor gaps, so compare readings whose longest
+    # window lies within one gap-free stretch
+    one_pass = one_pass_trend_features(processor, glucose_df)
+    reference = rolling_trend_features(glucose_df)
+    gap = glucose_df.groupby('patient_id', observed=True)['timestamp'].diff() > timedelta(minutes=CGM_MAX_GAP_MINUTES)
+    stretch_start = glucose_df['timestamp'].where(gap | glucose_df['patient_id'].ne(glucose_df['patient_id'].shift()))
+    stretch_start = stretch_start.ffill()
+    comparable = (glucose_df['timestamp'] - stretch_start >= timedelta(minutes=max(TREND_WINDOW_MINUTES))).to_numpy()
+    for window in TREND_WINDOW_MINUTES:
+        for stat in ['mean', 'std', 'min', 'max']:
+            name = f'glucose_{stat}_{window}min'
+            np.testing.assert_allclose(one_pass[name][comparable], reference[name][comparable], rtol=1e-9)
+    
+    results = {
+        'readings': len(glucose_df),
+        'rolling_calls': time_call(lambda: rolling_trend_features(glucose_df), repeat),
+        'one_pass': time_call(lambda: one_pass_trend_features(processor, glucose_df), repeat)
+    }
+    
+    print(f"\n=== Trend Feature Benchmark ({results['readings']} readings) ===")
+    print(f"Trends:     rolling {results['rolling_calls'] * 1000:.1f} ms, "
+          f"one pass {results['one_pass'] * 1000:.1f} ms "
+          f"({results['rolling_calls'] / results['one_pass']:.1f}x)")
+    print("===============================\n")
+    
+    return results
+
+def benchmark_single_row_inference(calls: int = 1000) -> Dict[str, Dict[str, float]]:
+    """
+    Benchmark per-call latency of single-request predictions through the fitted pipeline
+    (one-row DataFrame) against the compiled numpy path.
+    
+    Args:
+        calls: Number of timed calls per model and path
+        
+    Returns:
+        Dictionary with p50 and p99 latencies in seconds per model and path
+    """
+    glucose_model = GlucosePredictionModel()
+    insulin_model = InsulinPredictionModel()
+    requests = [
+        ('glucose', glucose_model, {'current_glucose': 160, 'recent_insulin_dose': 2, 'recent_carb_intake': 45,
+                                    'recent_exercise_duration': 20, 'recent_exercise_intensity': 2}),
+        ('insulin', insulin_model, {'blood_glucose': 180, 'carb_intake': 60, 'exercise_time': 0})
+    ]
+    
+    results = {}
+    print("\n=== Single-Row Inference Benchmark ===")
+    for name, model, request in requests:
+        if not model.load_model():
+            print(f"{name.capitalize():<11} model not trained, skipped")
+            continue
+        if model.compiled is None:
+            print(f"{name.capitalize():<11} pipeline has no compiled path, skipped")
+            continue
+        
+        pipeline_call = lambda: model.pipeline.predict(model._input_frame(request))[0]
+        compiled_call = lambda: model._predict_request(request)
+        assert pipeline_call() == compiled_call()
+        
+        results[name] = {}
+        for path, func in [('pipeline', pipeline_call), ('compiled', compiled_call)]:
+            times = time_calls(func, calls)
+            results[name][path] = {'p50': np.percentile(times, 50), 'p99': np.percentile(times, 99)}
+        
+        pipeline, compiled = results[name]['pipeline'], results[name]['compiled']
+        print(f"{name.capitalize():<11} pipeline p50 {pipeline['p50'] * 1000:.2f} ms, p99 {pipeline['p99'] * 1000:.2f} ms; "
+              f"compiled p50 {compiled['p50'] * 1000:.2f} ms, p99 {compiled['p99'] * 1000:.2f} ms "
+              f"({pipeline['p50'] / compiled['p50']:.1f}x at p50)")
+    print("===============================\n")
+    
+    return results
+
+def private_memory_mb(pid: str = 'self') -> float:
+    """
+    Private (unshared) resident memory of a process in MB, from /proc/<pid>/smaps_rollup.
+    
+    Args:
+        pid: Process id, or 'self'
+        
+    Returns:
+        Private clean plus private dirty memory in MB
+    """
+    with open(f'/proc/{pid}/smaps_rollup') as file:
+        kilobytes = sum(int(line.split()[1]) for line in file
+                        if line.startswith(('Private_Clean:', 'Private_Dirty:')))
+    return kilobytes / 1024
+
+def benchmark_worker_memory(workers: int = 4, max_shared_growth_mb: float = WORKER_MEMORY_LIMIT_MB,
+                            glucose_model_path: str = GLUCOSE_MODEL_PATH,
+                            insulin_model_path: str = INSULIN_MODEL_PATH) -> Dict[str, Dict[str, float]]:
+    """
+    Benchmark how much private memory each forked server worker adds once it has loaded
+    the models and served a prediction, as API workers do, and check that sharing works.
+    
+    All workers of a mode run at the same time and are measured from the parent once
+    every one of them has served, so pages they map in common count as shared.
+    
+    Modes:
+        private: every worker unpickles the models itself
+        shared: every worker loads with shared_loading (memory-mapped lite artifacts)
+        preload: the parent loads the models before forking (copy-on-write)
+        preload-shared: the parent loads with shared_loading before forking
+    
+    Args:
+        workers: Number of workers forked per mode
+        max_shared_growth_mb: Largest private memory growth allowed per worker in the
+            shared and preload modes
+        glucose_model_path: Trained glucose model to serve (its lite artifact sits next to it)
+        insulin_model_path: Trained insulin model to serve
+        
+    Returns:
+        Dictionary with mean and max private memory growth in MB per worker, per mode
+        
+    Raises:
+        AssertionError: If a worker in a sharing mode grows by more than max_shared_growth_mb
+    """
+    import gc
+    
+    results = {}
+    print("\n=== Worker Memory Benchmark ===")
+    if not os.path.exists('/proc/self/smaps_rollup') or not hasattr(os, 'fork'):
+        print("Needs fork and /proc/<pid>/smaps_rollup, skipped")
+        print("===============================\n")
+        return results
+    
+    requests = [
+        {'current_glucose': 160, 'recent_insulin_dose': 2, 'recent_carb_intake': 45,
+         'recent_exercise_duration': 20, 'recent_exercise_intensity': 2},
+        {'blood_glucose': 180, 'carb_intake': 60, 'exercise_time': 0}
+    ]
+    
+    def load_models(shared_loading: bool) -> List:
+        models = [GlucosePredictionModel(model_path=glucose_model_path, shared_loading=shared_loading),
+                  InsulinPredictionModel(model_path=insulin_model_path, shared_loading=shared_loading)]
+        for model in models:
+            if not model.load_model():
+                return []
+        return models
+    
+    def serve(models: List) -> None:
+        for model, request in zip(models, requests):
+            model._predict_request(request)
+    
+    if not load_models(False):
+        print("Models not trained, skipped")
+        print("===============================\n")
+        return results
+    
+    for mode in ['private', 'shared', 'preload', 'preload-shared']:
+        preloaded = load_models(mode == 'preload-shared') if mode.startswith('preload') else None
+        if preloaded:
+            serve(preloaded)
+        gc.collect()
+        gc.freeze()
+        
+        # Workers report their private memory right after the fork, then wait until released
+        release_read, release_write = os.pipe()
+        children = []
+        for _ in range(workers):
+            read_end, write_end = os.pipe()
+            pid = os.fork()
+            if pid == 0:
+                os.close(read_end)
+                os.close(release_write)
+                before = private_memory_mb()
+                models = preloaded or load_models(mode == 'shared')
+                serve(models)
+                os.write(write_end, f"{before}".encode())
+                os.close(write_end)
+                os.read(release_read, 1)
+                os._exit(0)
+            os.close(write_end)
+            children.append((pid, read_end))
+        os.close(release_read)
+        
+        baselines = []
+        for pid, read_end in children:
+            with os.fdopen(read_end) as pipe:
+                baselines.append(float(pipe.read()))
+        growths = [private_memory_mb(str(pid)) - before for (pid, _), before in zip(children, baselines)]
+        
+        os.close(release_write)
+        for pid, _ in children:
+            os.waitpid(pid, 0)
+        gc.unfreeze()
+        
+        results[mode] = {'mean': float(np.mean(growths)), 'max': float(np.max(growths))}
+        print(f"{mode:<15} {results[mode]['mean']:7.1f} MB private per worker (max {results[mode]['max']:.1f} MB)")
+    print("===============================\n")
+    
+    for mode in ['shared', 'preload', 'preload-shared']:
+        assert results[mode]['max'] <= max_shared_growth_mb, (
+            f"Workers in {mode} mode grew by up to {results[mode]['max']:.1f} MB each, "
+            f"more than {max_shared_growth_mb:g} MB: the models are not shared"
+        )
+    
+    return results
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark feature engineering stages and model inference')
+    parser.add_argument('--data-dir', type=str, default=RAW_DATA_DIR, help='Directory with raw CSV files')
+    parser.add_argument('--scale', type=int, default=1, help='Repeat event histories to emulate longer exports')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of timing runs per stage')
+    parser.add_argument('--calls', type=int, default=1000, help='Number of timed single-row predictions per model')
+    parser.add_argument('--workers', type=int, default=4, help='Number of forked workers per memory benchmark mode')
+    parser.add_argument('--max-worker-mb', type=float, default=WORKER_MEMORY_LIMIT_MB,
+                        help='Fail if a worker sharing the models adds more private memory (MB)')
+    parser.add_argument('--glucose-model', type=str, default=GLUCOSE_MODEL_PATH,
+                        help='Glucose model served by the worker memory benchmark')
+    parser.add_argument('--insulin-model', type=str, default=INSULIN_MODEL_PATH,
+                        help='Insulin model served by the worker memory benchmark')
+
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+
+    csv_files = sorted(glob.glob(os.path.join(args.data_dir, '*.csv')))
+
+    benchmark_timestamp_parsing(csv_files, args.scale, args.repeat)
+    benchmark_insulin_history(csv_files, args.scale, args.repeat)
+    benchmark_dataset_memory(csv_files)
+    benchmark_trend_features(csv_files, args.repeat)
+    benchmark_single_row_inference(args.calls)
+    benchmark_worker_memory(args.workers, args.max_worker_mb, args.glucose_model, args.insulin_model)
@@ -0,0 +1,188 @@
+# columnar_store.py
+# Columnar on-disk storage for DataFrames as typed .npy column files plus a JSON schema
+
+import os
+import json
+import shutil
+import hashlib
+import logging
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_FILE = 'schema.json'
+STORE_FORMAT_VERSION = 2
+
+def hash_file(file_path: str, chunk_size: int = 1 << 20) -> str:
+    """
+    Compute the SHA-256 hash of a file's contents.
+
+    Args:
+        file_path: Path to the file
+        chunk_size: Read size in bytes
+
+    Returns:
+        Hex digest of the file contents
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _column_file(directory: str, position: int, suffix: str = '') -> str:
+    """Path of the .npy file holding a column (or one of its parts)."""
+    return os.path.join(directory, f"col_{position:04d}{suffix}.npy")
+
+def save_frame(df: pd.DataFrame, directory: str) -> None:
+    """
+    Save a DataFrame as one .npy file per column plus a JSON schema.
+
+    The directory is written under a temporary name and renamed into place,
+    so readers never see a partially written frame.
+
+    Args:
+        df: DataFrame to save
+        directory: Target directory (replaced if it exists)
+
+    Raises:
+        TypeError: If a column has a dtype that cannot be stored
+    """
+    tmp_dir = f"{directory}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    try:
+        columns = []
+        for position, name in enumerate(df.columns):
+            columns.append(_save_column(df[name], tmp_dir, position))
+
+        index = df.index
+        if pd.api.types.is_integer_dtype(index.dtype) and not isinstance(index, pd.RangeIndex):
+            np.save(_column_file(tmp_dir, len(columns), '_index'), index.to_numpy(dtype=np.int64))
+            index_kind = 'int64'
+        else:
+            index_kind = 'range'
+
+        schema = {
+            'format_version': STORE_FORMAT_VERSION,
+            'rows': len(df),
+            'index': index_kind,
+            'columns': columns
+        }
+        with open(os.path.join(tmp_dir, SCHEMA_FILE), 'w') as f:
+            json.dump(schema, f, indent=2)
+
+        shutil.rmtree(directory, ignore_errors=True)
+        os.replace(tmp_dir, directory)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+def _save_column(series: pd.Series, directory: str, position: int) -> Dict:
+    """Write one column and return its schema entry."""
+    dtype = series.dtype
+    entry = {'name': series.name, 'dtype': str(dtype)}
+
+    if isinstance(dtype, pd.CategoricalDtype):
+        entry['kind'] = 'category'
+        entry['ordered'] = bool(dtype.ordered)
+        np.save(_column_file(directory, position), series.cat.codes.to_numpy())
+        categories = dtype.categories
+        if categories.dtype == object:
+            if not all(isinstance(value, str) for value in categories):
+                raise TypeError(f"Column '{series.name}' has non-string categories")
+            np.save(_column_file(directory, position, '_categories'), categories.to_numpy(dtype=str))
+        else:
+            np.save(_column_file(directory, position, '_categories'), categories.to_numpy())
+    elif pd.api.types.is_datetime64_dtype(dtype):
+        entry['kind'] = 'datetime'
+        np.save(_column_file(directory, position), series.to_numpy(dtype='datetime64[ns]').view(np.int64))
+    elif pd.api.types.is_extension_array_dtype(dtype) and (
+            pd.api.types.is_integer_dtype(dtype) or pd.api.types.is_float_dtype(dtype)
+            or pd.api.types.is_bool_dtype(dtype)):
+        # Nullable integer/float/boolean: values plus a null mask
+        entry['kind'] = 'masked'
+        mask = series.isna().to_numpy()
+        np.save(_column_file(directory, position), series.to_numpy(dtype=dtype.numpy_dtype, na_value=0))
+        np.save(_column_file(directory, position, '_mask'), mask)
+    elif dtype == object or pd.api.types.is_string_dtype(dtype):
+        # Strings are stored as codes into their distinct values, which keeps
+        # sparse and repetitive columns small and fast to encode
+        entry['kind'] = 'string'
+        codes, uniques = pd.factorize(series, use_na_sentinel=True)
+        if len(uniques) > 0 and pd.api.types.infer_dtype(uniques, skipna=True) != 'string':
+            raise TypeError(f"Column '{series.name}' has non-string objects")
+        # Keep the missing-value sentinel (the pyarrow CSV engine yields None, the C engine NaN)
+        missing = series.to_numpy(dtype=object)[codes < 0]
+        entry['null'] = 'none' if len(missing) > 0 and missing[0] is None else 'nan'
+        np.save(_column_file(directory, position), codes.astype(np.int32))
+        np.save(_column_file(directory, position, '_values'), np.array(list(uniques), dtype=str))
+    elif isinstance(dtype, np.dtype) and dtype.kind in 'biuf':
+        entry['kind'] = 'numpy'
+        np.save(_column_file(directory, position), series.to_numpy())
+    else:
+        raise TypeError(f"Column '{series.name}' has unsupported dtype {dtype}")
+
+    return entry
+
+def load_frame(directory: str, columns: Optional[List[str]] = None,
+               mmap: bool = False) -> pd.DataFrame:
+    """
+    Load a DataFrame saved with save_frame.
+
+    Args:
+        directory: Directory written by save_frame
+        columns: Subset of columns to load (default: all)
+        mmap: Memory-map plain numeric columns instead of reading them into memory
+
+    Returns:
+        Loaded DataFrame
+    """
+    with open(os.path.join(directory, SCHEMA_FILE)) as f:
+        schema = json.load(f)
+
+    if schema['format_version'] != STORE_FORMAT_VERSION:
+        raise ValueError(f"Unsupported columnar store version {schema['format_version']} in {directory}")
+
+    mmap_mode = 'r' if mmap else None
+    data = {}
+
+    for position, entry in enumerate(schema['columns']):
+        name = entry['name']
+        if columns is not None and name not in columns:
+            continue
+
+        path = _column_file(directory, position)
+        kind = entry['kind']
+
+        if kind == 'numpy':
+            data[name] = np.load(path, mmap_mode=mmap_mode)
+        elif kind == 'datetime':
+            data[name] = np.load(path).view('datetime64[ns]')
+        elif kind == 'category':
+            categories = np.load(_column_file(directory, position, '_categories'))
+            if categories.dtype.kind == 'U':
+                categories = categories.astype(object)
+            data[name] = pd.Categorical.from_codes(np.load(path), categories=categories,
+                                                   ordered=entry['ordered'])
+        elif kind == 'masked':
+            mask = np.load(_column_file(directory, position, '_mask'))
+            values = pd.array(np.load(path), dtype=entry['dtype'])
+            values[mask] = pd.NA
+            data[name] = values
+        elif kind == 'string':
+            # The missing value is appended last, where the -1 codes of missing rows point
+            uniques = np.load(_column_file(directory, position, '_values')).astype(object)
+            missing = None if entry['null'] == 'none' else np.nan
+            data[name] = np.append(uniques, missing)[np.load(path)]
+
+    if schema['index'] == 'int64':
+        index = pd.Index(np.load(_column_file(directory, len(schema['columns']), '_index')))
+    else:
+        index = pd.RangeIndex(schema['rows'])
+
+    # Columns are kept as separate blocks so memory-mapped arrays are not copied
+    return pd.DataFrame(data, index=index, copy=False)
@@ -0,0 +1,398 @@
+# compiled_pipeline.py
+# Precompiled numpy inference path and inference thread settings for the fitted scikit-learn model pipelines
+
+import os
+import copy
+import logging
+import numpy as np
+from typing import Dict, List, Optional
+
+# scikit-learn is imported only to compile a fitted pipeline: the compiled path itself
+# runs on numpy alone, which keeps the lite model runtime (lite_model.py) light to import
+
+logger = logging.getLogger(__name__)
+
+# Inference parallelism, independent of the n_jobs the estimators were trained (and pickled) with:
+# batches of at least INFERENCE_PARALLEL_MIN_ROWS rows fan out over INFERENCE_N_JOBS workers,
+# smaller ones run in the calling thread (for forests, on the flat evaluator, which is faster
+# than the per-tree traversal up to a few hundred rows)
+INFERENCE_N_JOBS = int(os.environ.get('INFERENCE_N_JOBS', -1))
+INFERENCE_PARALLEL_MIN_ROWS = int(os.environ.get('INFERENCE_PARALLEL_MIN_ROWS', 500))
+
+# Rows per block evaluated by the flat forest; keeps the (rows x trees) node arrays in cache
+FLAT_FOREST_BLOCK_ROWS = 256
+
+# Process-wide BLAS/OpenMP threads for serving; each API worker handles its own requests
+INFERENCE_BLAS_THREADS = int(os.environ.get('INFERENCE_BLAS_THREADS', 1))
+
+class FlatForest:
+    """
+    A fitted ensemble of regression trees flattened into contiguous node arrays.
+
+    All trees' nodes are concatenated into one set of arrays (feature index,
+    threshold, left and right child, leaf value), with each leaf pointing to itself.
+    Prediction starts every (row, tree) pair at its tree's root and advances all of
+    them one level per step, for as many steps as the deepest tree, with a handful of
+    array gathers per level instead of one tree traversal call per tree.
+
+    A prediction is (baseline + scale * leaf_1 + ... + scale * leaf_n) / divisor:
+    the mean of the leaves for a random forest, the initial estimate plus the
+    learning-rate-scaled leaves for gradient boosting.
+    """
+
+    def __init__(self, roots: np.ndarray, feature: np.ndarray, threshold: np.ndarray, children: np.ndarray,
+                 value: np.ndarray, depth: int, baseline: float = 0.0, scale: float = 1.0, divisor: float = 1.0):
+        """
+        Args:
+            roots: Root node of each tree
+            feature: Feature index compared at each node (0 at leaves)
+            threshold: Threshold at each node; rows go left when feature <= threshold
+            children: Left child at 2 * node, right child at 2 * node + 1 (leaves point to themselves)
+            value: Leaf value of each node
+            depth: Depth of the deepest tree
+            baseline: Initial estimate the leaves are added to
+            scale: Factor applied to every leaf value
+            divisor: Divisor of the sum
+        """
+        self.roots = roots
+        self.feature = feature
+        self.threshold = threshold
+        self.children = children
+        self.value = value
+        self.depth = int(depth)
+        self.baseline = float(baseline)
+        self.scale = float(scale)
+        self.divisor = float(divisor)
+
+    @classmethod
+    def from_trees(cls, trees: List, **params) -> 'FlatForest':
+        """
+        Flatten fitted single-output trees.
+
+        Args:
+            trees: Fitted scikit-learn Tree objects (estimator.tree_), in ensemble order
+            **params: baseline, scale and divisor
+
+        Returns:
+            FlatForest
+        """
+        sizes = np.array([tree.node_count for tree in trees])
+        offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+        nodes = np.arange(sizes.sum())
+
+        left = np.concatenate([tree.children_left + offset for tree, offset in zip(trees, offsets)])
+        right = np.concatenate([tree.children_right + offset for tree, offset in zip(trees, offsets)])
+        feature = np.concatenate([tree.feature for tree in trees])
+        leaf = np.concatenate([tree.children_left for tree in trees]) < 0
+
+        return cls(
+            roots=offsets.astype(np.intp),
+            feature=np.where(leaf, 0, feature).astype(np.intp),
+            threshold=np.concatenate([tree.threshold for tree in trees]),
+            children=np.column_stack([np.where(leaf, nodes, left), np.where(leaf, nodes, right)]).astype(np.intp).ravel(),
+            value=np.concatenate([tree.value[:, 0, 0] for tree in trees]),
+            depth=max(tree.max_depth for tree in trees),
+            **params
+        )
+
+    def predict(self, features: np.ndarray) -> np.ndarray:
+        """
+        Predict each row.
+
+        Args:
+            features: 2-D array of estimator inputs
+
+        Returns:
+            Array of predictions
+        """
+        # Trees compare float32 features against float64 thresholds, as in scikit-learn
+        features = np.asarray(features, dtype=np.float32)
+        predictions = np.empty(len(features))
+
+        for start in range(0, len(features), FLAT_FOREST_BLOCK_ROWS):
+            block = features[start:start + FLAT_FOREST_BLOCK_ROWS]
+            values = block.ravel()
+            row_starts = (np.arange(len(block)) * block.shape[1])[:, np.newaxis]
+            nodes = np.broadcast_to(self.roots, (len(block), len(self.roots)))
+
+            for _ in range(self.depth):
+                go_right = values[row_starts + self.feature[nodes]] > self.threshold[nodes]
+                nodes = self.children[2 * nodes + go_right]
+
+            leaves = self.value[nodes]
+            if self.scale != 1.0:
+                leaves = self.scale * leaves
+
+            # Add the trees in order (cumsum is sequential), as scikit-learn accumulates them
+            terms = np.column_stack([np.full(len(block), self.baseline), leaves])
+            predictions[start:start + FLAT_FOREST_BLOCK_ROWS] = np.cumsum(terms, axis=1)[:, -1]
+
+        return predictions / self.divisor
+
+class CompiledPipeline:
+    """
+    Fitted preprocessing parameters of a pipeline applied to plain numpy rows.
+
+    The column transformer's scalers and one-hot encoders, and an optional
+    interaction step, are reduced at load time to arrays indexed by input position:
+    scaler means and scales, category values, and the column pairs of each
+    interaction. A request row is then transformed with a few array operations, in
+    the same order and precision as the pipeline, and passed to the estimator.
+    """
+
+    def __init__(self, columns: List[str], blocks: List[tuple], interactions: Optional[tuple], estimator,
+                 parallel_estimator=None, parallel_min_rows: int = INFERENCE_PARALLEL_MIN_ROWS):
+        """
+        Args:
+            columns: Input columns in row order (the pipeline's feature_names_in_)
+            blocks: Transformed blocks in output order, see compile_pipeline
+            interactions: (first, second) index arrays of the product features, or None
+            estimator: Fitted final estimator, predicting in the calling thread
+            parallel_estimator: The same estimator fanning out over workers, or None
+            parallel_min_rows: Smallest batch predicted with the parallel estimator
+        """
+        self.columns = columns
+        self.blocks = blocks
+        self.interactions = interactions
+        self.estimator = estimator
+        self.parallel_estimator = parallel_estimator
+        self.parallel_min_rows = parallel_min_rows
+
+    @property
+    def kind(self) -> str:
+        """Name of the inference path: 'flat-forest' or 'compiled'."""
+        return 'flat-forest' if isinstance(self.estimator, FlatForest) else 'compiled'
+
+    def transform(self, rows: np.ndarray) -> np.ndarray:
+        """
+        Transform input rows as the pipeline's preprocessing steps would.
+
+        Args:
+            rows: 2-D float64 array of rows with the input columns in order
+
+        Returns:
+            2-D float64 array of estimator inputs
+
+        Raises:
+            ValueError: If a row contains NaN or infinity, as the pipeline's scalers would
+        """
+        if not np.isfinite(rows).all():
+            raise ValueError("Input contains NaN or infinity")
+
+        parts = []
+        for kind, positions, first, second in self.blocks:
+            values = rows[:, positions]
+            if kind == 'scale':
+                # StandardScaler subtracts the mean in place, then divides by the scale
+                if first is not None:
+                    values = values - first
+                if second is not None:
+                    values = values / second
+                parts.append(values)
+            elif kind == 'onehot':
+                # Unknown categories encode as all zeros (handle_unknown='ignore')
+                parts.append((values[:, first] == second).astype(np.float64))
+            else:
+                parts.append(values)
+
+        features = np.hstack(parts) if len(parts) > 1 else parts[0]
+
+        if self.interactions is not None:
+            first, second = self.interactions
+            features = np.hstack([features, features[:, first] * features[:, second]])
+
+        return features
+
+    def predict(self, rows: np.ndarray) -> np.ndarray:
+        """
+        Predict with the estimator on transformed rows.
+
+        Single rows and small batches run in the calling thread; dispatching them to
+        workers costs more than the prediction. Large batches fan out.
+
+        Args:
+            rows: 2-D float64 array of rows with the input columns in order
+
+        Returns:
+            Array of predictions
+        """
+        estimator = self.estimator
+        if self.parallel_estimator is not None and len(rows) >= self.parallel_min_rows:
+            estimator = self.parallel_estimator
+        return estimator.predict(self.transform(rows))
+
+    def predict_row(self, row: np.ndarray) -> float:
+        """Predict a single contiguous row of the input columns."""
+        return float(self.predict(row.reshape(1, -1))[0])
+
+def compile_pipeline(pipeline, n_jobs: int = INFERENCE_N_JOBS,
+                     parallel_min_rows: int = INFERENCE_PARALLEL_MIN_ROWS) -> Optional[CompiledPipeline]:
+    """
+    Compile a fitted pipeline of the shape the models build into a numpy inference path.
+
+    Supported steps are a ColumnTransformer of StandardScaler and OneHotEncoder
+    sub-pipelines (remainder dropped or passed through), an optional
+    PolynomialFeatures step with degree 2 and no bias column, and a final estimator.
+    Single-output random forests, extra-trees and gradient boosting regressors are
+    flattened into a FlatForest for single rows and small batches. The pickled n_jobs of the estimator (its
+    training parallelism) is replaced by the inference settings, on shallow copies
+    that share the fitted state.
+
+    Args:
+        pipeline: Fitted pipeline, fitted on a DataFrame
+        n_jobs: Workers for batches of at least parallel_min_rows rows
+        parallel_min_rows: Smallest batch that fans out over workers
+
+    Returns:
+        CompiledPipeline, or None if the pipeline has other steps or settings
+        (callers then keep using the pipeline itself)
+    """
+    from sklearn.compose import ColumnTransformer
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import StandardScaler, OneHotEncoder, PolynomialFeatures
+
+    if not isinstance(pipeline, Pipeline) or not hasattr(pipeline, 'feature_names_in_'):
+        return None
+
+    steps = [step for _, step in pipeline.steps]
+    preprocessor, estimator = steps[0], steps[-1]
+    middle = steps[1:-1]
+
+    if not isinstance(preprocessor, ColumnTransformer) or getattr(preprocessor, 'sparse_output_', True):
+        return None
+
+    columns = list(pipeline.feature_names_in_)
+    position = {name: index for index, name in enumerate(columns)}
+
+    blocks = []
+    for name, transformer, transformer_columns in preprocessor.transformers_:
+        if transformer == 'drop' or len(transformer_columns) == 0:
+            continue
+        if any(not isinstance(column, str) for column in transformer_columns):
+            return None
+        positions = np.array([position[column] for column in transformer_columns], dtype=np.intp)
+
+        if transformer == 'passthrough':
+            blocks.append(('passthrough', positions, None, None))
+            continue
+
+        inner = transformer.steps if isinstance(transformer, Pipeline) else [(name, transformer)]
+        if len(inner) != 1:
+            return None
+        encoder = inner[0][1]
+
+        if isinstance(encoder, StandardScaler):
+            mean = encoder.mean_ if encoder.with_mean else None
+            scale = encoder.scale_ if encoder.with_std else None
+            blocks.append(('scale', positions, mean, scale))
+        elif (isinstance(encoder, OneHotEncoder) and encoder.drop is None
+              and encoder.handle_unknown == 'ignore' and encoder.dtype in (np.float64, float)
+              and all(categories.dtype.kind in 'biuf' for categories in encoder.categories_)):
+            # One output column per (input column, category), in category order
+            source = np.concatenate([np.full(len(categories), index)
+                                     for index, categories in enumerate(encoder.categories_)])
+            values = np.concatenate([categories.astype(np.float64) for categories in encoder.categories_])
+            blocks.append(('onehot', positions, source, values))
+        else:
+            return None
+
+    if not blocks:
+        return None
+
+    interactions = None
+    if middle:
+        if (len(middle) != 1 or not isinstance(middle[0], PolynomialFeatures)
+                or not _supported_interactions(middle[0])):
+            return None
+        powers = middle[0].powers_
+        products = powers.sum(axis=1) == 2
+        # Each product column multiplies two inputs (the same one twice for a square)
+        pairs = np.array([np.repeat(np.arange(powers.shape[1]), power)[:2] for power in powers[products]],
+                         dtype=np.intp).reshape(-1, 2)
+        interactions = (pairs[:, 0], pairs[:, 1])
+
+    forest = flatten_trees(estimator)
+    if forest is not None:
+        # Large batches are faster through the trees' compiled traversal, even in one thread
+        if hasattr(estimator, 'n_jobs'):
+            estimator = _with_n_jobs(estimator, n_jobs)
+        return CompiledPipeline(columns, blocks, interactions, forest, estimator, parallel_min_rows)
+
+    parallel_estimator = None
+    if hasattr(estimator, 'n_jobs'):
+        if n_jobs not in (None, 1):
+            parallel_estimator = _with_n_jobs(estimator, n_jobs)
+        estimator = _with_n_jobs(estimator, 1)
+
+    return CompiledPipeline(columns, blocks, interactions, estimator, parallel_estimator, parallel_min_rows)
+
+def flatten_trees(estimator) -> Optional[FlatForest]:
+    """
+    Flatten a fitted single-output tree ensemble regressor.
+
+    Args:
+        estimator: Fitted estimator
+
+    Returns:
+        FlatForest predicting exactly as the estimator, or None for other estimators
+    """
+    from sklearn.dummy import DummyRegressor
+    from sklearn.ensemble import RandomForestRegressor, ExtraTreesRegressor, GradientBoostingRegressor
+
+    if type(estimator) in (RandomForestRegressor, ExtraTreesRegressor):
+        if estimator.n_outputs_ != 1:
+            return None
+        trees = [tree.tree_ for tree in estimator.estimators_]
+        return FlatForest.from_trees(trees, divisor=len(trees))
+
+    if type(estimator) is GradientBoostingRegressor:
+        # Regression losses predict the raw score: the init estimate plus the scaled trees
+        if isinstance(estimator.init_, DummyRegressor):
+            baseline = float(np.ravel(estimator.init_.constant_)[0])
+        elif estimator.init_ == 'zero':
+            baseline = 0.0
+        else:
+            return None
+        trees = [tree.tree_ for tree in estimator.estimators_[:, 0]]
+        return FlatForest.from_trees(trees, baseline=baseline, scale=estimator.learning_rate)
+
+    return None
+
+def _with_n_jobs(estimator, n_jobs: int):
+    """Shallow copy of a fitted estimator with another n_jobs, sharing its fitted state."""
+    estimator = copy.copy(estimator)
+    estimator.n_jobs = n_jobs
+    return estimator
+
+def _supported_interactions(step) -> bool:
+    """Whether a PolynomialFeatures step has degree 2, no bias and the linear terms first."""
+    if step.include_bias:
+        return False
+    powers = step.powers_
+    degrees = powers.sum(axis=1)
+    linear = degrees == 1
+    return (degrees.max() <= 2 and linear.sum() == powers.shape[1]
+            and np.array_equal(powers[linear], np.eye(powers.shape[1], dtype=powers.dtype))
+            and not linear[int(linear.sum()):].any())
+
+def limit_inference_threads(limit: int = INFERENCE_BLAS_THREADS) -> List[Dict]:
+    """
+    Limit the threads of the BLAS and OpenMP libraries loaded in this process.
+
+    Called once at API startup, after the models' libraries are imported: every server
+    worker handles its own requests, so thread pools inside the numerical libraries
+    only oversubscribe the cores.
+
+    Args:
+        limit: Maximum threads per library
+
+    Returns:
+        threadpoolctl info on the loaded libraries after the limit
+    """
+    from threadpoolctl import threadpool_info, threadpool_limits
+
+    threadpool_limits(limits=limit)
+    libraries = threadpool_info()
+    logger.info(f"Limited BLAS/OpenMP threads to {limit} for "
+                f"{', '.join(library['internal_api'] for library in libraries) or 'no loaded libraries'}")
+    return libraries
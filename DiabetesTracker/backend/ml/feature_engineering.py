@@ -37,12 +37,26 @@
 # Enhanced data preprocessing for diabetes tracking with proper time series handling
 
 import os
+import json
+import time
+import hashlib
+import shutil
 import logging
+import importlib.util
 import numpy as np
 import pandas as pd
+from concurrent.futures import Future, ProcessPoolExecutor
 from datetime import datetime, timedelta
+from pandas.api.types import union_categoricals
 from sklearn.preprocessing import StandardScaler
-from typing import Dict, List, Tuple, Optional, Union
+from typing import Dict, Iterator, List, Tuple, Optional, Union
+
+from columnar_store import SCHEMA_FILE, hash_file, save_frame, load_frame
+from activity_curves import (insulin_activity, carb_activity, convolve_events, events_on_board,
+                             INSULIN_ACTIVITY_KERNEL, INSULIN_ON_BOARD_KERNEL,
+                             CARB_ACTIVITY_KERNEL, CARBS_ON_BOARD_KERNEL)
+from glucose_trends import TREND_LOOKBACK_MINUTES, glucose_trend_features
+from feature_spec import GLUCOSE_FEATURE_SPEC, INSULIN_FEATURE_SPEC
 
 # Set up logging
 logging.basicConfig(
@@ -55,17 +69,109 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# CGM resampling: readings sit on a 5-minute grid, a reading less than half an interval after
+# the previous one is a duplicate and a gap longer than CGM_MAX_GAP_MINUTES starts a new segment.
+# Lags, rolling statistics and future targets are looked up on the grid within a segment only.
+CGM_INTERVAL_MINUTES = 5
+CGM_MAX_GAP_MINUTES = 15
+GLUCOSE_LAG_STEPS = [1, 2, 3, 6, 12]
+GLUCOSE_ROLLING_STEPS = 12
+GLUCOSE_TARGET_STEPS = {'glucose_future_30min': 6, 'glucose_future_60min': 12}
+
+# Timestamp formats in order of precedence
+DATETIME_FORMATS = [
+    '%d-%m-%Y %H:%M:%S',  # Standard format in dataset
+    '%Y-%m-%d %H:%M:%S',  # ISO format
+    '%m/%d/%Y %H:%M:%S',  # US format
+    '%d/%m/%Y %H:%M:%S'   # European format
+]
+
+# Number of distinct values used to detect the dominant timestamp format of a column
+FORMAT_SNIFF_SAMPLE_SIZE = 1000
+
+# Declared schema of the raw CSV export: the columns read by the extractors and their dtypes.
+# Whole-number measurements are exact in float32; fractional doses and weights stay float64.
+RAW_CSV_SCHEMA = {
+    'id': 'Int32',
+    'weight': 'float64',
+    'insulin_type': 'category',
+    'ts': 'object',
+    'value': 'float32',
+    'type': 'category',
+    'dose': 'float64',
+    'bwz_carb_input': 'float32',
+    'ts9': 'object',
+    'carbs': 'float32',
+    'intensity': 'float32',
+    'duration': 'float32'
+}
+
+# Columns every raw file must provide
+RAW_CSV_REQUIRED_COLUMNS = ['id', 'weight', 'ts', 'value', 'dose']
+
+# Numbered timestamp columns read as strings (the extractors use the first ts_begin* column)
+RAW_CSV_TIMESTAMP_PREFIXES = ('ts_begin',)
+
+# Dtype policy of the processed frames and training datasets: 0/1 flags as int8, calendar
+# fields as uint8, identifiers as categories and remaining float/int measurements as float32
+DTYPE_FLAG_COLUMNS = ['is_morning', 'is_afternoon', 'is_evening', 'is_night', 'is_weekend', 'is_meal_bolus']
+DTYPE_CALENDAR_COLUMNS = ['hour', 'day_of_week', 'month', 'day', 'week_of_year', 'quarter']
+DTYPE_CATEGORY_COLUMNS = ['patient_id', 'source_file']
+DTYPE_EXACT_COLUMNS = ['timestamp_epoch']
+
+# Use the multithreaded pyarrow CSV parser when it is installed
+PYARROW_AVAILABLE = importlib.util.find_spec('pyarrow') is not None
+
+# Version of the per-patient extraction output; bump whenever the extractors change
+# so cached frames from older code are rebuilt
+PROCESSOR_VERSION = 6
+
+# Manifest written into each raw file cache entry
+CACHE_MANIFEST_FILE = 'manifest.json'
+
+# Incremental updates: glucose rows within this span of the last reading may still get future
+# targets; the recomputed rows' lags, rolling windows and trend features reach the look-back span back
+INCREMENTAL_TAIL_WINDOW = timedelta(minutes=GLUCOSE_ROLLING_STEPS * CGM_INTERVAL_MINUTES + CGM_INTERVAL_MINUTES / 2)
+INCREMENTAL_LOOKBACK_WINDOW = max(INCREMENTAL_TAIL_WINDOW, timedelta(minutes=TREND_LOOKBACK_MINUTES))
+
+# Dose history needed by the 24h insulin totals of new doses
+INCREMENTAL_CONTEXT_WINDOW = timedelta(hours=24)
+
+# State file of the incremental update directory
+INCREMENTAL_MANIFEST_FILE = 'incremental_state.json'
+
+# Streaming ingestion: default memory budget, and rows sampled to estimate the in-memory size of a row
+STREAM_MEMORY_BUDGET_MB = 512
+STREAM_SAMPLE_ROWS = 10000
+
+# Dataset file formats: 'columnar' is a directory of typed .npy columns plus a JSON
+# schema that loads memory-mapped, 'csv' is a text export
+DATASET_FORMATS = ['columnar', 'csv']
+
+# Synthetic cohort generator: start of the CGM traces, insulin types and the fraction of the
+# ISF-scaled carb/insulin amounts that shows up in glucose at the peak of each activity curve
+SYNTHETIC_START = datetime(2023, 1, 1)
+SYNTHETIC_INSULIN_TYPES = ['Novalog', 'Humalog', 'Humalog 200']
+SYNTHETIC_EFFECT_SCALE = 0.6
+SYNTHETIC_TARGET_GLUCOSE = 120
+
 class DiabetesDataProcessor:
     """Class for preprocessing diabetes data with proper time series handling."""
     
-    def __init__(self, output_dir: str = 'data'):
+    def __init__(self, output_dir: str = 'data', csv_engine: Optional[str] = None,
+                 cache_dir: Optional[str] = None):
         """
         Initialize the data processor.
         
         Args:
             output_dir: Directory to save processed data
+            csv_engine: pandas CSV parser for raw files (default: 'pyarrow' if installed, else 'c')
+            cache_dir: Directory for cached per-patient frames of raw files (default: no caching)
         """
         self.output_dir = output_dir
+        self.csv_engine = csv_engine or ('pyarrow' if PYARROW_AVAILABLE else 'c')
+        self.cache_dir = cache_dir
+        self.cache_stats = {}
         self.glucose_scaler = StandardScaler()
         self.carb_scaler = StandardScaler()
         self.insulin_scaler = StandardScaler()
@@ -88,14 +194,7 @@ class DiabetesDataProcessor:
             return None
             
         # Try multiple date formats
-        formats = [
-            '%d-%m-%Y %H:%M:%S',  # Standard format in dataset
-            '%Y-%m-%d %H:%M:%S',  # ISO format
-            '%m/%d/%Y %H:%M:%S',  # US format
-            '%d/%m/%Y %H:%M:%S'   # European format
-        ]
-        
-        for fmt in formats:
+        for fmt in DATETIME_FORMATS:
             try:
                 return pd.to_datetime(date_str, format=fmt)
             except (ValueError, TypeError):
@@ -108,12 +207,567 @@ class DiabetesDataProcessor:
             logger.warning(f"Could not parse datetime: {date_str}")
             return None
 
-    def process_csv_files(self, file_paths: List[str]) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    def sniff_datetime_format(self, values: Union[pd.Index, np.ndarray]) -> Optional[str]:
+        """
+        Detect the dominant timestamp format from a sample of values.
+        
+        Args:
+            values: Distinct, non-null timestamp strings
+            
+        Returns:
+            The format matching the most sampled values, or None if none match
+        """
+        if len(values) == 0:
+            return None
+        
+        # Sample evenly across the column so mixed exports are represented
+        step = max(1, len(values) // FORMAT_SNIFF_SAMPLE_SIZE)
+        sample = pd.Index(values[::step][:FORMAT_SNIFF_SAMPLE_SIZE]).astype(str)
+        
+        best_format, best_count = None, 0
+        for fmt in DATETIME_FORMATS:
+            count = pd.to_datetime(sample, format=fmt, errors='coerce').notna().sum()
+            if count > best_count:
+                best_format, best_count = fmt, count
+        
+        return best_format
+    
+    def _parse_fixed_width(self, values: pd.Index, fmt: str) -> np.ndarray:
+        """
+        Vectorized parser for fixed-width numeric formats such as '%d-%m-%Y %H:%M:%S'.
+        
+        Strings are viewed as a byte matrix and the date fields are read by
+        position, which avoids per-string strptime calls.
+        
+        Args:
+            values: Timestamp strings
+            fmt: Format built from %d, %m, %Y, %H, %M, %S and literal separators
+            
+        Returns:
+            Array of datetime64[ns] values, NaT where a string does not match
+        """
+        result = np.full(len(values), np.datetime64('NaT'), dtype='datetime64[ns]')
+        
+        # Map each directive to its character offset in the formatted string
+        widths = {'Y': 4, 'm': 2, 'd': 2, 'H': 2, 'M': 2, 'S': 2}
+        fields, literals, pos, i = {}, {}, 0, 0
+        while i < len(fmt):
+            if fmt[i] == '%':
+                directive = fmt[i + 1]
+                if directive not in widths:
+                    return result
+                fields[directive] = (pos, widths[directive])
+                pos += widths[directive]
+                i += 2
+            else:
+                literals[pos] = ord(fmt[i])
+                pos += 1
+                i += 1
+        width = pos
+        
+        if set(fields) != set(widths):
+            return result
+        
+        # One spare byte per string: it must be padding for strings of exactly `width` characters
+        try:
+            chars = np.asarray(values, dtype=object).astype(f'S{width + 1}')
+        except UnicodeEncodeError:
+            return result
+        chars = chars.view(np.uint8).reshape(-1, width + 1)
+        
+        valid = (chars[:, width] == 0) & (chars[:, width - 1] != 0)
+        for offset, char in literals.items():
+            valid &= chars[:, offset] == char
+        
+        parts = {}
+        for directive, (offset, size) in fields.items():
+            value = np.zeros(len(chars), dtype=np.int64)
+            for k in range(offset, offset + size):
+                digit = chars[:, k] - ord('0')  # Non-digits wrap around above 9
+                valid &= digit <= 9
+                value = value * 10 + digit
+            parts[directive] = value
+        
+        year, month, day = parts['Y'], parts['m'], parts['d']
+        hour, minute, second = parts['H'], parts['M'], parts['S']
+        valid &= (year >= 1678) & (year <= 2261) & (month >= 1) & (month <= 12) & (day >= 1) & (day <= 31)
+        valid &= (hour <= 23) & (minute <= 59) & (second <= 59)
+        
+        year, month, day = year[valid], month[valid], day[valid]
+        months = ((year - 1970) * 12 + (month - 1)).astype('datetime64[M]')
+        dates = months.astype('datetime64[D]') + (day - 1)
+        
+        # Reject days that overflow into the next month (e.g. 31-04)
+        in_month = dates.astype('datetime64[M]') == months
+        seconds = (hour[valid] * 3600 + minute[valid] * 60 + second[valid]).astype('timedelta64[s]')
+        
+        rows = np.flatnonzero(valid)[in_month]
+        result[rows] = dates[in_month].astype('datetime64[ns]') + seconds[in_month]
+        
+        return result
+    
+    def parse_datetime_column(self, values: pd.Series) -> pd.Series:
+        """
+        Parse a whole column of timestamp strings.
+        
+        Distinct values are parsed once with the column's dominant format in a
+        single vectorized call. Only the distinct values that fail are passed
+        to parse_datetime, so ambiguous day/month values follow the dominant
+        format of the column.
+        
+        Args:
+            values: Series of timestamp strings
+            
+        Returns:
+            Series of datetime64 values aligned with the input, NaT where parsing fails
+        """
+        codes, uniques = pd.factorize(values)
+        parsed = np.full(len(uniques), np.datetime64('NaT'), dtype='datetime64[ns]')
+        
+        fmt = self.sniff_datetime_format(uniques)
+        if fmt is not None:
+            strings = pd.Index(uniques).astype(str)
+            parsed[:] = self._parse_fixed_width(strings, fmt)
+            
+            # Variable-width values (e.g. single-digit days) go through pandas in one call
+            unparsed = np.flatnonzero(np.isnat(parsed))
+            if len(unparsed) > 0:
+                parsed[unparsed] = pd.to_datetime(strings[unparsed], format=fmt, errors='coerce').to_numpy()
+        
+        # Fall back to the per-value parser for distinct values the dominant format missed
+        for i in np.flatnonzero(np.isnat(parsed)):
+            timestamp = self.parse_datetime(uniques[i])
+            if timestamp is not None:
+                parsed[i] = timestamp.to_datetime64()
+        
+        # Broadcast parsed distinct values back to rows; missing inputs stay NaT
+        result = np.full(len(codes), np.datetime64('NaT'), dtype='datetime64[ns]')
+        present = codes >= 0
+        result[present] = parsed[codes[present]]
+        
+        return pd.Series(result, index=values.index, name=values.name)
+    
+    def _parse_timestamps(self, df: pd.DataFrame, rows: pd.DataFrame, column: str,
+                          timestamp_cache: Dict[str, pd.Series]) -> pd.Series:
+        """
+        Parse a timestamp column for a subset of a patient's rows.
+        
+        The full patient column is parsed once and shared through timestamp_cache,
+        so the same column is never parsed twice for one patient.
+        
+        Args:
+            df: DataFrame for a single patient
+            rows: Subset of df to return timestamps for
+            column: Timestamp column name
+            timestamp_cache: Parsed patient columns keyed by column name
+            
+        Returns:
+            Series of parsed timestamps aligned with rows
+        """
+        if not df.index.is_unique:
+            return self.parse_datetime_column(rows[column])
+        
+        if column not in timestamp_cache:
+            timestamp_cache[column] = self.parse_datetime_column(df[column])
+        
+        return timestamp_cache[column].loc[rows.index]
+    
+    def _asof_indices(self, times: pd.Series, event_times: pd.Series,
+                      tolerance: Optional[timedelta] = None) -> np.ndarray:
+        """
+        Find the most recent event at or before each timestamp (backward as-of join).
+        
+        Args:
+            times: Timestamps to look up
+            event_times: Event timestamps, sorted in ascending order
+            tolerance: Maximum look-back window (inclusive), or None for no limit
+            
+        Returns:
+            Positional indices into event_times, -1 where no event qualifies
+        """
+        lookup = times.to_numpy(dtype='datetime64[ns]')
+        events = event_times.to_numpy(dtype='datetime64[ns]')
+        
+        # Last event with timestamp <= lookup time; ties resolve to the last in sorted order
+        idx = np.searchsorted(events, lookup, side='right') - 1
+        
+        if tolerance is not None and len(events) > 0:
+            oldest_allowed = lookup - np.timedelta64(tolerance)
+            too_old = (idx >= 0) & (events[np.maximum(idx, 0)] < oldest_allowed)
+            idx[too_old] = -1
+        
+        return idx
+    
+    def _asof_values(self, values: pd.Series, idx: np.ndarray, default: float) -> np.ndarray:
+        """
+        Gather event values for as-of indices, using a default where there is no match.
+        
+        Args:
+            values: Event values aligned with the event timestamps
+            idx: Indices returned by _asof_indices
+            default: Value for rows without a matching event
+            
+        Returns:
+            Array of matched values
+        """
+        # Gather unconditionally so the result dtype follows the event values,
+        # whether or not any row matched
+        matched = idx >= 0
+        return np.where(matched, values.to_numpy()[np.maximum(idx, 0)], default)
+    
+    def _asof_minutes_since(self, times: pd.Series, event_times: pd.Series,
+                            idx: np.ndarray) -> np.ndarray:
+        """
+        Minutes elapsed since the matched event, NaN where there is no match.
+        
+        Args:
+            times: Timestamps that were looked up
+            event_times: Event timestamps, sorted in ascending order
+            idx: Indices returned by _asof_indices
+            
+        Returns:
+            Array of elapsed minutes
+        """
+        matched = idx >= 0
+        if not matched.any():
+            return np.full(len(idx), np.nan)
+        
+        elapsed = pd.Series(
+            times.to_numpy(dtype='datetime64[ns]') -
+            event_times.to_numpy(dtype='datetime64[ns]')[np.maximum(idx, 0)]
+        )
+        minutes = elapsed.dt.total_seconds().to_numpy() / 60
+        
+        return np.where(matched, minutes, np.nan)
+
+    def _rolling_dose_total(self, timestamps: pd.Series, doses: pd.Series,
+                            window: str = '24h') -> np.ndarray:
+        """
+        Sum of doses in a trailing time window, excluding doses at the current timestamp.
+        
+        Each window is summed on its own rather than with a running total, so a
+        row's result does not depend on how much earlier history is present.
+        
+        Args:
+            timestamps: Dose timestamps, sorted in ascending order
+            doses: Dose amounts aligned with timestamps
+            window: Window length as a pandas offset string
+            
+        Returns:
+            Array of totals for the closed-left window [t - window, t)
+        """
+        times = timestamps.to_numpy(dtype='datetime64[ns]')
+        values = doses.to_numpy(dtype=np.float64)
+        
+        if len(values) == 0:
+            return values
+        
+        starts = np.searchsorted(times, times - pd.Timedelta(window).to_timedelta64(), side='left')
+        ends = np.searchsorted(times, times, side='left')
+        
+        # reduceat over interleaved (start, end) pairs sums values[start:end] for each row
+        bounds = np.empty(2 * len(values), dtype=np.intp)
+        bounds[0::2] = starts
+        bounds[1::2] = ends
+        totals = np.add.reduceat(values, bounds)[0::2]
+        
+        return np.where(ends > starts, totals, 0.0)
+    
+    def _rolling_window_stats(self, values: pd.Series, window: int = 12,
+                              starts: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Trailing mean and sample standard deviation over the last `window` readings.
+        
+        Matches rolling(window, min_periods=1), but every window is reduced on its own,
+        so a row's result does not depend on how much earlier history is present.
+        
+        Args:
+            values: Readings in time order
+            window: Maximum number of readings per window
+            starts: Position of the first reading in each row's window (default: `window` back)
+            
+        Returns:
+            Tuple of (mean, std) arrays; std is NaN for single-reading windows
+        """
+        x = values.to_numpy(dtype=np.float64)
+        padded = np.concatenate([np.full(window - 1, np.nan), x])
+        windows = np.lib.stride_tricks.sliding_window_view(padded, window)
+        present = ~np.isnan(windows)
+        
+        if starts is not None:
+            # Column k of row i holds the reading at position i - window + 1 + k
+            positions = np.arange(len(x))[:, None] - window + 1 + np.arange(window)[None, :]
+            present &= positions >= np.asarray(starts)[:, None]
+        
+        counts = present.sum(axis=1)
+        total = np.zeros(len(x))
+        for k in range(window):
+            total += np.where(present[:, k], windows[:, k], 0.0)
+        
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = total / counts
+            
+            squares = np.zeros(len(x))
+            for k in range(window):
+                squares += np.where(present[:, k], (windows[:, k] - mean) ** 2, 0.0)
+            
+            std = np.where(counts > 1, np.sqrt(squares / (counts - 1)), np.nan)
+        
+        return mean, std
+    
+    def resample_glucose_readings(self, glucose_df: pd.DataFrame,
+                                  patient_id: int) -> Tuple[pd.DataFrame, np.ndarray]:
+        """
+        Place time-sorted glucose readings on the CGM grid and split them into segments.
+        
+        A reading less than half an interval after the previous one falls on the same
+        grid slot and is dropped. A gap of more than CGM_MAX_GAP_MINUTES between
+        readings (a sensor dropout) starts a new segment. Both rules only look at the
+        previous reading.
+        
+        Args:
+            glucose_df: Glucose readings sorted by timestamp
+            patient_id: Patient ID for the report
+            
+        Returns:
+            Tuple of (readings without duplicates, segment number of each reading)
+        """
+        minutes = self._epoch_seconds(glucose_df['timestamp']) / 60
+        gaps = np.diff(minutes, prepend=-np.inf)
+        
+        duplicates = gaps < CGM_INTERVAL_MINUTES / 2
+        if duplicates.any():
+            glucose_df = glucose_df[~duplicates]
+            minutes = minutes[~duplicates]
+            gaps = np.diff(minutes, prepend=-np.inf)
+        
+        segments = np.cumsum(gaps > CGM_MAX_GAP_MINUTES)
+        
+        logger.info(f"Resampled {len(glucose_df)} glucose readings for patient {patient_id} onto the "
+                    f"{CGM_INTERVAL_MINUTES}-minute grid: {int(duplicates.sum())} duplicate readings dropped, "
+                    f"{segments[-1] if len(segments) else 0} segments")
+        
+        return glucose_df, segments
+    
+    def _grid_values(self, values: np.ndarray, minutes: np.ndarray, segments: np.ndarray,
+                     steps: int) -> np.ndarray:
+        """
+        Look up the reading a number of grid steps away from each reading.
+        
+        The reading nearest to the grid time, within half an interval, is used if it
+        is in the same segment; otherwise the value is missing.
+        
+        Args:
+            values: Glucose values in time order
+            minutes: Reading times in minutes, ascending
+            segments: Segment number of each reading
+            steps: Grid steps to look ahead (positive) or back (negative)
+            
+        Returns:
+            Array of values, NaN where no reading is on that grid slot in the segment
+        """
+        half = CGM_INTERVAL_MINUTES / 2
+        target = minutes + steps * CGM_INTERVAL_MINUTES
+        n = len(values)
+        
+        # Candidates: the first reading at or after the slot start and the one after it
+        first = np.searchsorted(minutes, target - half)
+        result = np.full(n, np.nan)
+        best = np.full(n, np.inf)
+        
+        for candidate in (first, first + 1):
+            index = np.minimum(candidate, n - 1)
+            distance = np.abs(minutes[index] - target)
+            usable = ((candidate < n) & (minutes[index] < target + half) & (segments[index] == segments)
+                      & (distance < best))
+            result = np.where(usable, values[index], result)
+            best = np.where(usable, distance, best)
+        
+        return result
+    
+    def read_raw_csv(self, file_path: str, chunksize: Optional[int] = None) -> Union[pd.DataFrame, Iterator[pd.DataFrame]]:
+        """
+        Read a raw CSV export, loading only the schema columns with compact dtypes.
+        
+        Args:
+            file_path: Path to the raw CSV file
+            chunksize: Rows per chunk to read the file incrementally (default: read it whole)
+            
+        Returns:
+            DataFrame with the columns used by the extractors, or an iterator of
+            DataFrame chunks if chunksize is given
+        """
+        header = pd.read_csv(file_path, nrows=0).columns
+        
+        missing_cols = [col for col in RAW_CSV_REQUIRED_COLUMNS if col not in header]
+        if missing_cols:
+            logger.error(f"Raw file {file_path} is missing required columns: {missing_cols}")
+            raise ValueError(f"Raw file {file_path} is missing required columns: {missing_cols}")
+        
+        # Keep schema columns plus numbered timestamp columns, in file order
+        columns = [col for col in header if col in RAW_CSV_SCHEMA or col.startswith(RAW_CSV_TIMESTAMP_PREFIXES)]
+        dtypes = {col: RAW_CSV_SCHEMA.get(col, 'object') for col in columns}
+        
+        if chunksize is not None:
+            # The pyarrow parser cannot read in chunks
+            return pd.read_csv(file_path, usecols=columns, dtype=dtypes, engine='c', chunksize=chunksize)
+        
+        return pd.read_csv(file_path, usecols=columns, dtype=dtypes, engine=self.csv_engine)
+    
+    def process_patient(self, patient_df: pd.DataFrame, patient_id: int, source_file: str,
+                        weight: Optional[float] = None,
+                        timestamp_cache: Optional[Dict[str, pd.Series]] = None
+                        ) -> Tuple[Optional[pd.DataFrame], Optional[pd.DataFrame]]:
+        """
+        Extract glucose and insulin data for a single patient.
+        
+        Args:
+            patient_df: DataFrame for a single patient
+            patient_id: Patient ID
+            source_file: Source file name for tracking
+            weight: Patient weight (default: weight of the first row)
+            timestamp_cache: Pre-parsed timestamp columns for the patient, if any
+            
+        Returns:
+            Tuple of (glucose_df, insulin_df), either of which may be None
+        """
+        # Get patient weight
+        if weight is None:
+            weight = patient_df['weight'].iloc[0]
+        
+        # Timestamp columns parsed once and shared by both extractors
+        timestamp_cache = {} if timestamp_cache is None else timestamp_cache
+        
+        glucose_df = self.extract_glucose_readings(patient_df, patient_id, weight, source_file, timestamp_cache)
+        insulin_df = self.extract_insulin_doses(patient_df, patient_id, weight, source_file, timestamp_cache)
+        
+        return glucose_df, insulin_df
+
+    def _cache_file_key(self, file_path: str) -> str:
+        """
+        Get the prefix of the cache entries of a raw file.
+        
+        The file name is followed by a hash of the absolute path, so files with the same
+        name in different directories keep separate entries.
+        
+        Args:
+            file_path: Path to the raw CSV file
+            
+        Returns:
+            Cache key of the file
+        """
+        path_hash = hashlib.sha256(os.path.abspath(file_path).encode()).hexdigest()
+        return f"{os.path.basename(file_path)}-{path_hash[:12]}"
+    
+    def _cache_entry_dir(self, file_path: str, file_hash: str) -> str:
+        """
+        Get the cache directory for a raw file.
+        
+        Entries are keyed by file path, content hash, CSV parser and processor version,
+        so an edited file, another parser or a change to the extractors never reuses
+        stale frames.
+        
+        Args:
+            file_path: Path to the raw CSV file
+            file_hash: SHA-256 hash of the file contents
+            
+        Returns:
+            Path of the cache entry directory
+        """
+        return os.path.join(self.cache_dir, f"{self._cache_file_key(file_path)}-{file_hash[:16]}-"
+                                            f"{self.csv_engine}-v{PROCESSOR_VERSION}")
+    
+    def _load_cached_file(self, entry_dir: str) -> Optional[List[Tuple]]:
+        """
+        Load the per-patient frames of a cached raw file.
+        
+        Args:
+            entry_dir: Cache entry directory
+            
+        Returns:
+            List of (patient_id, glucose_df, insulin_df) tuples, or None on a cache miss
+        """
+        manifest_path = os.path.join(entry_dir, CACHE_MANIFEST_FILE)
+        if not os.path.exists(manifest_path):
+            return None
+        
+        try:
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+            
+            results = []
+            for patient in manifest['patients']:
+                glucose_df = load_frame(os.path.join(entry_dir, patient['glucose'])) if patient['glucose'] else None
+                insulin_df = load_frame(os.path.join(entry_dir, patient['insulin'])) if patient['insulin'] else None
+                results.append((patient['patient_id'], glucose_df, insulin_df))
+            
+            return results
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable cache entry {entry_dir}: {str(e)}")
+            return None
+    
+    def _save_cached_file(self, entry_dir: str, file_path: str, file_hash: str, results: List[Tuple]) -> None:
+        """
+        Save the per-patient frames of a raw file to the cache.
+        
+        Caching is best effort: failures are logged and processing continues.
+        Other entries for the same file path are removed.
+        
+        Args:
+            entry_dir: Cache entry directory
+            file_path: Path to the raw CSV file
+            file_hash: SHA-256 hash of the file contents
+            results: List of (patient_id, glucose_df, insulin_df) tuples
+        """
+        file_key = self._cache_file_key(file_path)
+        
+        try:
+            os.makedirs(entry_dir, exist_ok=True)
+            
+            patients = []
+            for patient_id, glucose_df, insulin_df in results:
+                patient = {'patient_id': int(patient_id), 'glucose': None, 'insulin': None}
+                
+                for kind, frame in (('glucose', glucose_df), ('insulin', insulin_df)):
+                    if frame is not None and not frame.empty:
+                        patient[kind] = f"patient_{int(patient_id)}_{kind}"
+                        save_frame(frame, os.path.join(entry_dir, patient[kind]))
+                
+                patients.append(patient)
+            
+            manifest = {
+                'source_file': os.path.basename(file_path),
+                'source_path': os.path.abspath(file_path),
+                'sha256': file_hash,
+                'csv_engine': self.csv_engine,
+                'processor_version': PROCESSOR_VERSION,
+                'patients': patients
+            }
+            
+            # The manifest is written last and marks the entry as complete
+            tmp_path = os.path.join(entry_dir, f"{CACHE_MANIFEST_FILE}.tmp")
+            with open(tmp_path, 'w') as f:
+                json.dump(manifest, f, indent=2)
+            os.replace(tmp_path, os.path.join(entry_dir, CACHE_MANIFEST_FILE))
+        except Exception as e:
+            logger.warning(f"Could not cache {file_path}: {str(e)}")
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            return
+        
+        # Drop entries for previous contents of this file, other parsers or older processor versions
+        for name in os.listdir(self.cache_dir):
+            stale_dir = os.path.join(self.cache_dir, name)
+            if name.startswith(f"{file_key}-") and stale_dir != entry_dir and os.path.isdir(stale_dir):
+                shutil.rmtree(stale_dir, ignore_errors=True)
+
+    def process_csv_files(self, file_paths: List[str], workers: int = 1) -> Tuple[pd.DataFrame, pd.DataFrame]:
         """
         Process multiple CSV files and extract glucose and insulin data.
         
         Args:
             file_paths: List of paths to CSV files
+            workers: Number of worker processes for per-patient extraction
+                (1 runs serially, 0 or less uses all CPU cores)
             
         Returns:
             Tuple of (glucose_df, insulin_df)
@@ -121,50 +775,114 @@ class DiabetesDataProcessor:
         all_glucose_data = []
         all_insulin_data = []
         
-        for file_path in file_paths:
-            try:
-                logger.info(f"Processing file: {file_path}")
-                file_name = os.path.basename(file_path)
-                
-                # Read CSV file
-                df = pd.read_csv(file_path)
-                
-                # Process each patient's data separately
-                patient_ids = df['id'].unique()
-                
-                for patient_id in patient_ids:
-                    logger.info(f"Processing patient ID: {patient_id} from file {file_name}")
-                    patient_df = df[df['id'] == patient_id].copy()
+        if workers is None or workers <= 0:
+            workers = os.cpu_count() or 1
+        
+        executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+        if executor is not None:
+            logger.info(f"Processing patients with {workers} worker processes")
+        
+        # Results (or futures) in file and patient order
+        pending = []
+        
+        # Cache entries to write for files that missed the cache
+        cache_misses = {}
+        cache_results = {}
+        self.cache_stats = {'hits': 0, 'misses': 0, 'hash_seconds': 0.0, 'load_seconds': 0.0,
+                            'process_seconds': 0.0, 'save_seconds': 0.0}
+        start_time = time.perf_counter()
+        
+        try:
+            for file_path in file_paths:
+                try:
+                    logger.info(f"Processing file: {file_path}")
+                    file_name = os.path.basename(file_path)
                     
-                    # Get patient weight
-                    weight = patient_df['weight'].iloc[0]
+                    if self.cache_dir:
+                        hash_start = time.perf_counter()
+                        file_hash = hash_file(file_path)
+                        entry_dir = self._cache_entry_dir(file_path, file_hash)
+                        self.cache_stats['hash_seconds'] += time.perf_counter() - hash_start
+                        
+                        load_start = time.perf_counter()
+                        cached = self._load_cached_file(entry_dir)
+                        
+                        if cached is not None:
+                            self.cache_stats['load_seconds'] += time.perf_counter() - load_start
+                            self.cache_stats['hits'] += 1
+                            logger.info(f"Loaded {file_name} from cache ({len(cached)} patients)")
+                            
+                            for patient_id, glucose_df, insulin_df in cached:
+                                pending.append((file_path, patient_id, (glucose_df, insulin_df)))
+                            continue
+                        
+                        self.cache_stats['misses'] += 1
+                        cache_misses[file_path] = (entry_dir, file_hash)
+                        cache_results[file_path] = []
                     
-                    # Process glucose readings
-                    glucose_df = self.extract_glucose_readings(patient_df, patient_id, weight, file_name)
-                    if glucose_df is not None and not glucose_df.empty:
-                        all_glucose_data.append(glucose_df)
-                        logger.info(f"Extracted {len(glucose_df)} glucose readings for patient {patient_id}")
+                    # Read CSV file
+                    df = self.read_raw_csv(file_path)
                     
-                    # Process insulin doses
-                    insulin_df = self.extract_insulin_doses(patient_df, patient_id, weight, file_name)
-                    if insulin_df is not None and not insulin_df.empty:
-                        all_insulin_data.append(insulin_df)
-                        logger.info(f"Extracted {len(insulin_df)} insulin doses for patient {patient_id}")
+                    # Split patients once rather than re-scanning the file for each patient
+                    for patient_id, patient_df in df.groupby('id', sort=False):
+                        logger.info(f"Processing patient ID: {patient_id} from file {file_name}")
+                        
+                        if executor is None:
+                            result = self.process_patient(patient_df, patient_id, file_name)
+                        else:
+                            result = executor.submit(self.process_patient, patient_df, patient_id, file_name)
+                        
+                        pending.append((file_path, patient_id, result))
+                    
+                except Exception as e:
+                    logger.error(f"Error processing file {file_path}: {str(e)}")
+                    raise
+            
+            # Collect in submission order so parallel output is identical to serial mode
+            for file_path, patient_id, result in pending:
+                try:
+                    glucose_df, insulin_df = result.result() if isinstance(result, Future) else result
+                except Exception as e:
+                    logger.error(f"Error processing file {file_path}: {str(e)}")
+                    raise
                 
-            except Exception as e:
-                logger.error(f"Error processing file {file_path}: {str(e)}")
-                raise
+                if file_path in cache_results:
+                    cache_results[file_path].append((patient_id, glucose_df, insulin_df))
+                
+                if glucose_df is not None and not glucose_df.empty:
+                    all_glucose_data.append(glucose_df)
+                    logger.info(f"Extracted {len(glucose_df)} glucose readings for patient {patient_id}")
+                
+                if insulin_df is not None and not insulin_df.empty:
+                    all_insulin_data.append(insulin_df)
+                    logger.info(f"Extracted {len(insulin_df)} insulin doses for patient {patient_id}")
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+        
+        if self.cache_dir:
+            save_start = time.perf_counter()
+            for file_path, (entry_dir, file_hash) in cache_misses.items():
+                self._save_cached_file(entry_dir, file_path, file_hash, cache_results[file_path])
+            self.cache_stats['save_seconds'] = time.perf_counter() - save_start
+            
+            stats = self.cache_stats
+            stats['process_seconds'] = (time.perf_counter() - start_time - stats['hash_seconds']
+                                        - stats['load_seconds'] - stats['save_seconds'])
+            logger.info(f"Raw file cache: {stats['hits']} hits, {stats['misses']} misses "
+                        f"(hash {stats['hash_seconds']:.2f}s, load {stats['load_seconds']:.2f}s, "
+                        f"process {stats['process_seconds']:.2f}s, save {stats['save_seconds']:.2f}s)")
         
         # Combine all patient data
         if all_glucose_data:
-            combined_glucose = pd.concat(all_glucose_data, ignore_index=True)
+            combined_glucose = self._concat_frames(all_glucose_data, ignore_index=True)
             logger.info(f"Combined glucose data: {len(combined_glucose)} rows")
         else:
             combined_glucose = pd.DataFrame()
             logger.warning("No glucose data extracted")
         
         if all_insulin_data:
-            combined_insulin = pd.concat(all_insulin_data, ignore_index=True)
+            combined_insulin = self._concat_frames(all_insulin_data, ignore_index=True)
             logger.info(f"Combined insulin data: {len(combined_insulin)} rows")
         else:
             combined_insulin = pd.DataFrame()
@@ -172,8 +890,441 @@ class DiabetesDataProcessor:
         
         return combined_glucose, combined_insulin
 
+    def _row_event_times(self, patient_df: pd.DataFrame,
+                         timestamp_cache: Dict[str, pd.Series]) -> pd.Series:
+        """
+        Get the event timestamp of each raw row.
+        
+        Raw exports record one event per row: glucose readings and doses are stamped
+        in 'ts', carb entries in 'ts9' and exercise in the first ts_begin* column.
+        
+        Args:
+            patient_df: DataFrame for a single patient
+            timestamp_cache: Parsed patient columns keyed by column name
+            
+        Returns:
+            Series of event timestamps, NaT for rows without a valid timestamp
+        """
+        exercise_cols = [col for col in patient_df.columns if 'ts_begin' in col.lower()]
+        columns = [col for col in ['ts', 'ts9'] + exercise_cols[:1] if col in patient_df.columns]
+        
+        times = pd.Series(pd.NaT, index=patient_df.index, dtype='datetime64[ns]')
+        for column in columns:
+            times = times.fillna(self._parse_timestamps(patient_df, patient_df, column, timestamp_cache))
+        
+        return times
+    
+    def _incremental_context(self, patient_df: pd.DataFrame, row_times: pd.Series,
+                             context_start: pd.Timestamp) -> pd.Series:
+        """
+        Select the already processed rows needed to extend a patient's features.
+        
+        These are all rows from context_start on, the latest earlier row of each event
+        type (for the as-of lookups) and rows without a valid timestamp (which decide
+        the same extractor branches as in a full run).
+        
+        Args:
+            patient_df: DataFrame for a single patient
+            row_times: Event timestamps from _row_event_times
+            context_start: Start of the look-back context
+            
+        Returns:
+            Boolean mask over patient_df
+        """
+        context = (row_times >= context_start) | row_times.isna()
+        before = row_times < context_start
+        
+        for column in ['value', 'dose', 'carbs', 'intensity']:
+            if column in patient_df.columns:
+                event_rows = before & patient_df[column].notna()
+                if event_rows.any():
+                    context |= event_rows & (row_times == row_times[event_rows].max())
+        
+        return context
+    
+    def _update_stream(self, patient_df: pd.DataFrame, patient_id: int, source_file: str,
+                       state: Optional[Dict], stream_dir: Optional[str]) -> Tuple[Dict, Dict[str, pd.DataFrame]]:
+        """
+        Bring the training rows of one patient in one raw file up to date.
+        
+        Args:
+            patient_df: DataFrame for a single patient
+            patient_id: Patient ID
+            source_file: Source file name for tracking
+            state: Stream state from the previous update, or None to process all rows
+            stream_dir: Directory with the stream's stored training rows
+            
+        Returns:
+            Tuple of (new stream state, dictionary with 'glucose'/'insulin' training rows)
+        """
+        timestamp_cache = {}
+        row_times = self._row_event_times(patient_df, timestamp_cache)
+        weight = patient_df['weight'].iloc[0]
+        
+        stored = {}
+        new_rows = pd.Series(True, index=patient_df.index)
+        tail_start = None
+        
+        if state is not None:
+            watermark = pd.Timestamp(state['watermark'])
+            
+            if (row_times <= watermark).sum() != state['rows_processed']:
+                logger.warning(f"Rows up to {watermark} changed for patient {patient_id} in {source_file}, "
+                               f"reprocessing all rows")
+                state = None
+            else:
+                new_rows = row_times > watermark
+                tail_start = state['glucose_tail_start']
+                try:
+                    for name in ['glucose', 'insulin']:
+                        if state[name]:
+                            stored[name] = load_frame(os.path.join(stream_dir, name))
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Could not load stored rows for patient {patient_id} in {source_file} "
+                                   f"({str(e)}), reprocessing all rows")
+                    state, stored = None, {}
+                    new_rows = pd.Series(True, index=patient_df.index)
+                    tail_start = None
+                
+                if state is not None and not new_rows.any():
+                    return dict(state, status='unchanged'), stored
+        
+        if state is None:
+            glucose_df, insulin_df = self.process_patient(patient_df, patient_id, source_file,
+                                                          weight, timestamp_cache)
+            status = 'rebuilt'
+        else:
+            context = self._incremental_context(patient_df, row_times, pd.Timestamp(state['context_start']))
+            glucose_df, insulin_df = self.process_patient(patient_df[context | new_rows], patient_id,
+                                                          source_file, weight, timestamp_cache)
+            
+            # Keep the new rows plus the old tail rows whose future targets were unknown. The tail
+            # is found by time: row numbers of a patient move when earlier patients in the file grow
+            new_labels = patient_df.index[new_rows]
+            if glucose_df is not None:
+                in_tail = tail_start is not None and glucose_df['timestamp_epoch'] >= tail_start
+                glucose_df = glucose_df[glucose_df.index.isin(new_labels) | in_tail]
+            if insulin_df is not None:
+                insulin_df = insulin_df[insulin_df.index.isin(new_labels)]
+            status = 'appended'
+        
+        glucose_df = glucose_df if glucose_df is not None else pd.DataFrame()
+        insulin_df = insulin_df if insulin_df is not None else pd.DataFrame()
+        
+        datasets = {}
+        if not glucose_df.empty or not insulin_df.empty:
+            datasets = self.create_training_datasets(glucose_df, insulin_df)
+        
+        if 'glucose' in stored and tail_start is not None:
+            stored['glucose'] = stored['glucose'][stored['glucose']['timestamp_epoch'] < tail_start]
+        
+        for name in ['glucose', 'insulin']:
+            parts = [df for df in (stored.get(name), datasets.get(name)) if df is not None and not df.empty]
+            if parts:
+                stored[name] = self._concat_frames(parts)
+            else:
+                stored.pop(name, None)
+        
+        # Carry-over state for the next update
+        watermark = row_times.max()
+        glucose_times = np.sort(row_times[patient_df['value'].notna()].dropna().to_numpy())
+        
+        context_start = watermark - INCREMENTAL_CONTEXT_WINDOW
+        if len(glucose_times) > 0:
+            # The tail's look-back, plus the reading before it that decides duplicates and gaps
+            window_start = pd.Timestamp(glucose_times[-1]) - INCREMENTAL_TAIL_WINDOW
+            lookback = np.searchsorted(glucose_times, (window_start - INCREMENTAL_LOOKBACK_WINDOW).to_datetime64())
+            first_context_reading = pd.Timestamp(glucose_times[max(lookback - 1, 0)])
+            context_start = min(context_start, first_context_reading)
+        
+        # Glucose rows from tail_start on (epoch seconds) are recomputed by the next update
+        if not glucose_df.empty:
+            tail_start = int(glucose_df['timestamp_epoch'].max()
+                             - np.ceil(INCREMENTAL_TAIL_WINDOW.total_seconds()))
+        
+        new_state = {
+            'status': status,
+            'patient_id': int(patient_id),
+            'source_file': source_file,
+            'watermark': watermark.isoformat() if pd.notna(watermark) else None,
+            'rows_processed': int((row_times <= watermark).sum()),
+            'context_start': context_start.isoformat() if pd.notna(context_start) else None,
+            'glucose_tail_start': tail_start,
+            'new_rows': int(new_rows.sum())
+        }
+        
+        return new_state, stored
+    
+    def update_training_datasets(self, file_paths: List[str], state_dir: str) -> Dict[str, pd.DataFrame]:
+        """
+        Incrementally update the training datasets with rows added to the raw files.
+        
+        Each patient in each raw file is a stream with a watermark (latest processed
+        event). Only rows after the watermark and the context they need are processed;
+        the result matches create_training_datasets(*process_csv_files(file_paths)).
+        Streams whose earlier rows changed are reprocessed in full.
+        
+        Args:
+            file_paths: List of paths to CSV files
+            state_dir: Directory holding the stream states and training rows
+            
+        Returns:
+            Dictionary with training datasets
+        """
+        start_time = time.perf_counter()
+        os.makedirs(state_dir, exist_ok=True)
+        manifest_path = os.path.join(state_dir, INCREMENTAL_MANIFEST_FILE)
+        
+        previous = {}
+        generation = 0
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+            
+            if manifest['processor_version'] == PROCESSOR_VERSION:
+                previous = {stream['key']: stream for stream in manifest['streams']}
+                generation = manifest['generation']
+            else:
+                logger.info(f"Incremental state was written by processor version "
+                            f"{manifest['processor_version']}, reprocessing all rows")
+        
+        generation += 1
+        streams = []
+        parts = {'glucose': [], 'insulin': []}
+        counts = {'appended': 0, 'unchanged': 0, 'rebuilt': 0}
+        new_row_count = 0
+        
+        for file_path in file_paths:
+            logger.info(f"Updating from file: {file_path}")
+            file_name = os.path.basename(file_path)
+            df = self.read_raw_csv(file_path)
+            
+            for patient_id, patient_df in df.groupby('id', sort=False):
+                key = f"{file_name}-patient_{int(patient_id)}"
+                state = previous.get(key)
+                
+                # States without a watermark (no valid timestamps) are always reprocessed
+                if state is not None and state['watermark'] is None:
+                    state = None
+                
+                stream_dir = os.path.join(state_dir, state['directory']) if state else None
+                stream, frames = self._update_stream(patient_df, patient_id, file_name, state, stream_dir)
+                
+                stream['key'] = key
+                if stream['status'] != 'unchanged':
+                    stream['directory'] = f"{key}-{generation}"
+                    for name, frame in frames.items():
+                        save_frame(frame, os.path.join(state_dir, stream['directory'], name))
+                
+                stream['glucose'] = 'glucose' in frames
+                stream['insulin'] = 'insulin' in frames
+                counts[stream.pop('status')] += 1
+                new_row_count += stream.pop('new_rows', 0)
+                streams.append(stream)
+                
+                for name, frame in frames.items():
+                    parts[name].append(frame)
+        
+        # The manifest is written last and switches to the new stream directories
+        tmp_path = f"{manifest_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'processor_version': PROCESSOR_VERSION, 'generation': generation, 'streams': streams},
+                      f, indent=2)
+        os.replace(tmp_path, manifest_path)
+        
+        live_dirs = {stream['directory'] for stream in streams}
+        for name in os.listdir(state_dir):
+            if os.path.isdir(os.path.join(state_dir, name)) and name not in live_dirs:
+                shutil.rmtree(os.path.join(state_dir, name), ignore_errors=True)
+        
+        logger.info(f"Incremental update: {counts['appended']} streams appended, {counts['unchanged']} unchanged, "
+                    f"{counts['rebuilt']} reprocessed ({new_row_count} new rows) in "
+                    f"{time.perf_counter() - start_time:.2f}s")
+        
+        datasets = {}
+        for name, frames in parts.items():
+            if frames:
+                datasets[name] = self._concat_frames(frames, ignore_index=True)
+                logger.info(f"Updated {name} training dataset: {len(datasets[name])} rows")
+        
+        return datasets
+
+    def _concat_frames(self, frames: List[pd.DataFrame], ignore_index: bool = False) -> pd.DataFrame:
+        """
+        Concatenate DataFrames, merging the categories of categorical columns.
+        
+        pd.concat falls back to object dtype when categories differ, so columns that
+        are categorical in every frame are re-joined with sorted, merged categories.
+        
+        Args:
+            frames: DataFrames to concatenate (raw file chunks or processed frames)
+            ignore_index: Whether to discard the original index
+            
+        Returns:
+            Combined DataFrame with the dtypes of the inputs
+        """
+        if len(frames) == 1:
+            return frames[0].reset_index(drop=True) if ignore_index else frames[0]
+        
+        combined = pd.concat(frames, ignore_index=ignore_index)
+        for column in frames[0].columns:
+            if all(column in frame.columns and isinstance(frame[column].dtype, pd.CategoricalDtype)
+                   for frame in frames):
+                combined[column] = union_categoricals([frame[column] for frame in frames], sort_categories=True)
+        
+        return combined
+    
+    def _spill_patient_rows(self, buffers: Dict, spool_dir: str) -> None:
+        """
+        Move buffered patient rows to spill files and clear the buffers.
+        
+        Args:
+            buffers: Buffered chunks per patient, as {patient_id: {'chunks': [...], 'parts': [...]}}
+            spool_dir: Directory for spill files
+        """
+        for patient_id, buffer in buffers.items():
+            if buffer['chunks']:
+                part_dir = os.path.join(spool_dir, f"patient_{int(patient_id)}_part_{len(buffer['parts']):05d}")
+                save_frame(self._concat_frames(buffer['chunks']), part_dir)
+                buffer['parts'].append(part_dir)
+                buffer['chunks'] = []
+    
+    def _append_csv(self, df: pd.DataFrame, file_path: str) -> None:
+        """
+        Append rows to a CSV file, writing the header if the file is new.
+        
+        Args:
+            df: Rows to append, with the columns of the file's header in any order
+            file_path: Path to the CSV file
+            
+        Raises:
+            ValueError: If the rows do not have the columns of the header
+        """
+        if os.path.exists(file_path):
+            columns = pd.read_csv(file_path, nrows=0).columns
+            extra = [col for col in df.columns if col not in columns]
+            missing = [col for col in columns if col not in df.columns]
+            if extra or missing:
+                raise ValueError(f"Rows appended to {file_path} do not match its columns "
+                                 f"(extra: {extra}, missing: {missing})")
+            df[columns].to_csv(file_path, mode='a', header=False, index=False)
+        else:
+            df.to_csv(file_path, index=False)
+    
+    def stream_csv_files(self, file_paths: List[str], memory_budget_mb: float = STREAM_MEMORY_BUDGET_MB,
+                         prefix: str = "training") -> Dict[str, str]:
+        """
+        Process raw CSV files in chunks with bounded memory, writing results as patients finish.
+        
+        Each file is read in chunks sized from the memory budget. Rows are buffered per
+        patient and spilled to disk whenever the buffers outgrow half the budget, so a
+        patient split across chunks is reassembled before extraction. Once a file is read,
+        its patients are processed one at a time: the processed glucose/insulin frames are
+        saved under output_dir/patients and the training rows appended to the training CSVs.
+        Peak memory is bounded by the budget plus the largest single patient.
+        
+        Args:
+            file_paths: List of paths to CSV files
+            memory_budget_mb: Memory budget for buffered raw rows in megabytes
+            prefix: Prefix for the training dataset filenames
+            
+        Returns:
+            Dictionary with paths to the saved training datasets
+        """
+        budget_bytes = memory_budget_mb * 1024 * 1024
+        patients_dir = os.path.join(self.output_dir, 'patients')
+        spool_root = os.path.join(self.output_dir, 'spool')
+        os.makedirs(patients_dir, exist_ok=True)
+        
+        # Training rows are appended to partial files that replace the datasets at the end
+        paths = {}
+        for name in ['glucose', 'insulin']:
+            paths[name] = f"{self._dataset_path(name, prefix)}.csv"
+            if os.path.exists(f"{paths[name]}.partial"):
+                os.remove(f"{paths[name]}.partial")
+        
+        written = {'glucose': 0, 'insulin': 0}
+        
+        for file_path in file_paths:
+            logger.info(f"Streaming file: {file_path}")
+            file_name = os.path.basename(file_path)
+            spool_dir = os.path.join(spool_root, file_name)
+            shutil.rmtree(spool_dir, ignore_errors=True)
+            os.makedirs(spool_dir)
+            
+            try:
+                # Size chunks so a chunk takes at most a quarter of the budget
+                sample = self.read_raw_csv(file_path, chunksize=STREAM_SAMPLE_ROWS).get_chunk()
+                row_bytes = max(sample.memory_usage(deep=True).sum() / max(len(sample), 1), 1)
+                chunksize = max(int(budget_bytes / 4 / row_bytes), 1000)
+                logger.info(f"Reading {file_name} in chunks of {chunksize} rows (~{row_bytes:.0f} bytes per row)")
+                
+                # Buffered chunks and spilled parts per patient, in order of first appearance
+                buffers = {}
+                buffered_bytes = 0
+                
+                for chunk in self.read_raw_csv(file_path, chunksize=chunksize):
+                    for patient_id, patient_rows in chunk.groupby('id', sort=False):
+                        buffers.setdefault(patient_id, {'chunks': [], 'parts': []})['chunks'].append(patient_rows)
+                    
+                    buffered_bytes += len(chunk) * row_bytes
+                    if buffered_bytes > budget_bytes / 2:
+                        self._spill_patient_rows(buffers, spool_dir)
+                        buffered_bytes = 0
+                
+                # Every patient of the file is complete once the file has been read
+                for patient_id, buffer in buffers.items():
+                    chunks = [load_frame(part_dir) for part_dir in buffer['parts']] + buffer['chunks']
+                    patient_df = self._concat_frames(chunks)
+                    buffer['chunks'] = []
+                    
+                    patient_bytes = patient_df.memory_usage(deep=True).sum()
+                    if patient_bytes > budget_bytes:
+                        logger.warning(f"Patient {patient_id} in {file_name} needs {patient_bytes / 1024 ** 2:.0f} MB, "
+                                       f"more than the {memory_budget_mb} MB budget")
+                    
+                    logger.info(f"Processing patient ID: {patient_id} from file {file_name}")
+                    glucose_df, insulin_df = self.process_patient(patient_df, patient_id, file_name)
+                    del patient_df, chunks
+                    
+                    patient_dir = os.path.join(patients_dir, f"{file_name}-patient_{int(patient_id)}")
+                    frames = {'glucose': glucose_df, 'insulin': insulin_df}
+                    for name, frame in frames.items():
+                        if frame is not None and not frame.empty:
+                            save_frame(frame, os.path.join(patient_dir, name))
+                            logger.info(f"Extracted {len(frame)} {name} rows for patient {patient_id}")
+                    
+                    datasets = self.create_training_datasets(
+                        glucose_df if glucose_df is not None else pd.DataFrame(),
+                        insulin_df if insulin_df is not None else pd.DataFrame()
+                    )
+                    for name, dataset in datasets.items():
+                        if dataset is not None and not dataset.empty:
+                            self._append_csv(dataset, f"{paths[name]}.partial")
+                            written[name] += len(dataset)
+            except Exception as e:
+                logger.error(f"Error processing file {file_path}: {str(e)}")
+                raise
+            finally:
+                shutil.rmtree(spool_dir, ignore_errors=True)
+        
+        shutil.rmtree(spool_root, ignore_errors=True)
+        
+        for name, count in written.items():
+            if count:
+                os.replace(f"{paths[name]}.partial", paths[name])
+                # A columnar dataset from an earlier run would shadow the new CSV in load_datasets
+                shutil.rmtree(self._dataset_path(name, prefix), ignore_errors=True)
+                logger.info(f"Saved {count} rows of the {name} dataset to {paths[name]}")
+            else:
+                logger.warning(f"No {name} training data extracted")
+                paths.pop(name)
+        
+        return paths
+
     def extract_glucose_readings(self, df: pd.DataFrame, patient_id: int, 
-                                weight: float, source_file: str) -> Optional[pd.DataFrame]:
+                                weight: float, source_file: str,
+                                timestamp_cache: Optional[Dict[str, pd.Series]] = None) -> Optional[pd.DataFrame]:
         """
         Extract glucose readings with time series features.
         
@@ -182,10 +1333,13 @@ class DiabetesDataProcessor:
             patient_id: Patient ID
             weight: Patient weight
             source_file: Source file name for tracking
+            timestamp_cache: Parsed timestamp columns shared across extractors for this patient
         
         Returns:
             DataFrame with processed glucose readings
         """
+        timestamp_cache = {} if timestamp_cache is None else timestamp_cache
+        
         # Filter rows with glucose readings
         glucose_df = df[df['value'].notna()].copy()
         
@@ -195,7 +1349,7 @@ class DiabetesDataProcessor:
         
         # Convert timestamp to datetime
         glucose_df['original_timestamp'] = glucose_df['ts'].copy()
-        glucose_df['timestamp'] = glucose_df['ts'].apply(self.parse_datetime)
+        glucose_df['timestamp'] = self._parse_timestamps(df, glucose_df, 'ts', timestamp_cache)
         
         # Drop rows with invalid timestamps
         valid_rows = glucose_df['timestamp'].notna()
@@ -208,7 +1362,10 @@ class DiabetesDataProcessor:
             return None
         
         # Sort by timestamp
-        glucose_df = glucose_df.sort_values('timestamp')
+        glucose_df = glucose_df.sort_values('timestamp', kind='stable')
+        
+        # Drop duplicate readings and split the stream into gap-free segments
+        glucose_df, segments = self.resample_glucose_readings(glucose_df, patient_id)
         
         # Calculate time differences between readings (in minutes)
         glucose_df['time_diff'] = glucose_df['timestamp'].diff().dt.total_seconds() / 60
@@ -227,65 +1384,73 @@ class DiabetesDataProcessor:
         glucose_df['is_evening'] = ((glucose_df['hour'] >= 18) & (glucose_df['hour'] <= 23)).astype(int)
         glucose_df['is_night'] = ((glucose_df['hour'] >= 0) & (glucose_df['hour'] <= 4)).astype(int)
         
-        # Create lag features for time series analysis
-        for lag in [1, 2, 3, 6, 12]:  # Lags representing 5min, 10min, 15min, 30min, 1hr if readings are 5min apart
-            glucose_df[f'glucose_lag_{lag}'] = glucose_df['value'].shift(lag)
-        
-        # Calculate glucose rate of change (mg/dL per minute)
+        # Create lag features for time series analysis (5min, 10min, 15min, 30min, 1hr back on the grid)
+        values = glucose_df['value'].to_numpy(dtype=np.float64)
+        minutes = self._epoch_seconds(glucose_df['timestamp']) / 60
+        previous = values
+        for lag in GLUCOSE_LAG_STEPS:
+            # Lags before the start of the segment hold the oldest reading available in it
+            lagged = self._grid_values(values, minutes, segments, -lag)
+            previous = np.where(np.isnan(lagged), previous, lagged)
+            glucose_df[f'glucose_lag_{lag}'] = previous
+        
+        # Calculate glucose rate of change (mg/dL per minute), within segments only
         glucose_df['glucose_velocity'] = glucose_df['value'].diff() / glucose_df['time_diff']
-        
-        # Calculate rolling statistics (last 1 hour, assuming 5min readings = 12 points)
-        glucose_df['glucose_rolling_mean'] = glucose_df['value'].rolling(window=12, min_periods=1).mean()
-        glucose_df['glucose_rolling_std'] = glucose_df['value'].rolling(window=12, min_periods=1).std()
-        
-        # Create future glucose values (target for prediction)
-        # 30 minutes ahead (assuming 5min intervals = 6 points ahead)
-        glucose_df['glucose_future_30min'] = glucose_df['value'].shift(-6)
-        
-        # 60 minutes ahead (assuming 5min intervals = 12 points ahead)
-        glucose_df['glucose_future_60min'] = glucose_df['value'].shift(-12)
+        glucose_df.loc[np.diff(segments, prepend=-1) != 0, 'glucose_velocity'] = np.nan
+        
+        # Calculate rolling statistics over the last hour of the segment
+        window_starts = np.maximum(
+            np.searchsorted(minutes, minutes - (GLUCOSE_ROLLING_STEPS - 0.5) * CGM_INTERVAL_MINUTES),
+            np.searchsorted(segments, segments)
+        )
+        rolling_mean, rolling_std = self._rolling_window_stats(glucose_df['value'], window=2 * GLUCOSE_ROLLING_STEPS,
+                                                               starts=window_starts)
+        glucose_df['glucose_rolling_mean'] = rolling_mean
+        glucose_df['glucose_rolling_std'] = rolling_std
+        
+        # Multi-scale trend features: time-window statistics and EWMAs, one pass over the readings
+        trends = glucose_trend_features(self._epoch_seconds(glucose_df['timestamp']), values, segments)
+        glucose_df = glucose_df.assign(**trends)
+        
+        # Create future glucose values (targets for prediction), missing past the end of the segment
+        for target, steps in GLUCOSE_TARGET_STEPS.items():
+            glucose_df[target] = self._grid_values(values, minutes, segments, steps)
+        
+        # Insulin and carb events (epoch seconds, amounts) for the on-board features
+        no_events = (np.zeros(0, dtype=np.int64), np.zeros(0))
+        insulin_events = carb_events = no_events
         
         # Merge with insulin data
         insulin_df = df[df['dose'].notna()].copy()
         if not insulin_df.empty:
-            insulin_df['insulin_timestamp'] = insulin_df['ts'].apply(self.parse_datetime)
+            insulin_df['insulin_timestamp'] = self._parse_timestamps(df, insulin_df, 'ts', timestamp_cache)
             
             # Keep only valid timestamps
             insulin_df = insulin_df[insulin_df['insulin_timestamp'].notna()]
             
             if not insulin_df.empty:
                 # Sort insulin data by timestamp
-                insulin_df = insulin_df.sort_values('insulin_timestamp')
+                insulin_df = insulin_df.sort_values('insulin_timestamp', kind='stable')
                 
                 # For each glucose reading, find the most recent insulin dose
-                prior_insulin_doses = []
-                insulin_carbs = []
-                insulin_times = []
+                idx = self._asof_indices(glucose_df['timestamp'], insulin_df['insulin_timestamp'])
                 
-                for i, row in glucose_df.iterrows():
-                    # Find insulin doses before this glucose reading
-                    prior_insulin = insulin_df[insulin_df['insulin_timestamp'] <= row['timestamp']]
-                    
-                    if not prior_insulin.empty:
-                        # Get the most recent insulin dose
-                        most_recent = prior_insulin.iloc[-1]
-                        prior_insulin_doses.append(most_recent['dose'])
-                        
-                        # Get carb input if available
-                        carb_input = most_recent['bwz_carb_input'] if 'bwz_carb_input' in most_recent and not pd.isna(most_recent['bwz_carb_input']) else 0
-                        insulin_carbs.append(carb_input)
-                        
-                        # Calculate time since insulin dose (in minutes)
-                        time_diff = (row['timestamp'] - most_recent['insulin_timestamp']).total_seconds() / 60
-                        insulin_times.append(time_diff)
-                    else:
-                        prior_insulin_doses.append(0)
-                        insulin_carbs.append(0)
-                        insulin_times.append(np.nan)
+                if 'bwz_carb_input' in insulin_df.columns:
+                    carb_input = insulin_df['bwz_carb_input'].fillna(0)
+                else:
+                    carb_input = pd.Series(0, index=insulin_df.index)
+                
+                prior_insulin_doses = self._asof_values(insulin_df['dose'], idx, 0)
+                insulin_carbs = self._asof_values(carb_input, idx, 0)
+                insulin_times = self._asof_minutes_since(glucose_df['timestamp'], insulin_df['insulin_timestamp'], idx)
                 
                 glucose_df['recent_insulin_dose'] = prior_insulin_doses
                 glucose_df['recent_insulin_carbs'] = insulin_carbs
                 glucose_df['minutes_since_insulin'] = insulin_times
+                
+                insulin_seconds = self._epoch_seconds(insulin_df['insulin_timestamp'])
+                insulin_events = (insulin_seconds, insulin_df['dose'])
+                carb_events = (insulin_seconds, carb_input)
             else:
                 glucose_df['recent_insulin_dose'] = 0
                 glucose_df['recent_insulin_carbs'] = 0
@@ -298,40 +1463,29 @@ class DiabetesDataProcessor:
         # Merge with carb data (if separate from insulin data)
         carb_df = df[df['carbs'].notna()].copy()
         if not carb_df.empty and 'ts9' in carb_df.columns:
-            carb_df['carb_timestamp'] = carb_df['ts9'].apply(self.parse_datetime)
+            carb_df['carb_timestamp'] = self._parse_timestamps(df, carb_df, 'ts9', timestamp_cache)
             
             # Keep only valid timestamps
             carb_df = carb_df[carb_df['carb_timestamp'].notna()]
             
             if not carb_df.empty:
                 # Sort carb data by timestamp
-                carb_df = carb_df.sort_values('carb_timestamp')
+                carb_df = carb_df.sort_values('carb_timestamp', kind='stable')
                 
                 # For each glucose reading, find the most recent carb intake
-                prior_carbs = []
-                carb_times = []
+                idx = self._asof_indices(glucose_df['timestamp'], carb_df['carb_timestamp'])
                 
-                for i, row in glucose_df.iterrows():
-                    # Find carb intakes before this glucose reading
-                    prior_carb_intake = carb_df[carb_df['carb_timestamp'] <= row['timestamp']]
-                    
-                    if not prior_carb_intake.empty:
-                        # Get the most recent carb intake
-                        most_recent = prior_carb_intake.iloc[-1]
-                        prior_carbs.append(most_recent['carbs'])
-                        
-                        # Calculate time since carb intake (in minutes)
-                        time_diff = (row['timestamp'] - most_recent['carb_timestamp']).total_seconds() / 60
-                        carb_times.append(time_diff)
-                    else:
-                        prior_carbs.append(0)
-                        carb_times.append(np.nan)
+                prior_carbs = self._asof_values(carb_df['carbs'], idx, 0)
+                carb_times = self._asof_minutes_since(glucose_df['timestamp'], carb_df['carb_timestamp'], idx)
                 
                 glucose_df['recent_carb_intake'] = prior_carbs
                 glucose_df['minutes_since_carbs'] = carb_times
+                
+                carb_events = (self._epoch_seconds(carb_df['carb_timestamp']), carb_df['carbs'])
             else:
                 glucose_df['recent_carb_intake'] = 0
                 glucose_df['minutes_since_carbs'] = np.nan
+                carb_events = no_events
         else:
             # If no separate carb data, use the carbs from insulin data
             glucose_df['recent_carb_intake'] = glucose_df['recent_insulin_carbs']
@@ -347,44 +1501,22 @@ class DiabetesDataProcessor:
             if timestamp_cols:
                 # Use the first available timestamp column
                 ts_col = timestamp_cols[0]
-                exercise_df['exercise_timestamp'] = exercise_df[ts_col].apply(self.parse_datetime)
+                exercise_df['exercise_timestamp'] = self._parse_timestamps(df, exercise_df, ts_col, timestamp_cache)
                 
                 # Keep only valid timestamps
                 exercise_df = exercise_df[exercise_df['exercise_timestamp'].notna()]
                 
                 if not exercise_df.empty:
                     # Sort exercise data by timestamp
-                    exercise_df = exercise_df.sort_values('exercise_timestamp')
+                    exercise_df = exercise_df.sort_values('exercise_timestamp', kind='stable')
                     
-                    # For each glucose reading, find the most recent exercise
-                    prior_exercise_intensity = []
-                    prior_exercise_duration = []
-                    exercise_times = []
+                    # For each glucose reading, find the most recent exercise (within 12 hours)
+                    idx = self._asof_indices(glucose_df['timestamp'], exercise_df['exercise_timestamp'],
+                                             tolerance=timedelta(hours=12))
                     
-                    for i, row in glucose_df.iterrows():
-                        # Find exercise before this glucose reading (within 12 hours)
-                        twelve_hours_ago = row['timestamp'] - timedelta(hours=12)
-                        recent_exercise = exercise_df[
-                            (exercise_df['exercise_timestamp'] <= row['timestamp']) & 
-                            (exercise_df['exercise_timestamp'] >= twelve_hours_ago)
-                        ]
-                        
-                        if not recent_exercise.empty:
-                            # Get the most recent exercise
-                            most_recent = recent_exercise.iloc[-1]
-                            prior_exercise_intensity.append(most_recent['intensity'])
-                            
-                            # Get duration if available
-                            duration = most_recent['duration'] if 'duration' in most_recent and not pd.isna(most_recent['duration']) else 0
-                            prior_exercise_duration.append(duration)
-                            
-                            # Calculate time since exercise (in minutes)
-                            time_diff = (row['timestamp'] - most_recent['exercise_timestamp']).total_seconds() / 60
-                            exercise_times.append(time_diff)
-                        else:
-                            prior_exercise_intensity.append(0)
-                            prior_exercise_duration.append(0)
-                            exercise_times.append(np.nan)
+                    prior_exercise_intensity = self._asof_values(exercise_df['intensity'], idx, 0)
+                    prior_exercise_duration = self._asof_values(exercise_df['duration'].fillna(0), idx, 0)
+                    exercise_times = self._asof_minutes_since(glucose_df['timestamp'], exercise_df['exercise_timestamp'], idx)
                     
                     glucose_df['recent_exercise_intensity'] = prior_exercise_intensity
                     glucose_df['recent_exercise_duration'] = prior_exercise_duration
@@ -402,6 +1534,13 @@ class DiabetesDataProcessor:
             glucose_df['recent_exercise_duration'] = 0
             glucose_df['minutes_since_exercise'] = np.nan
         
+        # Active and on-board insulin and carbs, summed over every prior event (stacked boluses and meals)
+        glucose_seconds = self._epoch_seconds(glucose_df['timestamp'])
+        glucose_df['active_insulin'] = events_on_board(*insulin_events, glucose_seconds, INSULIN_ACTIVITY_KERNEL)
+        glucose_df['insulin_on_board'] = events_on_board(*insulin_events, glucose_seconds, INSULIN_ON_BOARD_KERNEL)
+        glucose_df['active_carbs'] = events_on_board(*carb_events, glucose_seconds, CARB_ACTIVITY_KERNEL)
+        glucose_df['carbs_on_board'] = events_on_board(*carb_events, glucose_seconds, CARBS_ON_BOARD_KERNEL)
+        
         # Fill missing values with appropriate strategies
         glucose_df['recent_insulin_dose'] = glucose_df['recent_insulin_dose'].fillna(0)
         glucose_df['recent_carb_intake'] = glucose_df['recent_carb_intake'].fillna(0)
@@ -413,10 +1552,6 @@ class DiabetesDataProcessor:
         glucose_df['minutes_since_carbs'] = glucose_df['minutes_since_carbs'].fillna(1440)
         glucose_df['minutes_since_exercise'] = glucose_df['minutes_since_exercise'].fillna(1440)
         
-        # Fill missing lag values with forward fill then backward fill
-        lag_columns = [col for col in glucose_df.columns if 'lag' in col]
-        glucose_df[lag_columns] = glucose_df[lag_columns].fillna(method='ffill').fillna(method='bfill')
-        
         # Add patient info and source tracking
         glucose_df['patient_id'] = patient_id
         glucose_df['weight'] = weight
@@ -428,13 +1563,14 @@ class DiabetesDataProcessor:
         # Calculate insulin-to-carb ratio (ICR)
         glucose_df['insulin_to_carb_ratio'] = 500 / (glucose_df['weight'] * 0.453592)
         
-        # Add timestamp string for model output
-        glucose_df['timestamp_str'] = glucose_df['timestamp'].dt.strftime('%Y-%m-%d %H:%M:%S')
+        # Add epoch timestamp for model output
+        glucose_df['timestamp_epoch'] = self._epoch_seconds(glucose_df['timestamp'])
         
-        return glucose_df
+        return self.apply_dtype_policy(glucose_df)
 
     def extract_insulin_doses(self, df: pd.DataFrame, patient_id: int, 
-                             weight: float, source_file: str) -> Optional[pd.DataFrame]:
+                             weight: float, source_file: str,
+                             timestamp_cache: Optional[Dict[str, pd.Series]] = None) -> Optional[pd.DataFrame]:
         """
         Extract insulin doses with time series features.
         
@@ -443,10 +1579,13 @@ class DiabetesDataProcessor:
             patient_id: Patient ID
             weight: Patient weight
             source_file: Source file name for tracking
+            timestamp_cache: Parsed timestamp columns shared across extractors for this patient
         
         Returns:
             DataFrame with processed insulin doses
         """
+        timestamp_cache = {} if timestamp_cache is None else timestamp_cache
+        
         # Filter rows with insulin doses
         insulin_df = df[df['dose'].notna()].copy()
         
@@ -461,7 +1600,7 @@ class DiabetesDataProcessor:
         for field in timestamp_fields:
             if insulin_df[field].notna().any():
                 insulin_df['original_timestamp'] = insulin_df[field]
-                insulin_df['timestamp'] = insulin_df[field].apply(self.parse_datetime)
+                insulin_df['timestamp'] = self._parse_timestamps(df, insulin_df, field, timestamp_cache)
                 valid_timestamp = True
                 logger.info(f"Using timestamp field {field} for insulin data")
                 break
@@ -481,7 +1620,7 @@ class DiabetesDataProcessor:
             return None
         
         # Sort by timestamp
-        insulin_df = insulin_df.sort_values('timestamp')
+        insulin_df = insulin_df.sort_values('timestamp', kind='stable')
         
         # Calculate time differences between doses (in hours)
         insulin_df['time_diff_hours'] = insulin_df['timestamp'].diff().dt.total_seconds() / 3600
@@ -513,72 +1652,30 @@ class DiabetesDataProcessor:
         insulin_df['hours_since_last_insulin'] = insulin_df['time_diff_hours']
         
         # Calculate daily total insulin (rolling 24h window)
-        insulin_df = insulin_df.sort_values('timestamp')
-        
-        # Initialize daily totals
-        daily_totals = []
-        
-        for i, row in insulin_df.iterrows():
-            current_time = row['timestamp']
-            past_24h = current_time - timedelta(hours=24)
-            
-            # Find doses in the past 24 hours
-            past_doses = insulin_df[
-                (insulin_df['timestamp'] < current_time) &
-                (insulin_df['timestamp'] >= past_24h)
-            ]
-            
-            if not past_doses.empty:
-                daily_totals.append(past_doses['dose'].sum())
-            else:
-                daily_totals.append(0)
+        insulin_df = insulin_df.sort_values('timestamp', kind='stable')
         
-        insulin_df['total_insulin_past_24h'] = daily_totals
+        insulin_df['total_insulin_past_24h'] = self._rolling_dose_total(insulin_df['timestamp'], insulin_df['dose'])
         
         # Get glucose reading prior to insulin dose
         glucose_df = df[df['value'].notna()].copy()
         
         if not glucose_df.empty:
-            glucose_df['glucose_timestamp'] = glucose_df['ts'].apply(self.parse_datetime)
+            glucose_df['glucose_timestamp'] = self._parse_timestamps(df, glucose_df, 'ts', timestamp_cache)
             glucose_df = glucose_df[glucose_df['glucose_timestamp'].notna()]
             
             if not glucose_df.empty:
-                glucose_df = glucose_df.sort_values('glucose_timestamp')
+                glucose_df = glucose_df.sort_values('glucose_timestamp', kind='stable')
                 
-                # For each insulin dose, find the most recent glucose reading
-                prior_glucose_values = []
-                glucose_times = []
+                # For each insulin dose, find the most recent glucose reading within 30 minutes
+                idx = self._asof_indices(insulin_df['timestamp'], glucose_df['glucose_timestamp'],
+                                         tolerance=timedelta(minutes=30))
                 
-                for i, row in insulin_df.iterrows():
-                    # Find glucose readings before this insulin dose (within 30 minutes)
-                    thirty_min_ago = row['timestamp'] - timedelta(minutes=30)
-                    recent_glucose = glucose_df[
-                        (glucose_df['glucose_timestamp'] <= row['timestamp']) & 
-                        (glucose_df['glucose_timestamp'] >= thirty_min_ago)
-                    ]
-                    
-                    if not recent_glucose.empty:
-                        # Get the most recent glucose reading
-                        most_recent = recent_glucose.iloc[-1]
-                        prior_glucose_values.append(most_recent['value'])
-                        
-                        # Calculate time since glucose reading (in minutes)
-                        time_diff = (row['timestamp'] - most_recent['glucose_timestamp']).total_seconds() / 60
-                        glucose_times.append(time_diff)
-                    else:
-                        # Look for any glucose reading before this insulin dose
-                        earlier_glucose = glucose_df[glucose_df['glucose_timestamp'] <= row['timestamp']]
-                        
-                        if not earlier_glucose.empty:
-                            most_recent = earlier_glucose.iloc[-1]
-                            prior_glucose_values.append(most_recent['value'])
-                            
-                            # Calculate time since glucose reading (in minutes)
-                            time_diff = (row['timestamp'] - most_recent['glucose_timestamp']).total_seconds() / 60
-                            glucose_times.append(time_diff)
-                        else:
-                            prior_glucose_values.append(np.nan)
-                            glucose_times.append(np.nan)
+                # Otherwise fall back to any glucose reading before this insulin dose
+                earlier_idx = self._asof_indices(insulin_df['timestamp'], glucose_df['glucose_timestamp'])
+                idx = np.where(idx >= 0, idx, earlier_idx)
+                
+                prior_glucose_values = self._asof_values(glucose_df['value'], idx, np.nan)
+                glucose_times = self._asof_minutes_since(insulin_df['timestamp'], glucose_df['glucose_timestamp'], idx)
                 
                 insulin_df['blood_glucose'] = prior_glucose_values
                 insulin_df['minutes_since_glucose'] = glucose_times
@@ -599,44 +1696,22 @@ class DiabetesDataProcessor:
             if timestamp_cols:
                 # Use the first available timestamp column
                 ts_col = timestamp_cols[0]
-                exercise_df['exercise_timestamp'] = exercise_df[ts_col].apply(self.parse_datetime)
+                exercise_df['exercise_timestamp'] = self._parse_timestamps(df, exercise_df, ts_col, timestamp_cache)
                 
                 # Keep only valid timestamps
                 exercise_df = exercise_df[exercise_df['exercise_timestamp'].notna()]
                 
                 if not exercise_df.empty:
                     # Sort exercise data by timestamp
-                    exercise_df = exercise_df.sort_values('exercise_timestamp')
+                    exercise_df = exercise_df.sort_values('exercise_timestamp', kind='stable')
                     
-                    # For each insulin dose, find the most recent exercise
-                    prior_exercise_intensity = []
-                    prior_exercise_duration = []
-                    exercise_times = []
+                    # For each insulin dose, find the most recent exercise (within 6 hours)
+                    idx = self._asof_indices(insulin_df['timestamp'], exercise_df['exercise_timestamp'],
+                                             tolerance=timedelta(hours=6))
                     
-                    for i, row in insulin_df.iterrows():
-                        # Find exercise before this insulin dose (within 6 hours)
-                        six_hours_ago = row['timestamp'] - timedelta(hours=6)
-                        recent_exercise = exercise_df[
-                            (exercise_df['exercise_timestamp'] <= row['timestamp']) & 
-                            (exercise_df['exercise_timestamp'] >= six_hours_ago)
-                        ]
-                        
-                        if not recent_exercise.empty:
-                            # Get the most recent exercise
-                            most_recent = recent_exercise.iloc[-1]
-                            prior_exercise_intensity.append(most_recent['intensity'])
-                            
-                            # Get duration if available
-                            duration = most_recent['duration'] if 'duration' in most_recent and not pd.isna(most_recent['duration']) else 0
-                            prior_exercise_duration.append(duration)
-                            
-                            # Calculate time since exercise (in minutes)
-                            time_diff = (row['timestamp'] - most_recent['exercise_timestamp']).total_seconds() / 60
-                            exercise_times.append(time_diff)
-                        else:
-                            prior_exercise_intensity.append(0)
-                            prior_exercise_duration.append(0)
-                            exercise_times.append(np.nan)
+                    prior_exercise_intensity = self._asof_values(exercise_df['intensity'], idx, 0)
+                    prior_exercise_duration = self._asof_values(exercise_df['duration'].fillna(0), idx, 0)
+                    exercise_times = self._asof_minutes_since(insulin_df['timestamp'], exercise_df['exercise_timestamp'], idx)
                     
                     insulin_df['exercise_intensity'] = prior_exercise_intensity
                     insulin_df['exercise_duration'] = prior_exercise_duration
@@ -696,27 +1771,100 @@ class DiabetesDataProcessor:
             insulin_df['carb_insulin']
         ) * insulin_df['exercise_recency_factor']
         
-        # Calculate insulin on board (IOB) based on previous dose and time elapsed
-        insulin_df['insulin_on_board'] = 0.0
-        for i, row in insulin_df.iterrows():
-            hours_since = row['hours_since_last_insulin']
-            prev_dose = row['previous_insulin_dose']
-            
-            if not pd.isna(hours_since) and not pd.isna(prev_dose) and hours_since < 4:
-                # Simple IOB calculation assuming linear decay over 4 hours
-                iob_factor = max(0, 1 - (hours_since / 4))
-                insulin_df.at[i, 'insulin_on_board'] = prev_dose * iob_factor
+        # Calculate insulin on board (IOB) from every earlier dose
+        dose_seconds = self._epoch_seconds(insulin_df['timestamp'])
+        insulin_df['insulin_on_board'] = events_on_board(dose_seconds, insulin_df['dose'], dose_seconds,
+                                                         INSULIN_ON_BOARD_KERNEL, exclusive=True)
         
         # Add patient info and source tracking
         insulin_df['patient_id'] = patient_id
         insulin_df['weight'] = weight
         insulin_df['source_file'] = source_file
         
-        # Add timestamp string for model output
-        insulin_df['timestamp_str'] = insulin_df['timestamp'].dt.strftime('%Y-%m-%d %H:%M:%S')
+        # Add epoch timestamp for model output
+        insulin_df['timestamp_epoch'] = self._epoch_seconds(insulin_df['timestamp'])
         
-        return insulin_df
+        return self.apply_dtype_policy(insulin_df)
 
+    def _epoch_seconds(self, timestamps: pd.Series) -> np.ndarray:
+        """
+        Convert timestamps to integer seconds since the Unix epoch.
+        
+        Args:
+            timestamps: Series of timestamps
+            
+        Returns:
+            Array of int64 epoch seconds
+        """
+        return timestamps.to_numpy(dtype='datetime64[ns]').astype('datetime64[s]').astype(np.int64)
+    
+    def apply_dtype_policy(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Convert a processed frame or training dataset to compact dtypes.
+        
+        Flags become int8, calendar fields uint8, patient and source identifiers
+        categories, and other float64/int64 measurements float32. Epoch timestamps
+        and columns already using compact or nullable dtypes are left unchanged.
+        This is a storage dtype: the models cast their features back to float64, the
+        dtype of served rows, before fitting (see extract_features_and_target).
+        
+        Args:
+            df: DataFrame to convert
+            
+        Returns:
+            DataFrame with compact dtypes
+        """
+        dtypes = {}
+        
+        for column in df.columns:
+            dtype = df[column].dtype
+            
+            if column in DTYPE_EXACT_COLUMNS:
+                continue
+            elif column in DTYPE_FLAG_COLUMNS:
+                dtypes[column] = 'int8'
+            elif column in DTYPE_CALENDAR_COLUMNS:
+                dtypes[column] = 'uint8'
+            elif column in DTYPE_CATEGORY_COLUMNS:
+                dtypes[column] = 'category'
+            elif dtype in (np.float64, np.int64):
+                dtypes[column] = 'float32'
+        
+        return df.astype(dtypes)
+    
+    def memory_report(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Report the memory used by each column of a DataFrame.
+        
+        Args:
+            df: DataFrame to inspect
+            
+        Returns:
+            DataFrame with dtype, bytes and share of the total per column, largest first
+        """
+        usage = df.memory_usage(index=False, deep=True)
+        
+        report = pd.DataFrame({
+            'dtype': df.dtypes.astype(str),
+            'bytes': usage,
+            'share': usage / max(usage.sum(), 1)
+        })
+        
+        return report.sort_values('bytes', ascending=False)
+    
+    def _fill_missing(self, df: pd.DataFrame, value: float = 0) -> pd.DataFrame:
+        """
+        Fill missing values in all non-categorical columns.
+        
+        Args:
+            df: DataFrame to fill
+            value: Fill value
+            
+        Returns:
+            Filled DataFrame
+        """
+        return df.fillna({col: value for col in df.columns if not isinstance(df[col].dtype, pd.CategoricalDtype)})
+    
     def create_training_datasets(self, glucose_df: pd.DataFrame, insulin_df: pd.DataFrame) -> Dict[str, pd.DataFrame]:
         """
         Create training datasets for glucose and insulin prediction models.
@@ -734,17 +1882,8 @@ class DiabetesDataProcessor:
         if not glucose_df.empty:
             logger.info("Creating glucose prediction training dataset")
             
-            # Select features for glucose prediction
-            glucose_features = [
-                'patient_id', 'weight', 'hour', 'day_of_week', 'is_morning', 
-                'is_afternoon', 'is_evening', 'is_night', 'value', 'glucose_lag_1', 
-                'glucose_lag_2', 'glucose_lag_3', 'glucose_velocity', 
-                'glucose_rolling_mean', 'glucose_rolling_std', 'recent_insulin_dose',
-                'minutes_since_insulin', 'recent_carb_intake', 'minutes_since_carbs',
-                'recent_exercise_intensity', 'recent_exercise_duration', 
-                'minutes_since_exercise', 'insulin_sensitivity_factor',
-                'insulin_to_carb_ratio', 'timestamp_str'
-            ]
+            # Select the features declared for glucose prediction (see feature_spec.py)
+            glucose_features = ['patient_id'] + GLUCOSE_FEATURE_SPEC.source_columns() + ['timestamp_epoch']
             
             # Target variables
             target_vars = ['glucose_future_30min', 'glucose_future_60min']
@@ -753,7 +1892,7 @@ class DiabetesDataProcessor:
             available_columns = [col for col in glucose_features + target_vars if col in glucose_df.columns]
             
             # Check if we have the minimum required columns
-            required_cols = ['value', 'timestamp_str']
+            required_cols = ['value', 'timestamp_epoch']
             missing_cols = [col for col in required_cols if col not in available_columns]
             
             if missing_cols:
@@ -763,50 +1902,22 @@ class DiabetesDataProcessor:
                 # Create training dataset
                 glucose_train_df = glucose_df[available_columns].copy()
                 
-                # Rename 'value' to 'current_glucose' for clarity
-                glucose_train_df = glucose_train_df.rename(columns={'value': 'current_glucose'})
+                # Rename source columns to feature names ('value' to 'current_glucose')
+                glucose_train_df = glucose_train_df.rename(columns=GLUCOSE_FEATURE_SPEC.source_renames())
                 
                 # Drop rows with NaN in target variables
                 target_vars_available = [col for col in target_vars if col in glucose_train_df.columns]
                 if target_vars_available:
+                    rows_before = len(glucose_train_df)
                     glucose_train_df = glucose_train_df.dropna(subset=target_vars_available)
+                    logger.info(f"Dropped {rows_before - len(glucose_train_df)} glucose rows without a reading "
+                                f"on the target grid slots")
                 
                 # Fill remaining NaN values
-                glucose_train_df = glucose_train_df.fillna(0)
-                
-                # Additional feature engineering
-                if 'recent_insulin_dose' in glucose_train_df.columns and 'minutes_since_insulin' in glucose_train_df.columns:
-                    # Calculate insulin activity curve (biexponential model)
-                    def insulin_activity(mins, peak_time=75):
-                        if pd.isna(mins) or mins <= 0:
-                            return 0
-                        # Approximate activity curve
-                        if mins < peak_time:
-                            return (mins / peak_time) * np.exp(-(mins - peak_time) / 50)
-                        else:
-                            return np.exp(-(mins - peak_time) / 50)
-                    
-                    glucose_train_df['insulin_activity'] = glucose_train_df['minutes_since_insulin'].apply(insulin_activity)
-                    glucose_train_df['active_insulin'] = glucose_train_df['recent_insulin_dose'] * glucose_train_df['insulin_activity']
-                
-                if 'recent_carb_intake' in glucose_train_df.columns and 'minutes_since_carbs' in glucose_train_df.columns:
-                    # Calculate carb activity curve
-                    def carb_activity(mins):
-                        if pd.isna(mins) or mins <= 0:
-                            return 0
-                        # Approximate carb absorption curve
-                        if mins < 30:
-                            return mins / 30
-                        elif mins < 180:
-                            return np.exp(-(mins - 30) / 150)
-                        else:
-                            return 0
-                    
-                    glucose_train_df['carb_activity'] = glucose_train_df['minutes_since_carbs'].apply(carb_activity)
-                    glucose_train_df['active_carbs'] = glucose_train_df['recent_carb_intake'] * glucose_train_df['carb_activity']
+                glucose_train_df = self._fill_missing(glucose_train_df)
                 
                 # Save the training dataset
-                datasets['glucose'] = glucose_train_df
+                datasets['glucose'] = self.apply_dtype_policy(glucose_train_df)
                 logger.info(f"Created glucose training dataset with {len(glucose_train_df)} rows and {len(glucose_train_df.columns)} features")
         else:
             logger.warning("No glucose data available for training dataset creation")
@@ -815,15 +1926,11 @@ class DiabetesDataProcessor:
         if not insulin_df.empty:
             logger.info("Creating insulin prediction training dataset")
             
-            # Select features for insulin prediction
-            insulin_features = [
-                'patient_id', 'weight', 'hour', 'day_of_week', 'is_morning', 
-                'is_afternoon', 'is_evening', 'is_night', 'blood_glucose', 
-                'meal_carbs', 'exercise_intensity', 'exercise_duration',
-                'minutes_since_exercise', 'insulin_sensitivity_factor',
-                'insulin_to_carb_ratio', 'glucose_correction', 'carb_insulin',
-                'exercise_factor', 'exercise_recency_factor', 'insulin_on_board',
-                'previous_insulin_dose', 'timestamp_str'
+            # Select the features declared for insulin prediction (see feature_spec.py),
+            # plus the dose components kept for evaluation
+            insulin_features = ['patient_id'] + INSULIN_FEATURE_SPEC.source_columns() + [
+                'exercise_intensity', 'minutes_since_exercise', 'glucose_correction', 'carb_insulin',
+                'exercise_factor', 'exercise_recency_factor', 'insulin_on_board', 'timestamp_epoch'
             ]
             
             # Target variable
@@ -833,7 +1940,7 @@ class DiabetesDataProcessor:
             available_columns = [col for col in insulin_features if col in insulin_df.columns] + [target_var]
             
             # Check if we have the minimum required columns
-            required_cols = ['blood_glucose', 'meal_carbs', target_var, 'timestamp_str']
+            required_cols = ['blood_glucose', 'meal_carbs', target_var, 'timestamp_epoch']
             missing_cols = [col for col in required_cols if col not in available_columns]
             
             if missing_cols:
@@ -846,373 +1953,315 @@ class DiabetesDataProcessor:
                 # Rename columns for clarity
                 insulin_train_df = insulin_train_df.rename(columns={
                     target_var: 'insulin_dosage',
-                    'meal_carbs': 'carb_intake',
-                    'exercise_duration': 'exercise_time'
+                    **INSULIN_FEATURE_SPEC.source_renames()
                 })
                 
                 # Fill missing values
-                insulin_train_df = insulin_train_df.fillna(0)
+                insulin_train_df = self._fill_missing(insulin_train_df)
                 
                 # Save the training dataset
-                datasets['insulin'] = insulin_train_df
+                datasets['insulin'] = self.apply_dtype_policy(insulin_train_df)
                 logger.info(f"Created insulin training dataset with {len(insulin_train_df)} rows and {len(insulin_train_df.columns)} features")
         else:
             logger.warning("No insulin data available for training dataset creation")
         
         return datasets
     
-    def save_datasets(self, datasets: Dict[str, pd.DataFrame], prefix: str = "") -> Dict[str, str]:
+    def _dataset_path(self, name: str, prefix: str = "") -> str:
+        """Path of a dataset without extension (the columnar directory; CSVs add '.csv')."""
+        filename = f"{prefix}_{name}_data" if prefix else f"{name}_data"
+        return os.path.join(self.output_dir, filename)
+    
+    def save_datasets(self, datasets: Dict[str, pd.DataFrame], prefix: str = "",
+                      formats: Optional[List[str]] = None) -> Dict[str, str]:
         """
-        Save datasets to CSV files.
+        Save datasets in the columnar format and/or as CSV files.
         
         Args:
             datasets: Dictionary with datasets to save
             prefix: Prefix for filenames
+            formats: Formats to write from DATASET_FORMATS (default: columnar only)
             
         Returns:
-            Dictionary with paths to saved files
+            Dictionary with paths to saved datasets (the first format's path per dataset)
         """
+        formats = formats or ['columnar']
+        unknown = [fmt for fmt in formats if fmt not in DATASET_FORMATS]
+        if unknown:
+            logger.error(f"Unknown dataset formats: {unknown}")
+            raise ValueError(f"Unknown dataset formats: {unknown}. Use one of {DATASET_FORMATS}")
+        
         paths = {}
         
         for name, df in datasets.items():
             if df is not None and not df.empty:
                 # Create directory if it doesn't exist
                 os.makedirs(self.output_dir, exist_ok=True)
+                base_path = self._dataset_path(name, prefix)
                 
-                # Create filename
-                filename = f"{prefix}_{name}_data.csv" if prefix else f"{name}_data.csv"
-                file_path = os.path.join(self.output_dir, filename)
-                
-                # Save to CSV
-                df.to_csv(file_path, index=False)
-                paths[name] = file_path
-                logger.info(f"Saved {name} dataset to {file_path}")
+                for fmt in formats:
+                    if fmt == 'columnar':
+                        save_frame(df, base_path)
+                        file_path = base_path
+                    else:
+                        file_path = f"{base_path}.csv"
+                        df.to_csv(file_path, index=False)
+                    
+                    paths.setdefault(name, file_path)
+                    logger.info(f"Saved {name} dataset to {file_path}")
         
         return paths
     
-    def create_example_dataset(self) -> Dict[str, pd.DataFrame]:
+    def load_datasets(self, prefix: str = "", mmap: bool = True) -> Dict[str, pd.DataFrame]:
         """
-        Create an example dataset for testing when real data is not available.
+        Load datasets written by save_datasets or stream_csv_files.
         
+        The columnar format is preferred and memory-mapped, so numeric columns are
+        paged in from disk as they are used instead of being parsed. CSV files are
+        read when there is no columnar dataset (e.g. after stream_csv_files).
+        
+        Args:
+            prefix: Prefix for filenames
+            mmap: Memory-map numeric columns of columnar datasets
+            
         Returns:
-            Dictionary with example datasets
+            Dictionary with the datasets found
         """
-        logger.info("Creating example datasets")
+        datasets = {}
         
-        # Set random seed for reproducibility
-        np.random.seed(42)
-        
-        # Create example glucose dataset
-        glucose_data = []
-        
-        # Create timestamps with 5-minute intervals
-        start_date = datetime(2023, 1, 1, 0, 0)
-        timestamps = [start_date + timedelta(minutes=5*i) for i in range(1000)]
-        
-        # Generate glucose values with realistic patterns
-        base_glucose = 120
-        for i, ts in enumerate(timestamps):
-            # Time of day variations
-            hour = ts.hour
-            
-            # Morning rise (dawn phenomenon)
-            if 4 <= hour < 8:
-                time_factor = 30
-            # Post-meal rises
-            elif 8 <= hour < 10 or 13 <= hour < 15 or 19 <= hour < 21:
-                time_factor = 40
-            # Late night
-            elif 0 <= hour < 4:
-                time_factor = -10
-            else:
-                time_factor = 0
+        for name in ['glucose', 'insulin']:
+            base_path = self._dataset_path(name, prefix)
+            csv_path = f"{base_path}.csv"
             
-            # Random variations
-            random_var = np.random.normal(0, 15)
+            if os.path.exists(os.path.join(base_path, SCHEMA_FILE)):
+                datasets[name] = load_frame(base_path, mmap=mmap)
+                logger.info(f"Loaded {name} dataset from {base_path} ({len(datasets[name])} rows)")
+            elif os.path.exists(csv_path):
+                datasets[name] = pd.read_csv(csv_path)
+                logger.info(f"Loaded {name} dataset from {csv_path} ({len(datasets[name])} rows)")
+        
+        return datasets
+    
+    def generate_synthetic_cohort(self, n_patients: int = 1, days: float = 7, interval_minutes: int = 5,
+                                  meals_per_day: int = 3, exercise_per_week: float = 3,
+                                  corrections_per_day: float = 1, seed: int = 42,
+                                  first_patient_id: int = 1) -> pd.DataFrame:
+        """
+        Generate raw CGM/pump exports for a synthetic cohort of patients.
+        
+        Glucose follows a per-patient baseline with a dawn rise, smooth drift and sensor
+        noise, plus responses to meals, boluses and exercise obtained by convolving the
+        events with the carb and insulin activity curves. Meal boluses follow the patient's
+        carb ratio plus a correction from the glucose at the meal; extra corrections are
+        given when glucose is above target. Everything is computed on arrays over all
+        patients at once.
+        
+        The result has the raw export schema read by process_csv_files (glucose rows in
+        ts/value, boluses in ts/dose/bwz_carb_input, carb entries in ts9/carbs, exercise
+        in ts_begin/intensity/duration), with the dtypes of RAW_CSV_SCHEMA.
+        
+        Args:
+            n_patients: Number of patients
+            days: Days of data per patient
+            interval_minutes: CGM sampling interval in minutes
+            meals_per_day: Meals per day, spread between 07:30 and 18:30
+            exercise_per_week: Average exercise sessions per week
+            corrections_per_day: Average correction bolus opportunities per day
+            seed: Random seed
+            first_patient_id: ID of the first patient
             
-            # Trend components
-            trend = 5 * np.sin(i / 100)
+        Returns:
+            DataFrame of raw rows, grouped by patient
+        """
+        steps = int(days * 1440 // interval_minutes)
+        if n_patients < 1 or steps < 1:
+            logger.error(f"Invalid synthetic cohort size: {n_patients} patients, {days} days")
+            raise ValueError(f"Synthetic cohort needs at least one patient and one reading, "
+                             f"got {n_patients} patients and {days} days")
+        
+        rng = np.random.default_rng(seed)
+        span_minutes = steps * interval_minutes
+        n_days = int(np.ceil(days))
+        patients = np.arange(n_patients)
+        
+        # Patient parameters, with ISF and carb ratio from the usual 1800/500 rules
+        weight = rng.integers(55, 111, n_patients).astype(float)
+        total_daily_insulin = weight * 0.55
+        sensitivity = 1800 / total_daily_insulin
+        carb_ratio = 500 / total_daily_insulin
+        baseline = rng.normal(125, 15, n_patients)
+        insulin_types = np.array(SYNTHETIC_INSULIN_TYPES, dtype=object)[
+            rng.integers(0, len(SYNTHETIC_INSULIN_TYPES), n_patients)]
+        
+        # CGM grid in minutes since SYNTHETIC_START, offset per patient
+        grid = rng.integers(0, interval_minutes, n_patients)[:, None] + np.arange(steps)[None, :] * interval_minutes
+        hour = (grid % 1440) / 60
+        
+        # Meals at jittered times around evenly spread meal hours
+        meal_hours = np.linspace(7.5, 18.5, meals_per_day)
+        meal_minutes = (np.arange(n_days)[None, :, None] * 1440 + meal_hours[None, None, :] * 60
+                        + rng.normal(0, 30, (n_patients, n_days, meals_per_day)))
+        meal_patient = np.broadcast_to(patients[:, None, None], meal_minutes.shape).ravel()
+        meal_minutes = np.round(meal_minutes.ravel())
+        in_range = (meal_minutes >= 0) & (meal_minutes < span_minutes)
+        meal_patient, meal_minutes = meal_patient[in_range], meal_minutes[in_range]
+        meal_hour = (meal_minutes % 1440) / 60
+        meal_carbs = np.select([meal_hour < 11, meal_hour < 16],
+                               [rng.integers(30, 60, len(meal_minutes)), rng.integers(45, 75, len(meal_minutes))],
+                               rng.integers(60, 90, len(meal_minutes))).astype(float)
+        
+        # Exercise sessions during the day
+        exercise_counts = rng.poisson(exercise_per_week * days / 7, n_patients)
+        exercise_patient = np.repeat(patients, exercise_counts)
+        exercise_minutes = np.round(rng.integers(0, n_days, len(exercise_patient)) * 1440
+                                    + rng.uniform(7, 20, len(exercise_patient)) * 60)
+        in_range = exercise_minutes < span_minutes
+        exercise_patient, exercise_minutes = exercise_patient[in_range], exercise_minutes[in_range]
+        exercise_intensity = rng.integers(1, 4, len(exercise_minutes)).astype(float)
+        exercise_duration = rng.integers(30, 91, len(exercise_minutes)).astype(float)
+        
+        # Correction opportunities at random times
+        correction_counts = rng.poisson(corrections_per_day * days, n_patients)
+        correction_patient = np.repeat(patients, correction_counts)
+        correction_minutes = np.round(rng.uniform(0, span_minutes, len(correction_patient)))
+        
+        def impulses(event_patient: np.ndarray, event_minutes: np.ndarray, amounts: np.ndarray) -> np.ndarray:
+            """Place event amounts on the CGM grid step at or after each event."""
+            grid_impulses = np.zeros((n_patients, steps))
+            event_steps = np.minimum(np.ceil(event_minutes / interval_minutes).astype(int), steps - 1)
+            np.add.at(grid_impulses, (event_patient, event_steps), amounts)
+            return grid_impulses
+        
+        lag_minutes = np.arange(0, 301, interval_minutes)
+        
+        # Glucose before insulin: baseline, dawn rise, drift, meals and exercise
+        drift_kernel = np.exp(-lag_minutes[lag_minutes <= 180] / 60)
+        drift = convolve_events(rng.normal(0, 1, (n_patients, steps)), drift_kernel)
+        drift *= 20 / np.sqrt(np.sum(drift_kernel ** 2))
+        
+        carb_effect = convolve_events(
+            impulses(meal_patient, meal_minutes,
+                     meal_carbs * sensitivity[meal_patient] / carb_ratio[meal_patient] * SYNTHETIC_EFFECT_SCALE),
+            carb_activity(lag_minutes, cutoff=240)
+        )
+        exercise_effect = convolve_events(
+            impulses(exercise_patient, exercise_minutes, exercise_intensity * exercise_duration / 60 * 8),
+            np.exp(-lag_minutes[lag_minutes <= 240] / 90)
+        )
+        
+        glucose = (baseline[:, None] + 25 * np.exp(-((hour - 6) / 1.5) ** 2) + drift
+                   + carb_effect - exercise_effect)
+        
+        def glucose_at(event_patient: np.ndarray, event_minutes: np.ndarray) -> np.ndarray:
+            """Glucose at the last reading at or before each event."""
+            event_steps = np.clip(np.floor(event_minutes / interval_minutes).astype(int), 0, steps - 1)
+            return glucose[event_patient, event_steps]
+        
+        # Meal boluses: carb dose plus correction, with dosing variation, in 0.5 unit steps
+        meal_correction = np.maximum(0, (glucose_at(meal_patient, meal_minutes) - SYNTHETIC_TARGET_GLUCOSE)
+                                     / sensitivity[meal_patient])
+        meal_dose = np.round((meal_carbs / carb_ratio[meal_patient] + meal_correction)
+                             * rng.uniform(0.9, 1.1, len(meal_minutes)) * 2) / 2
+        
+        # Correction boluses only when glucose is above target
+        correction_dose = np.round((glucose_at(correction_patient, correction_minutes) - SYNTHETIC_TARGET_GLUCOSE)
+                                   / sensitivity[correction_patient] * 2) / 2
+        given = correction_dose > 0
+        correction_patient, correction_minutes = correction_patient[given], correction_minutes[given]
+        correction_dose = correction_dose[given]
+        
+        dose_patient = np.concatenate([meal_patient, correction_patient])
+        dose_minutes = np.concatenate([meal_minutes, correction_minutes])
+        dose_amount = np.concatenate([meal_dose, correction_dose])
+        dose_carbs = np.concatenate([meal_carbs, np.zeros(len(correction_dose))])
+        
+        glucose -= convolve_events(
+            impulses(dose_patient, dose_minutes, dose_amount * sensitivity[dose_patient] * SYNTHETIC_EFFECT_SCALE),
+            insulin_activity(lag_minutes, cutoff=300)
+        )
+        glucose += rng.normal(0, 4, glucose.shape)
+        glucose = np.clip(np.round(glucose), 40, 400)
+        
+        # Raw rows per event type: glucose readings, boluses, carb entries and exercise sessions
+        blocks = [
+            (np.repeat(patients, steps), {'ts': grid.ravel(), 'value': glucose.ravel()}),
+            (dose_patient, {'ts': dose_minutes, 'type': np.full(len(dose_minutes), 'normal', dtype=object),
+                            'dose': dose_amount, 'bwz_carb_input': dose_carbs}),
+            (meal_patient, {'ts9': meal_minutes,
+                            'type10': np.select([meal_hour < 11, meal_hour < 16], ['Breakfast', 'Lunch'], 'Dinner'),
+                            'carbs': meal_carbs}),
+            (exercise_patient, {'ts_begin': exercise_minutes, 'ts_end': exercise_minutes + exercise_duration,
+                                'intensity': exercise_intensity, 'duration': exercise_duration})
+        ]
+        columns = ['ts', 'value', 'ts_begin', 'ts_end', 'type', 'dose', 'bwz_carb_input',
+                   'ts9', 'type10', 'carbs', 'intensity', 'duration']
+        timestamp_columns = ['ts', 'ts_begin', 'ts_end', 'ts9']
+        
+        # Timestamps are whole minutes, so each distinct minute is formatted once
+        unique_minutes = np.unique(np.concatenate([values for _, block in blocks
+                                                   for name, values in block.items() if name in timestamp_columns]))
+        minute_strings = (pd.Timestamp(SYNTHETIC_START) + pd.to_timedelta(unique_minutes, unit='m')) \
+            .strftime(DATETIME_FORMATS[0]).to_numpy(dtype=object)
+        
+        row_patient = np.concatenate([block_patient for block_patient, _ in blocks])
+        order = np.argsort(row_patient, kind='stable')
+        
+        data = {}
+        for column in columns:
+            is_text = column in timestamp_columns or column in ('type', 'type10')
+            values = np.full(len(row_patient), np.nan, dtype=object if is_text else np.float64)
             
-            # Calculate glucose value
-            glucose = base_glucose + time_factor + random_var + trend
-            glucose = max(40, min(400, glucose))  # Keep in realistic range
+            row_offset = 0
+            for block_patient, block in blocks:
+                if column in block:
+                    block_values = block[column]
+                    if column in timestamp_columns:
+                        block_values = minute_strings[np.searchsorted(unique_minutes, block_values)]
+                    values[row_offset:row_offset + len(block_patient)] = block_values
+                row_offset += len(block_patient)
             
-            # Record values for autocorrelation
-            if i > 0:
-                lag1 = glucose_data[i-1]['value']
-            else:
-                lag1 = glucose
-                
-            if i > 1:
-                lag2 = glucose_data[i-2]['value']
-            else:
-                lag2 = glucose
-                
-            if i > 2:
-                lag3 = glucose_data[i-3]['value']
-            else:
-                lag3 = glucose
-            
-            # Store data
-            glucose_data.append({
-                'timestamp': ts,
-                'timestamp_str': ts.strftime('%Y-%m-%d %H:%M:%S'),
-                'value': glucose,
-                'glucose_lag_1': lag1,
-                'glucose_lag_2': lag2,
-                'glucose_lag_3': lag3,
-                'patient_id': 1,
-                'weight': 70,
-                'hour': hour,
-                'day_of_week': ts.weekday(),
-                'is_morning': 1 if 5 <= hour <= 11 else 0,
-                'is_afternoon': 1 if 12 <= hour <= 17 else 0,
-                'is_evening': 1 if 18 <= hour <= 23 else 0,
-                'is_night': 1 if 0 <= hour <= 4 else 0
-            })
-        
-        # Add 30-min and 60-min future glucose as target
-        for i in range(len(glucose_data)):
-            if i + 6 < len(glucose_data):  # 30 min ahead (6 readings at 5-min intervals)
-                glucose_data[i]['glucose_future_30min'] = glucose_data[i + 6]['value']
-            else:
-                glucose_data[i]['glucose_future_30min'] = None
-                
-            if i + 12 < len(glucose_data):  # 60 min ahead (12 readings at 5-min intervals)
-                glucose_data[i]['glucose_future_60min'] = glucose_data[i + 12]['value']
-            else:
-                glucose_data[i]['glucose_future_60min'] = None
-        
-        # Create insulin and meal events
-        insulin_data = []
-        
-        # Breakfast, lunch, dinner times
-        meal_times = [
-            # Breakfast times
-            datetime(2023, 1, 1, 7, 30),
-            datetime(2023, 1, 2, 7, 45),
-            datetime(2023, 1, 3, 8, 0),
-            datetime(2023, 1, 4, 7, 15),
-            # Lunch times
-            datetime(2023, 1, 1, 12, 30),
-            datetime(2023, 1, 2, 13, 0),
-            datetime(2023, 1, 3, 12, 45),
-            datetime(2023, 1, 4, 13, 15),
-            # Dinner times
-            datetime(2023, 1, 1, 18, 30),
-            datetime(2023, 1, 2, 19, 0),
-            datetime(2023, 1, 3, 18, 45),
-            datetime(2023, 1, 4, 19, 15),
-        ]
+            data[column] = values[order]
+        
+        # Rows are grouped by patient, each patient's rows in export order
+        patient_rows = row_patient[order]
+        raw_df = pd.DataFrame({
+            'id': patient_rows + first_patient_id,
+            'weight': weight[patient_rows],
+            'insulin_type': insulin_types[patient_rows],
+            **data
+        })
+        
+        return raw_df.astype({col: dtype for col, dtype in RAW_CSV_SCHEMA.items() if col in raw_df.columns})
+    
+    def create_example_dataset(self, n_patients: int = 1, days: float = 4, seed: int = 42) -> Dict[str, pd.DataFrame]:
+        """
+        Create an example dataset for testing when real data is not available.
         
-        # Correction doses
-        correction_times = [
-            datetime(2023, 1, 1, 10, 30),
-            datetime(2023, 1, 2, 15, 0),
-            datetime(2023, 1, 3, 22, 45),
-        ]
+        Raw rows for a synthetic cohort are run through the same extractors as real exports.
         
-        # Generate insulin doses for each meal
-        for meal_time in meal_times:
-            # Get glucose level near this time
-            glucose_at_meal = next(
-                (g['value'] for g in glucose_data 
-                 if abs((g['timestamp'] - meal_time).total_seconds()) < 900),  # Within 15 minutes
-                120  # Default if not found
-            )
-            
-            # Determine meal type based on hour
-            hour = meal_time.hour
-            if hour < 11:  # Breakfast
-                carbs = np.random.randint(30, 60)
-            elif hour < 16:  # Lunch
-                carbs = np.random.randint(45, 75)
-            else:  # Dinner
-                carbs = np.random.randint(60, 90)
-            
-            # Calculate insulin components
-            carb_ratio = 10  # 1 unit per 10g of carbs
-            correction_factor = 50  # 1 unit drops glucose by 50 mg/dL
-            target_glucose = 120
-            
-            # Carb insulin
-            carb_insulin = carbs / carb_ratio
-            
-            # Correction insulin
-            correction = max(0, (glucose_at_meal - target_glucose) / correction_factor)
-            
-            # Total insulin dose
-            total_dose = carb_insulin + correction
-            
-            # Add some variation
-            total_dose = total_dose * np.random.uniform(0.9, 1.1)
-            
-            # Round to realistic dose
-            total_dose = round(total_dose * 2) / 2  # Round to nearest 0.5
-            
-            insulin_data.append({
-                'timestamp': meal_time,
-                'timestamp_str': meal_time.strftime('%Y-%m-%d %H:%M:%S'),
-                'meal_carbs': carbs,
-                'blood_glucose': glucose_at_meal,
-                'dose': total_dose,
-                'is_meal_bolus': 1,
-                'patient_id': 1,
-                'weight': 70,
-                'hour': hour,
-                'day_of_week': meal_time.weekday(),
-                'is_morning': 1 if 5 <= hour <= 11 else 0,
-                'is_afternoon': 1 if 12 <= hour <= 17 else 0,
-                'is_evening': 1 if 18 <= hour <= 23 else 0,
-                'is_night': 1 if 0 <= hour <= 4 else 0,
-                'insulin_sensitivity_factor': 50,
-                'insulin_to_carb_ratio': 10
-            })
-        
-        # Generate correction doses
-        for correction_time in correction_times:
-            # Get glucose level at this time
-            glucose_at_correction = next(
-                (g['value'] for g in glucose_data 
-                 if abs((g['timestamp'] - correction_time).total_seconds()) < 900),  # Within 15 minutes
-                200  # Default if not found (high glucose triggering correction)
-            )
-            
-            # Ensure glucose is high enough to warrant correction
-            if glucose_at_correction < 150:
-                glucose_at_correction = np.random.randint(150, 250)
-            
-            # Calculate correction insulin
-            correction_factor = 50
-            target_glucose = 120
-            correction = (glucose_at_correction - target_glucose) / correction_factor
-            
-            # Round to realistic dose
-            correction = round(correction * 2) / 2  # Round to nearest 0.5
-            
-            hour = correction_time.hour
-            insulin_data.append({
-                'timestamp': correction_time,
-                'timestamp_str': correction_time.strftime('%Y-%m-%d %H:%M:%S'),
-                'meal_carbs': 0,  # No carbs for correction
-                'blood_glucose': glucose_at_correction,
-                'dose': correction,
-                'is_meal_bolus': 0,
-                'patient_id': 1,
-                'weight': 70,
-                'hour': hour,
-                'day_of_week': correction_time.weekday(),
-                'is_morning': 1 if 5 <= hour <= 11 else 0,
-                'is_afternoon': 1 if 12 <= hour <= 17 else 0,
-                'is_evening': 1 if 18 <= hour <= 23 else 0,
-                'is_night': 1 if 0 <= hour <= 4 else 0,
-                'insulin_sensitivity_factor': 50,
-                'insulin_to_carb_ratio': 10
-            })
-        
-        # Sort insulin data by timestamp
-        insulin_data = sorted(insulin_data, key=lambda x: x['timestamp'])
-        
-        # Create DataFrames
-        glucose_df = pd.DataFrame(glucose_data)
-        insulin_df = pd.DataFrame(insulin_data)
-        
-        # Add exercise effects to glucose data
-        exercise_times = [
-            datetime(2023, 1, 1, 16, 0),  # Afternoon exercise
-            datetime(2023, 1, 2, 7, 0),   # Morning exercise
-            datetime(2023, 1, 3, 18, 0),  # Evening exercise
-        ]
+        Args:
+            n_patients: Number of synthetic patients
+            days: Days of data per patient
+            seed: Random seed
+            
+        Returns:
+            Dictionary with example datasets
+        """
+        logger.info("Creating example datasets")
         
-        for ex_time in exercise_times:
-            # Find glucose indices around exercise time
-            exercise_start_idx = next(
-                (i for i, g in enumerate(glucose_data) 
-                 if g['timestamp'] >= ex_time),
-                None
-            )
-            
-            if exercise_start_idx is not None:
-                # Exercise duration in 5-min intervals
-                duration_intervals = np.random.randint(6, 18)  # 30-90 minutes
-                intensity = np.random.randint(1, 4)  # 1-3 intensity
-                
-                # Apply exercise effect to glucose
-                for i in range(exercise_start_idx, min(exercise_start_idx + duration_intervals + 24, len(glucose_data))):
-                    # Duration effect
-                    if i < exercise_start_idx + duration_intervals:
-                        # During exercise
-                        effect = -intensity * 2 * np.random.uniform(0.8, 1.2)
-                    else:
-                        # After exercise (continued effect)
-                        time_since = i - (exercise_start_idx + duration_intervals)
-                        effect = -intensity * np.exp(-time_since / 12) * np.random.uniform(0.8, 1.2)
-                    
-                    # Apply effect
-                    glucose_df.at[i, 'value'] += effect
-                    
-                    # Update future glucose targets
-                    future_30 = i + 6
-                    if future_30 < len(glucose_data) and 'glucose_future_30min' in glucose_df.columns:
-                        glucose_df.at[i, 'glucose_future_30min'] = glucose_df.at[future_30, 'value']
-                        
-                    future_60 = i + 12
-                    if future_60 < len(glucose_data) and 'glucose_future_60min' in glucose_df.columns:
-                        glucose_df.at[i, 'glucose_future_60min'] = glucose_df.at[future_60, 'value']
-                
-                # Add exercise info to relevant glucose readings
-                for i in range(exercise_start_idx, min(exercise_start_idx + duration_intervals + 36, len(glucose_data))):
-                    if i < exercise_start_idx + duration_intervals:
-                        # During exercise
-                        glucose_df.at[i, 'recent_exercise_intensity'] = intensity
-                        glucose_df.at[i, 'recent_exercise_duration'] = 5 * (i - exercise_start_idx + 1)  # 5 min intervals
-                        glucose_df.at[i, 'minutes_since_exercise'] = 0
-                    else:
-                        # After exercise
-                        glucose_df.at[i, 'recent_exercise_intensity'] = intensity
-                        glucose_df.at[i, 'recent_exercise_duration'] = 5 * duration_intervals
-                        glucose_df.at[i, 'minutes_since_exercise'] = 5 * (i - (exercise_start_idx + duration_intervals))
-        
-        # Add insulin and carb info to glucose data
-        glucose_df['recent_insulin_dose'] = 0
-        glucose_df['recent_carb_intake'] = 0
-        glucose_df['minutes_since_insulin'] = 1440  # Default to 24 hours
-        glucose_df['minutes_since_carbs'] = 1440    # Default to 24 hours
-        
-        for insulin_row in insulin_data:
-            insulin_time = insulin_time = insulin_row['timestamp']
-            
-            # Find glucose readings after this insulin dose
-            for i, glucose_row in glucose_df.iterrows():
-                glucose_time = glucose_row['timestamp']
-                
-                # Only process if glucose reading is after insulin
-                if glucose_time >= insulin_time:
-                    # Minutes since insulin
-                    minutes_diff = (glucose_time - insulin_time).total_seconds() / 60
-                    
-                    # Update if this is the most recent insulin dose
-                    if minutes_diff < glucose_df.at[i, 'minutes_since_insulin']:
-                        glucose_df.at[i, 'recent_insulin_dose'] = insulin_row['dose']
-                        glucose_df.at[i, 'minutes_since_insulin'] = minutes_diff
-                        
-                        # Carb intake
-                        glucose_df.at[i, 'recent_carb_intake'] = insulin_row['meal_carbs']
-                        glucose_df.at[i, 'minutes_since_carbs'] = minutes_diff
+        raw_df = self.generate_synthetic_cohort(n_patients=n_patients, days=days, seed=seed)
         
-        # Fill in missing exercise data
-        if 'recent_exercise_intensity' not in glucose_df.columns:
-            glucose_df['recent_exercise_intensity'] = 0
-            
-        if 'recent_exercise_duration' not in glucose_df.columns:
-            glucose_df['recent_exercise_duration'] = 0
-            
-        if 'minutes_since_exercise' not in glucose_df.columns:
-            glucose_df['minutes_since_exercise'] = 1440  # Default to 24 hours
+        glucose_frames = []
+        insulin_frames = []
+        for patient_id, patient_df in raw_df.groupby('id', sort=False):
+            glucose_df, insulin_df = self.process_patient(patient_df, patient_id, 'synthetic')
+            if glucose_df is not None:
+                glucose_frames.append(glucose_df)
+            if insulin_df is not None:
+                insulin_frames.append(insulin_df)
         
-        # Ensure no NaN values
-        glucose_df = glucose_df.fillna(0)
-        insulin_df = insulin_df.fillna(0)
+        glucose_df = self._concat_frames(glucose_frames, ignore_index=True) if glucose_frames else pd.DataFrame()
+        insulin_df = self._concat_frames(insulin_frames, ignore_index=True) if insulin_frames else pd.DataFrame()
         
         logger.info(f"Created example glucose dataset with {len(glucose_df)} rows")
         logger.info(f"Created example insulin dataset with {len(insulin_df)} rows")
@@ -0,0 +1,433 @@
+# feature_spec.py
+# Declarative model feature specifications, compiled into a batch transformer for training
+# and a single-row builder for serving
+
+import json
+import hashlib
+import numpy as np
+from datetime import datetime
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from activity_curves import (insulin_activity, carb_activity, scaled_activity, insulin_on_board_hours,
+                             ACTIVITY_GRID_MINUTES, INSULIN_ACTION_MINUTES, CARB_ABSORPTION_MINUTES,
+                             INSULIN_ACTIVITY_KERNEL, INSULIN_ON_BOARD_KERNEL,
+                             CARB_ACTIVITY_KERNEL, CARBS_ON_BOARD_KERNEL)
+from glucose_trends import GLUCOSE_TREND_FEATURES
+
+# Single rows are built on numpy alone, so the lite model runtime can import the specs
+# without pandas; batches are DataFrames
+if TYPE_CHECKING:
+    import pandas as pd
+
+NUMERIC = 'numeric'
+FLAG = 'flag'
+
+# Missing values of a feature in a batch are filled with a constant or carried along the series
+FILL_FORWARD = 'ffill'
+
+# Total daily insulin estimated from body weight (U/kg, mid-range) for the 1800 and 500 rules
+TDI_PER_KG = 0.55
+
+def feature(name: str, group: str, inputs: Sequence[str] = (), derive: Optional[Callable] = None,
+            kind: str = NUMERIC, default: Any = 0, fill: Any = 0,
+            source: Optional[str] = None, model: bool = True) -> Dict[str, Any]:
+    """
+    Declare one feature.
+
+    A feature missing from a training batch is derived from its inputs when they are
+    present. A feature missing from a serving request takes its default if one is
+    declared, otherwise it is derived; inputs are always declared before the feature.
+
+    Args:
+        name: Feature name as seen by the model
+        group: Feature group (time, glucose, trend, insulin, carb, exercise, patient)
+        inputs: Features used by derive and by a callable default
+        derive: Function of the input values (scalars or Series) computing the feature
+        kind: NUMERIC for scaled values, FLAG for one-hot encoded 0/1 indicators
+        default: Serving value when not given: a constant, a callable of the resolved
+            request, or None when the feature is required (or always derived)
+        fill: Value for missing entries in a batch, FILL_FORWARD, or None to leave them
+        source: Column name in the processed training data, if different
+        model: Whether the model uses the feature (False for inputs of derivations only)
+
+    Returns:
+        Feature declaration
+    """
+    return {
+        'name': name,
+        'group': group,
+        'kind': kind,
+        'inputs': tuple(inputs),
+        'derive': derive,
+        'default': default,
+        'fill': fill,
+        'source': source or name,
+        'model': model
+    }
+
+class FeatureSpec:
+    """Ordered feature declarations shared by training and serving."""
+
+    def __init__(self, features: List[Dict[str, Any]]):
+        """
+        Compile the declarations.
+
+        Args:
+            features: Feature declarations in resolution order
+
+        Raises:
+            ValueError: If a name is declared twice or an input is not declared before its feature
+        """
+        self.features = {}
+        for spec in features:
+            if spec['name'] in self.features:
+                raise ValueError(f"Feature '{spec['name']}' is declared twice")
+            unknown = [name for name in spec['inputs'] if name not in self.features]
+            if unknown:
+                raise ValueError(f"Feature '{spec['name']}' depends on undeclared features {unknown}")
+            self.features[spec['name']] = spec
+
+        self.names = [name for name, spec in self.features.items() if spec['model']]
+        self.numerical = [name for name in self.names if self.features[name]['kind'] == NUMERIC]
+        self.flags = [name for name in self.names if self.features[name]['kind'] == FLAG]
+
+    def group(self, group: str) -> List[str]:
+        """Model features of a group, in declaration order."""
+        return [name for name in self.names if self.features[name]['group'] == group]
+
+    def source_columns(self) -> List[str]:
+        """Columns of the processed training data holding the declared features."""
+        return [spec['source'] for spec in self.features.values()]
+
+    def source_renames(self) -> Dict[str, str]:
+        """Mapping of processed-data column names to feature names where they differ."""
+        return {spec['source']: name for name, spec in self.features.items() if spec['source'] != name}
+
+    def fingerprint(self) -> str:
+        """
+        Digest of the declarations, to check that a saved model was built with this spec.
+
+        Derivations and defaults are described by name, the globals and constants their
+        code refers to, and the values they were created with.
+
+        Returns:
+            Hex digest
+        """
+        description = [
+            [name, spec['group'], spec['kind'], list(spec['inputs']), spec['source'], spec['model'],
+             _describe(spec['fill']), _describe(spec['derive']), _describe(spec['default'])]
+            for name, spec in self.features.items()
+        ]
+        return hashlib.sha256(json.dumps(description).encode()).hexdigest()
+
+    def transform(self, df: 'pd.DataFrame') -> 'pd.DataFrame':
+        """
+        Add derived features and fill missing values over a whole batch.
+
+        Args:
+            df: DataFrame with features
+
+        Returns:
+            Copy of df with derivable features added and missing values filled
+        """
+        df = df.copy()
+
+        # Derivations see the inputs as given, before missing values are filled
+        for name, spec in self.features.items():
+            if (name not in df.columns and spec['derive'] is not None
+                    and all(column in df.columns for column in spec['inputs'])):
+                df[name] = spec['derive'](*(df[column] for column in spec['inputs']))
+
+        for name, spec in self.features.items():
+            if name in df.columns and spec['fill'] is not None and df[name].isna().any():
+                if spec['fill'] == FILL_FORWARD:
+                    df[name] = df[name].ffill().bfill()
+                else:
+                    df[name] = df[name].fillna(spec['fill'])
+
+        return df
+
+    def row_builder(self, columns: Sequence[str]) -> Callable[[Dict[str, Any]], np.ndarray]:
+        """
+        Compile a builder of single model rows for serving.
+
+        Only the given columns and the features they depend on are resolved, each once,
+        in declaration order: a given value wins, then the default, then the derivation.
+
+        Args:
+            columns: Model input columns, in the order the model expects them
+
+        Returns:
+            Function mapping a request (feature names and extra inputs) to a float64 row
+
+        Raises:
+            ValueError: If a column is not a declared feature
+        """
+        plan, columns = self._resolution_plan(columns)
+
+        def build(request: Dict[str, Any]) -> np.ndarray:
+            values = dict(request)
+            for name, inputs, derive, default in plan:
+                value = values.get(name)
+                if value is None:
+                    if default is not None:
+                        value = default(values) if callable(default) else default
+                    elif derive is not None:
+                        value = derive(*(values[column] for column in inputs))
+                    else:
+                        raise ValueError(f"Missing required feature '{name}'")
+                values[name] = float(value)
+            return np.array([values[name] for name in columns], dtype=np.float64)
+
+        return build
+
+    def batch_builder(self, columns: Sequence[str]) -> Callable[['pd.DataFrame'], 'pd.DataFrame']:
+        """
+        Compile a builder of model inputs for a batch of serving requests.
+
+        The vectorized counterpart of row_builder: missing (NaN) entries take the
+        default, then the derivation, one array operation per feature. Required
+        features must be present as columns; their missing entries stay NaN.
+
+        Args:
+            columns: Model input columns, in the order the model expects them
+
+        Returns:
+            Function mapping a frame of requests to a frame of the columns, same index
+
+        Raises:
+            ValueError: If a column is not a declared feature
+        """
+        import pandas as pd
+
+        plan, columns = self._resolution_plan(columns)
+
+        def build(requests: pd.DataFrame) -> pd.DataFrame:
+            values = {name: requests[name].to_numpy() for name in requests.columns}
+            for name, inputs, derive, default in plan:
+                given = values.get(name)
+                if given is None:
+                    if default is None and derive is None:
+                        raise ValueError(f"Missing required feature '{name}'")
+                    column = np.full(len(requests), np.nan)
+                else:
+                    column = np.asarray(pd.to_numeric(given, errors='coerce'), dtype=np.float64)
+                missing = np.isnan(column)
+                if missing.any() and (default is not None or derive is not None):
+                    if default is not None:
+                        fill = default(values) if callable(default) else default
+                    else:
+                        fill = derive(*(values[column_name] for column_name in inputs))
+                    column = np.where(missing, fill, column)
+                values[name] = column
+            return pd.DataFrame({name: values[name] for name in columns}, index=requests.index)
+
+        return build
+
+    def _resolution_plan(self, columns: Sequence[str]) -> Tuple[List[Tuple], List[str]]:
+        """Features to resolve for the columns (with their inputs), in declaration order."""
+        unknown = [name for name in columns if name not in self.features]
+        if unknown:
+            raise ValueError(f"No feature specification for columns {unknown}")
+
+        # Features the columns depend on, walking the declarations backwards
+        needed = set(columns)
+        for name in reversed(list(self.features)):
+            if name in needed:
+                needed.update(self.features[name]['inputs'])
+
+        plan = [(name, spec['inputs'], spec['derive'], spec['default'])
+                for name, spec in self.features.items() if name in needed]
+        return plan, list(columns)
+
+def _describe(value: Any) -> Any:
+    """JSON-serializable description of a declared value, derivation or default."""
+    if isinstance(value, np.ndarray):
+        return hashlib.sha256(np.ascontiguousarray(value, dtype=np.float64).tobytes()).hexdigest()
+    if callable(value):
+        code = getattr(value, '__code__', None)
+        if code is None:
+            return getattr(value, '__qualname__', type(value).__name__)
+        constants = [constant for constant in code.co_consts if isinstance(constant, (int, float, str))]
+        cells = [_describe(cell.cell_contents) for cell in value.__closure__ or ()]
+        return [value.__qualname__, list(code.co_names), constants, cells]
+    if isinstance(value, (list, tuple)):
+        return [_describe(item) for item in value]
+    return value if isinstance(value, (int, float, str, type(None))) else repr(value)
+
+def _hour_flag(first: int, last: int) -> Callable:
+    """Derivation of a time-of-day flag for hours first..last."""
+    return lambda hour: 1 * ((hour >= first) & (hour <= last))
+
+def _is_weekend(day_of_week):
+    """Weekend flag from the day of week (Monday = 0)."""
+    return 1 * (day_of_week >= 5)
+
+def _insulin_sensitivity_factor(weight):
+    """Insulin sensitivity factor by the 1800 rule: 1800 / total daily insulin."""
+    return 1800 / (weight * TDI_PER_KG)
+
+def _insulin_to_carb_ratio(weight):
+    """Insulin-to-carb ratio by the 500 rule: 500 / total daily insulin."""
+    return 500 / (weight * TDI_PER_KG)
+
+def _now_hour(values: Dict[str, Any]) -> int:
+    """Serving default of the hour: a request describes the present."""
+    return datetime.now().hour
+
+def _now_day_of_week(values: Dict[str, Any]) -> int:
+    """Serving default of the day of week."""
+    return datetime.now().weekday()
+
+def _events_now(history: Sequence, kernel: np.ndarray) -> float:
+    """
+    Active or on-board amount now from (minutes ago, amount) pairs and a kernel.
+
+    Events sit on the same grid steps as in events_on_board and the taps are added in
+    the same order, without building a grid for a single query.
+    """
+    events = np.asarray(history, dtype=np.float64).reshape(-1, 2)
+    events = events[np.isfinite(events[:, 0])]
+
+    # Event times in seconds relative to now, in time order, and their lag in grid steps
+    seconds = np.round(-events[:, 0] * 60).astype(np.int64)
+    order = np.argsort(seconds, kind='stable')
+    lags = -(-seconds[order] // (ACTIVITY_GRID_MINUTES * 60)) * -1
+    reach = (lags >= 0) & (lags < len(kernel))
+    impulses = np.bincount(lags[reach], weights=np.nan_to_num(events[order, 1][reach]))
+
+    total = 0.0
+    for lag in np.flatnonzero(impulses):
+        total += kernel[lag] * impulses[lag]
+    return float(total)
+
+def _latest_event_now(minutes: Any, amounts: Any, kernel: np.ndarray) -> np.ndarray:
+    """_events_now for a single event per row, vectorized over rows."""
+    seconds = np.round(-np.asarray(minutes, dtype=np.float64) * 60)
+    lags = -np.ceil(seconds / (ACTIVITY_GRID_MINUTES * 60))
+    reach = (lags >= 0) & (lags < len(kernel))
+    taps = kernel[np.where(reach, lags, 0).astype(np.int64)]
+    return np.where(reach, taps * np.nan_to_num(np.asarray(amounts, dtype=np.float64)), 0.0)
+
+def _on_board_default(history_key: str, minutes_key: str, amount_key: str, kernel: np.ndarray) -> Callable:
+    """
+    Serving default of an active or on-board amount.
+
+    Sums over every event of the request's history (e.g. insulin_history, a list of
+    (minutes ago, amount) pairs) when given, otherwise over the most recent event.
+    Works on a single request or on a batch, where the history is a column of lists.
+    """
+    def default(values: Dict[str, Any]) -> np.ndarray:
+        latest = _latest_event_now(values[minutes_key], values[amount_key], kernel)
+        history = values.get(history_key)
+        if history is None:
+            return latest
+        if np.ndim(latest) == 0:
+            return _events_now(history, kernel)
+        for row, events in enumerate(history):
+            if isinstance(events, (list, tuple, np.ndarray)):
+                latest[row] = _events_now(events, kernel)
+        return latest
+    return default
+
+def _since_default(amount_key: str, idle_minutes: float) -> Callable:
+    """Serving default of the minutes since an event: 0 if the request has one, otherwise idle_minutes."""
+    return lambda values: np.where(values[amount_key] > 0, 0, idle_minutes)
+
+def _time_features() -> List[Dict[str, Any]]:
+    """Calendar features and the time-of-day and weekend flags derived from them."""
+    return [
+        feature('hour', 'time', default=_now_hour),
+        feature('day_of_week', 'time', default=_now_day_of_week),
+        feature('is_morning', 'time', ['hour'], _hour_flag(5, 11), kind=FLAG, default=None),
+        feature('is_afternoon', 'time', ['hour'], _hour_flag(12, 17), kind=FLAG, default=None),
+        feature('is_evening', 'time', ['hour'], _hour_flag(18, 23), kind=FLAG, default=None),
+        feature('is_night', 'time', ['hour'], _hour_flag(0, 4), kind=FLAG, default=None),
+        feature('is_weekend', 'time', ['day_of_week'], _is_weekend, kind=FLAG, default=None)
+    ]
+
+def _current_glucose(values: Dict[str, Any]) -> float:
+    """Serving default of lags and window levels: the current reading."""
+    return values['current_glucose']
+
+def _trend_default(name: str) -> Callable:
+    """Without a reading history, trend windows hold the current level and the current velocity."""
+    if name.startswith('glucose_std_'):
+        return lambda values: 0
+    if name.startswith('glucose_slope_'):
+        return lambda values: values['glucose_velocity']
+    return _current_glucose
+
+GLUCOSE_FEATURE_SPEC = FeatureSpec(
+    _time_features() +
+    [
+        feature('current_glucose', 'glucose', default=None, fill=FILL_FORWARD, source='value'),
+        feature('glucose_lag_1', 'glucose', ['current_glucose'], default=_current_glucose, fill=FILL_FORWARD),
+        feature('glucose_lag_2', 'glucose', ['current_glucose'], default=_current_glucose, fill=FILL_FORWARD),
+        feature('glucose_lag_3', 'glucose', ['current_glucose'], default=_current_glucose, fill=FILL_FORWARD),
+        # Assuming 5 minute intervals
+        feature('glucose_velocity', 'glucose', ['current_glucose', 'glucose_lag_1'],
+                lambda current, lag: (current - lag) / 5, default=None, fill=FILL_FORWARD),
+        feature('glucose_rolling_mean', 'glucose', ['current_glucose'], default=_current_glucose, fill=FILL_FORWARD),
+        feature('glucose_rolling_std', 'glucose', fill=FILL_FORWARD)
+    ] +
+    [
+        feature(name, 'trend', ['current_glucose', 'glucose_velocity'], default=_trend_default(name),
+                fill=FILL_FORWARD)
+        for name in GLUCOSE_TREND_FEATURES
+    ] +
+    [
+        feature('recent_insulin_dose', 'insulin'),
+        feature('minutes_since_insulin', 'insulin', ['recent_insulin_dose'],
+                default=_since_default('recent_insulin_dose', INSULIN_ACTION_MINUTES)),
+        feature('active_insulin', 'insulin', ['recent_insulin_dose', 'minutes_since_insulin'],
+                lambda dose, minutes: scaled_activity(
+                    dose, insulin_activity(minutes, cutoff=INSULIN_ACTION_MINUTES, zero_non_positive=False)),
+                default=_on_board_default('insulin_history', 'minutes_since_insulin', 'recent_insulin_dose',
+                                          INSULIN_ACTIVITY_KERNEL)),
+        feature('insulin_on_board', 'insulin', ['recent_insulin_dose', 'minutes_since_insulin'],
+                default=_on_board_default('insulin_history', 'minutes_since_insulin', 'recent_insulin_dose',
+                                          INSULIN_ON_BOARD_KERNEL)),
+        feature('recent_carb_intake', 'carb'),
+        feature('minutes_since_carbs', 'carb', ['recent_carb_intake'],
+                default=_since_default('recent_carb_intake', CARB_ABSORPTION_MINUTES)),
+        feature('active_carbs', 'carb', ['recent_carb_intake', 'minutes_since_carbs'],
+                lambda carbs, minutes: scaled_activity(
+                    carbs, carb_activity(minutes, cutoff=CARB_ABSORPTION_MINUTES, zero_non_positive=False)),
+                default=_on_board_default('carb_history', 'minutes_since_carbs', 'recent_carb_intake',
+                                          CARB_ACTIVITY_KERNEL)),
+        feature('carbs_on_board', 'carb', ['recent_carb_intake', 'minutes_since_carbs'],
+                default=_on_board_default('carb_history', 'minutes_since_carbs', 'recent_carb_intake',
+                                          CARBS_ON_BOARD_KERNEL)),
+        feature('recent_exercise_intensity', 'exercise'),
+        feature('recent_exercise_duration', 'exercise'),
+        feature('minutes_since_exercise', 'exercise', ['recent_exercise_duration'],
+                default=_since_default('recent_exercise_duration', 360)),
+        feature('weight', 'patient', default=70),
+        feature('insulin_sensitivity_factor', 'patient', ['weight'], _insulin_sensitivity_factor, default=None),
+        feature('insulin_to_carb_ratio', 'patient', ['weight'], _insulin_to_carb_ratio, default=None)
+    ]
+)
+
+INSULIN_FEATURE_SPEC = FeatureSpec([
+    feature('hour', 'time', default=_now_hour, fill=None, model=False),
+    feature('day_of_week', 'time', default=_now_day_of_week, fill=None, model=False),
+    feature('blood_glucose', 'glucose', default=None),
+    feature('carb_intake', 'carb', source='meal_carbs'),
+    feature('exercise_time', 'exercise', source='exercise_duration'),
+    feature('weight', 'patient', default=70),
+    feature('insulin_sensitivity_factor', 'patient', ['weight'], _insulin_sensitivity_factor, default=None),
+    feature('insulin_to_carb_ratio', 'patient', ['weight'], _insulin_to_carb_ratio, default=None),
+    feature('previous_insulin_dose', 'insulin'),
+    feature('hours_since_last_insulin', 'insulin'),
+    feature('total_insulin_past_24h', 'insulin'),
+    feature('active_insulin', 'insulin', ['hours_since_last_insulin', 'previous_insulin_dose'],
+            insulin_on_board_hours, default=None),
+    feature('is_morning', 'time', ['hour'], _hour_flag(5, 11), kind=FLAG, default=None),
+    feature('is_afternoon', 'time', ['hour'], _hour_flag(12, 17), kind=FLAG, default=None),
+    feature('is_evening', 'time', ['hour'], _hour_flag(18, 23), kind=FLAG, default=None),
+    feature('is_night', 'time', ['hour'], _hour_flag(0, 4), kind=FLAG, default=None),
+    feature('is_weekend', 'time', ['day_of_week'], _is_weekend, kind=FLAG, default=None),
+    feature('is_correction_dose', 'insulin', ['carb_intake'], lambda carbs: 1 * (carbs == 0),
+            kind=FLAG, default=None)
+])
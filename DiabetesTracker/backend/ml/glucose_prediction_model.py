@@ -19,6 +19,11 @@ from sklearn.model_selection import train_test_split, GridSearchCV, TimeSeriesSp
 from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
 import joblib
 
+from compiled_pipeline import compile_pipeline
+from lite_model import LiteModel, SHARED_MODEL_LOADING, lite_model_path, save_lite_model
+from model_registry import LoadBackoff
+from feature_spec import GLUCOSE_FEATURE_SPEC
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -36,11 +41,21 @@ MODEL_PATH = os.path.join(MODEL_DIR, 'glucose_model.joblib')
 SCALER_PATH = os.path.join(MODEL_DIR, 'glucose_scaler.joblib')
 FEATURE_IMPORTANCE_PATH = os.path.join(MODEL_DIR, 'glucose_feature_importance.csv')
 
+# Feature names of the predict arguments, also accepted as batch columns
+PREDICT_ARGUMENT_FEATURES = {
+    'current_glucose': 'current_glucose',
+    'insulin_dose': 'recent_insulin_dose',
+    'carb_intake': 'recent_carb_intake',
+    'exercise_duration': 'recent_exercise_duration',
+    'exercise_intensity': 'recent_exercise_intensity'
+}
+
 class GlucosePredictionModel:
     """Advanced machine learning model for glucose level prediction."""
     
     def __init__(self, model_path: str = MODEL_PATH, scaler_path: str = SCALER_PATH,
-                 prediction_horizon: int = 60):
+                 prediction_horizon: int = 60, use_trend_features: bool = False,
+                 shared_loading: bool = SHARED_MODEL_LOADING):
         """
         Initialize the glucose prediction model.
         
@@ -48,48 +63,41 @@ class GlucosePredictionModel:
             model_path: Path to save/load the model
             scaler_path: Path to save/load the scaler
             prediction_horizon: Time horizon to predict in minutes (default: 60)
+            use_trend_features: Whether to use the multi-scale window and EWMA glucose features
+            shared_loading: Serve from the memory-mapped lite artifact (see load_model)
         """
         self.model_path = model_path
         self.scaler_path = scaler_path
         self.prediction_horizon = prediction_horizon
+        self.shared_loading = shared_loading
+        self.load_backoff = LoadBackoff()
         self.model = None
         self.pipeline = None
         self.feature_names = None
         self.feature_importances = None
         self.is_trained = False
+        self.row_builder = None
+        self.batch_builder = None
+        self.compiled = None
         
-        # Define feature groups
-        self.time_features = [
-            'hour', 'day_of_week', 'is_morning', 'is_afternoon', 
-            'is_evening', 'is_night', 'is_weekend'
-        ]
-        
-        self.glucose_features = [
-            'current_glucose', 'glucose_lag_1', 'glucose_lag_2', 'glucose_lag_3',
-            'glucose_velocity', 'glucose_rolling_mean', 'glucose_rolling_std'
-        ]
-        
-        self.insulin_features = [
-            'recent_insulin_dose', 'minutes_since_insulin', 'active_insulin'
-        ]
+        # Feature groups, declared with their derivations and serving defaults in feature_spec.py
+        self.feature_spec = GLUCOSE_FEATURE_SPEC
+        self.time_features = self.feature_spec.group('time')
+        self.glucose_features = self.feature_spec.group('glucose')
         
-        self.carb_features = [
-            'recent_carb_intake', 'minutes_since_carbs', 'active_carbs'
-        ]
+        # Multi-scale time-window statistics and EWMAs (see glucose_trends.py)
+        self.trend_features = self.feature_spec.group('trend') if use_trend_features else []
         
-        self.exercise_features = [
-            'recent_exercise_intensity', 'recent_exercise_duration',
-            'minutes_since_exercise'
-        ]
-        
-        self.patient_features = [
-            'weight', 'insulin_sensitivity_factor', 'insulin_to_carb_ratio'
-        ]
+        self.insulin_features = self.feature_spec.group('insulin')
+        self.carb_features = self.feature_spec.group('carb')
+        self.exercise_features = self.feature_spec.group('exercise')
+        self.patient_features = self.feature_spec.group('patient')
         
         # Aggregate all feature groups
         self.all_features = (
             self.time_features + 
             self.glucose_features + 
+            self.trend_features + 
             self.insulin_features + 
             self.carb_features + 
             self.exercise_features + 
@@ -107,9 +115,7 @@ class GlucosePredictionModel:
             Scikit-learn pipeline
         """
         # Create feature groups for pipeline
-        categorical_features = [
-            'is_morning', 'is_afternoon', 'is_evening', 'is_night', 'is_weekend'
-        ]
+        categorical_features = self.feature_spec.flags
         
         numerical_features = [f for f in self.all_features if f not in categorical_features]
         
@@ -161,7 +167,7 @@ class GlucosePredictionModel:
     
     def preprocess_data(self, df: pd.DataFrame) -> pd.DataFrame:
         """
-        Preprocess the data for training or prediction.
+        Preprocess a batch of data for training or evaluation.
         
         Args:
             df: DataFrame with features
@@ -169,106 +175,8 @@ class GlucosePredictionModel:
         Returns:
             Preprocessed DataFrame
         """
-        # Create a copy to avoid modifying the original
-        df_copy = df.copy()
-        
-        # Add time-based features if hour is available
-        if 'hour' in df_copy.columns:
-            # Add time of day category if not present
-            if 'is_morning' not in df_copy.columns:
-                df_copy['is_morning'] = ((df_copy['hour'] >= 5) & (df_copy['hour'] <= 11)).astype(int)
-            if 'is_afternoon' not in df_copy.columns:
-                df_copy['is_afternoon'] = ((df_copy['hour'] >= 12) & (df_copy['hour'] <= 17)).astype(int)
-            if 'is_evening' not in df_copy.columns:
-                df_copy['is_evening'] = ((df_copy['hour'] >= 18) & (df_copy['hour'] <= 23)).astype(int)
-            if 'is_night' not in df_copy.columns:
-                df_copy['is_night'] = ((df_copy['hour'] >= 0) & (df_copy['hour'] <= 4)).astype(int)
-        else:
-            # Default to zeros if hour not available
-            for time_feature in ['is_morning', 'is_afternoon', 'is_evening', 'is_night']:
-                if time_feature not in df_copy.columns:
-                    df_copy[time_feature] = 0
-                    
-        # Add weekend indicator if day_of_week is available
-        if 'day_of_week' in df_copy.columns and 'is_weekend' not in df_copy.columns:
-            df_copy['is_weekend'] = df_copy['day_of_week'].isin([5, 6]).astype(int)
-        elif 'is_weekend' not in df_copy.columns:
-            df_copy['is_weekend'] = 0
-        
-        # Calculate active insulin if needed data is available
-        if ('recent_insulin_dose' in df_copy.columns and 
-            'minutes_since_insulin' in df_copy.columns and
-            'active_insulin' not in df_copy.columns):
-            
-            # Calculate active insulin using a biexponential model
-            def calc_active_insulin(row):
-                dose = row['recent_insulin_dose']
-                minutes = row['minutes_since_insulin']
-                
-                if pd.isna(dose) or pd.isna(minutes) or dose == 0 or minutes >= 300:  # 5 hours
-                    return 0.0
-                
-                # Biexponential model for insulin action
-                peak_time = 75  # minutes
-                duration = 300  # minutes
-                
-                if minutes < peak_time:
-                    # Rising phase
-                    activity = (minutes / peak_time) * np.exp(-(minutes - peak_time) / 50)
-                else:
-                    # Falling phase
-                    activity = np.exp(-(minutes - peak_time) / 50)
-                
-                # Scale by dose
-                return dose * activity
-            
-            df_copy['active_insulin'] = df_copy.apply(calc_active_insulin, axis=1)
-        
-        # Calculate active carbs if needed data is available
-        if ('recent_carb_intake' in df_copy.columns and 
-            'minutes_since_carbs' in df_copy.columns and
-            'active_carbs' not in df_copy.columns):
-            
-            # Calculate active carbs using a model of carb absorption
-            def calc_active_carbs(row):
-                carbs = row['recent_carb_intake']
-                minutes = row['minutes_since_carbs']
-                
-                if pd.isna(carbs) or pd.isna(minutes) or carbs == 0 or minutes >= 240:  # 4 hours
-                    return 0.0
-                
-                # Carb absorption model
-                peak_time = 30  # minutes
-                duration = 240  # minutes
-                
-                if minutes < peak_time:
-                    # Rising phase (linear)
-                    activity = minutes / peak_time
-                elif minutes < duration:
-                    # Falling phase (exponential)
-                    activity = np.exp(-(minutes - peak_time) / 150)
-                else:
-                    activity = 0
-                
-                # Scale by carbs
-                return carbs * activity
-            
-            df_copy['active_carbs'] = df_copy.apply(calc_active_carbs, axis=1)
-        
-        # Handle missing values for all features
-        for feature in self.all_features:
-            if feature in df_copy.columns and df_copy[feature].isna().any():
-                if feature in self.glucose_features:
-                    # For glucose features, use forward fill then backward fill
-                    df_copy[feature] = df_copy[feature].fillna(method='ffill').fillna(method='bfill')
-                elif feature in self.time_features:
-                    # For categorical time features, fill with 0
-                    df_copy[feature] = df_copy[feature].fillna(0)
-                else:
-                    # For other features, fill with 0
-                    df_copy[feature] = df_copy[feature].fillna(0)
-        
-        return df_copy
+        # Derive missing features and fill missing values as declared in the feature spec
+        return self.feature_spec.transform(df)
     
     def extract_features_and_target(self, df: pd.DataFrame, prediction_horizon: int = None) -> Tuple[pd.DataFrame, Optional[pd.Series]]:
         """
@@ -300,8 +208,9 @@ class GlucosePredictionModel:
             logger.error("No valid features found in DataFrame")
             raise ValueError("No valid features found in DataFrame")
         
-        # Extract features
-        X = df[available_features]
+        # Extract features as float64, the dtype of served rows (scaling the float32
+        # storage dtype moves values near split thresholds)
+        X = df[available_features].astype(np.float64)
         
         # Extract target if available
         y = df[target_col] if has_target else None
@@ -359,9 +268,13 @@ class GlucosePredictionModel:
         
         # Build pipeline
         self.pipeline = self.build_pipeline()
+        self.row_builder = None
+        self.batch_builder = None
+        self.compiled = None
         
         # Train the model
         self.pipeline.fit(X_train, y_train)
+        self._compile_inference()
         
         # Evaluate on test set
         y_pred = self.pipeline.predict(X_test)
@@ -486,6 +399,9 @@ class GlucosePredictionModel:
         
         # Build base pipeline
         self.pipeline = self.build_pipeline()
+        self.row_builder = None
+        self.batch_builder = None
+        self.compiled = None
         
         # Define parameter grid
         param_grid = {
@@ -526,6 +442,7 @@ class GlucosePredictionModel:
         
         # Train on full dataset
         self.pipeline.fit(X, y)
+        self._compile_inference()
         
         # Save model
         self.save_model()
@@ -545,8 +462,19 @@ class GlucosePredictionModel:
         """Save the trained model and preprocessing pipeline to disk."""
         try:
             os.makedirs(os.path.dirname(self.model_path), exist_ok=True)
-            joblib.dump(self.pipeline, self.model_path)
+            # Uncompressed, so its arrays can be memory-mapped (mmap_mode='r'); written to a
+            # temporary file and renamed, so a reloading server never reads a partial model
+            temporary_path = f"{self.model_path}.tmp"
+            joblib.dump(self.pipeline, temporary_path, compress=0)
+            os.replace(temporary_path, self.model_path)
             logger.info(f"Model saved to {self.model_path}")
+            
+            # Standalone artifact for the numpy-only runtime (see lite_model.py)
+            if self.compiled is not None and self.compiled.kind == 'flat-forest':
+                save_lite_model(lite_model_path(self.model_path), self.compiled, 'glucose',
+                                aliases=PREDICT_ARGUMENT_FEATURES, output={'step': 1, 'min': 40, 'max': 400},
+                                prediction_horizon=self.prediction_horizon)
+                logger.info(f"Lite model saved to {lite_model_path(self.model_path)}")
         except Exception as e:
             logger.error(f"Error saving model: {str(e)}")
     
@@ -554,12 +482,20 @@ class GlucosePredictionModel:
         """
         Load a trained model from disk.
         
+        With shared loading, the model is served from its memory-mapped lite artifact
+        when there is an up-to-date one, and otherwise unpickled with its arrays mapped.
+        
         Returns:
             True if model loaded successfully, False otherwise
         """
         try:
+            if self.shared_loading and self._load_shared():
+                return True
+            
             if os.path.exists(self.model_path):
-                self.pipeline = joblib.load(self.model_path)
+                self.pipeline = joblib.load(self.model_path, mmap_mode='r' if self.shared_loading else None)
+                self.batch_builder = None
+                self._compile_inference()
                 self.is_trained = True
                 logger.info(f"Model loaded from {self.model_path}")
                 return True
@@ -570,6 +506,60 @@ class GlucosePredictionModel:
             logger.error(f"Error loading model: {str(e)}")
             return False
     
+    def _load_shared(self) -> bool:
+        """
+        Serve the model from the lite artifact saved with it, memory-mapped.
+        
+        Every process mapping the artifact shares its pages, whereas unpickled trees are
+        copied into each process. The pipeline is not loaded: predictions of every batch
+        size run on the flat forest.
+        
+        Returns:
+            True if the artifact was loaded, False to load the pipeline instead
+        """
+        lite_path = lite_model_path(self.model_path)
+        if not os.path.exists(lite_path):
+            logger.warning(f"No lite artifact at {lite_path}; loading the pipeline")
+            return False
+        if os.path.exists(self.model_path) and os.path.getmtime(lite_path) < os.path.getmtime(self.model_path):
+            logger.warning(f"Lite artifact {lite_path} is older than {self.model_path}; loading the pipeline")
+            return False
+        
+        try:
+            lite = LiteModel(lite_path, mmap=True)
+        except ValueError as e:
+            logger.warning(f"Cannot serve from {lite_path}: {str(e)}; loading the pipeline")
+            return False
+        if lite.model != 'glucose':
+            logger.warning(f"{lite_path} holds a {lite.model} model; loading the pipeline")
+            return False
+        
+        self.pipeline = None
+        self.compiled = lite.compiled
+        self.row_builder = lite.row_builder
+        self.batch_builder = None
+        self.is_trained = True
+        logger.info(f"Model memory-mapped from {lite_path}")
+        return True
+    
+    def _load_when_due(self) -> bool:
+        """
+        Load the model on demand, retrying a missing or unloadable one only after a backoff,
+        so requests meanwhile do not touch the filesystem.
+        
+        Returns:
+            True if the model is loaded
+        """
+        if not self.load_backoff.due():
+            return False
+        if self.load_model():
+            self.load_backoff.succeeded()
+            return True
+        
+        delay = self.load_backoff.failed()
+        logger.warning(f"Model not trained. Using fallback calculation (next load attempt in {delay:.0f}s).")
+        return False
+    
     def predict(self, current_glucose: float, insulin_dose: float = 0, 
                 carb_intake: float = 0, exercise_duration: float = 0, 
                 exercise_intensity: float = 0, **kwargs) -> Dict[str, Union[float, Dict[str, float]]]:
@@ -582,22 +572,24 @@ class GlucosePredictionModel:
             carb_intake: Recent carb intake (grams)
             exercise_duration: Recent exercise duration (minutes)
             exercise_intensity: Recent exercise intensity (1-3)
-            **kwargs: Additional features
+            **kwargs: Additional features; insulin_history and carb_history give all
+                recent doses and meals as (minutes ago, amount) pairs
             
         Returns:
             Dictionary with prediction results
         """
-        # Try to load model if not trained
-        if not self.is_trained and not self.load_model():
-            logger.warning("Model not trained. Using fallback calculation.")
+        # Try to load model if not trained (a missing model is retried after a backoff)
+        if not self.is_trained and not self._load_when_due():
             return self._rule_based_calculation(
                 current_glucose, insulin_dose, carb_intake, 
                 exercise_duration, exercise_intensity
             )
         
         try:
-            # Create input data for prediction
-            input_data = {
+            # Request in feature names; the spec fills lags, time flags, times since events,
+            # active and on-board amounts (from insulin_history/carb_history if given) and trend defaults
+            request = {
+                **kwargs,
                 'current_glucose': current_glucose,
                 'recent_insulin_dose': insulin_dose,
                 'recent_carb_intake': carb_intake,
@@ -605,70 +597,8 @@ class GlucosePredictionModel:
                 'recent_exercise_intensity': exercise_intensity
             }
             
-            # Add time-based features if available
-            if 'hour' in kwargs:
-                hour = kwargs['hour']
-                input_data['hour'] = hour
-                input_data['is_morning'] = 1 if 5 <= hour <= 11 else 0
-                input_data['is_afternoon'] = 1 if 12 <= hour <= 17 else 0
-                input_data['is_evening'] = 1 if 18 <= hour <= 23 else 0
-                input_data['is_night'] = 1 if 0 <= hour <= 4 else 0
-            
-            # Add time since events if available
-            if 'minutes_since_insulin' in kwargs:
-                input_data['minutes_since_insulin'] = kwargs['minutes_since_insulin']
-            elif insulin_dose > 0:
-                input_data['minutes_since_insulin'] = 0  # Just taken
-            else:
-                input_data['minutes_since_insulin'] = 300  # Default to 5 hours
-                
-            if 'minutes_since_carbs' in kwargs:
-                input_data['minutes_since_carbs'] = kwargs['minutes_since_carbs']
-            elif carb_intake > 0:
-                input_data['minutes_since_carbs'] = 0  # Just eaten
-            else:
-                input_data['minutes_since_carbs'] = 240  # Default to 4 hours
-                
-            if 'minutes_since_exercise' in kwargs:
-                input_data['minutes_since_exercise'] = kwargs['minutes_since_exercise']
-            elif exercise_duration > 0:
-                input_data['minutes_since_exercise'] = 0  # Just exercised
-            else:
-                input_data['minutes_since_exercise'] = 360  # Default to 6 hours
-            
-            # Add trending data if available
-            if 'glucose_lag_1' in kwargs:
-                input_data['glucose_lag_1'] = kwargs['glucose_lag_1']
-            else:
-                input_data['glucose_lag_1'] = current_glucose
-                
-            if 'glucose_lag_2' in kwargs:
-                input_data['glucose_lag_2'] = kwargs['glucose_lag_2']
-            else:
-                input_data['glucose_lag_2'] = current_glucose
-                
-            if 'glucose_lag_3' in kwargs:
-                input_data['glucose_lag_3'] = kwargs['glucose_lag_3']
-            else:
-                input_data['glucose_lag_3'] = current_glucose
-            
-            # Calculate glucose velocity if not provided
-            if 'glucose_velocity' not in kwargs and 'glucose_lag_1' in input_data:
-                input_data['glucose_velocity'] = (current_glucose - input_data['glucose_lag_1']) / 5  # Assuming 5 min intervals
-            
-            # Add any other provided features
-            for key, value in kwargs.items():
-                if key not in input_data:
-                    input_data[key] = value
-            
-            # Create DataFrame
-            input_df = pd.DataFrame([input_data])
-            
-            # Preprocess input data
-            preprocessed_input = self.preprocess_data(input_df)
-            
             # Make prediction
-            prediction = self.pipeline.predict(preprocessed_input)[0]
+            prediction = self._predict_request(request)
             
             # Ensure realistic range
             prediction = max(40, min(400, prediction))
@@ -701,6 +631,175 @@ class GlucosePredictionModel:
                 exercise_duration, exercise_intensity
             )
     
+    def predict_batch(self, data: Union[pd.DataFrame, List[Dict]]) -> pd.DataFrame:
+        """
+        Predict future glucose levels for many requests in one vectorized call.
+        
+        Features are built, predicted, clamped and rounded over whole arrays. Rows the
+        model cannot score (missing required values), or every row if the model is
+        unavailable or fails, get the rule-based calculation instead.
+        
+        Args:
+            data: DataFrame or list of records with current_glucose and optionally the
+                other predict arguments (insulin_dose, carb_intake, exercise_duration,
+                exercise_intensity), feature values, insulin_history and carb_history
+            
+        Returns:
+            DataFrame with predictedGlucose, insulinEffect, carbEffect, exerciseEffect
+            and method for each request, in input order
+        """
+        requests = data if isinstance(data, pd.DataFrame) else pd.DataFrame.from_records(list(data))
+        requests = requests.rename(columns={
+            argument: feature for argument, feature in PREDICT_ARGUMENT_FEATURES.items()
+            if argument in requests.columns and feature not in requests.columns
+        })
+        
+        model_available = self.is_trained or self._load_when_due()
+        
+        # Model inputs plus the predict arguments, with defaults and derived features filled
+        columns = self.get_input_features() if model_available else []
+        if self.batch_builder is None:
+            self.batch_builder = self.feature_spec.batch_builder(
+                list(dict.fromkeys(columns + list(PREDICT_ARGUMENT_FEATURES.values()))))
+        inputs = self.batch_builder(requests)
+        
+        current_glucose = inputs['current_glucose'].to_numpy()
+        insulin_dose = inputs['recent_insulin_dose'].to_numpy()
+        carb_intake = inputs['recent_carb_intake'].to_numpy()
+        exercise = inputs['recent_exercise_duration'].to_numpy() * inputs['recent_exercise_intensity'].to_numpy()
+        
+        # Rule-based calculation for every row; the effects scale with the prediction horizon
+        horizon_scale = self.prediction_horizon / 60
+        insulin_effect = insulin_dose * -3 * horizon_scale
+        carb_effect = carb_intake * 0.2 * horizon_scale
+        exercise_effect = exercise * -0.1 * horizon_scale
+        predicted = current_glucose + insulin_effect + carb_effect + exercise_effect
+        method = np.full(len(inputs), 'rule-based', dtype=object)
+        
+        if model_available:
+            features = inputs[columns]
+            scored = np.isfinite(features.to_numpy()).all(axis=1)
+            if not scored.all():
+                logger.warning(f"{(~scored).sum()} of {len(scored)} rows lack required features; "
+                               f"using the rule-based calculation for them")
+            
+            try:
+                if scored.any():
+                    ml_predicted = self._predict_rows(features[scored])
+                    predicted = predicted.copy()
+                    predicted[scored] = ml_predicted
+                    
+                    # The model's effects are explained per hour, as in predict
+                    insulin_effect = np.where(scored, insulin_dose * -3, insulin_effect)
+                    carb_effect = np.where(scored, carb_intake * 0.2, carb_effect)
+                    exercise_effect = np.where(scored, exercise * -0.1, exercise_effect)
+                    method[scored] = 'ml-model'
+            except Exception as e:
+                logger.error(f"Error in ML batch prediction: {str(e)}")
+                logger.info("Falling back to rule-based calculation")
+        
+        # Ensure realistic range and round to whole numbers
+        return pd.DataFrame({
+            'predictedGlucose': np.round(np.clip(predicted, 40, 400)),
+            'insulinEffect': np.round(insulin_effect, 1),
+            'carbEffect': np.round(carb_effect, 1),
+            'exerciseEffect': np.round(exercise_effect, 1),
+            'method': method
+        }, index=requests.index)
+    
+    def get_input_features(self) -> List[str]:
+        """
+        Get the input columns of the model, in the order it expects them.
+        
+        Returns:
+            Columns the trained model was fitted on, or all configured features
+        """
+        if self.pipeline is not None and hasattr(self.pipeline, 'feature_names_in_'):
+            return list(self.pipeline.feature_names_in_)
+        if self.compiled is not None:
+            return list(self.compiled.columns)
+        return list(self.all_features)
+    
+    def get_inference_path(self) -> str:
+        """
+        Get the path single predictions take through the trained model.
+        
+        Returns:
+            'flat-forest' or 'compiled' for the precompiled numpy paths, 'pipeline' otherwise
+        """
+        return self.compiled.kind if self.compiled is not None else 'pipeline'
+    
+    def _compile_inference(self) -> None:
+        """
+        Precompile the single-row inference path for the current pipeline.
+        
+        The row builder and the pipeline's fitted scaler parameters, category maps and
+        feature order are compiled once here rather than per request. Pipelines that
+        cannot be compiled keep predicting through scikit-learn.
+        """
+        self.row_builder = self.feature_spec.row_builder(self.get_input_features())
+        self.compiled = compile_pipeline(self.pipeline)
+        if self.compiled is None:
+            logger.info("Pipeline has no compiled inference path; predicting through the pipeline")
+    
+    def _predict_request(self, request: Dict) -> float:
+        """
+        Predict a single request with the trained model.
+        
+        Args:
+            request: Feature values by name plus extra inputs such as insulin_history
+            
+        Returns:
+            Model prediction
+        """
+        if self.compiled is not None:
+            # One numpy row straight to the estimator, without a DataFrame or pipeline dispatch
+            return self.compiled.predict_row(self._input_row(request))
+        return self.pipeline.predict(self._input_frame(request))[0]
+    
+    def _predict_rows(self, features: pd.DataFrame) -> np.ndarray:
+        """
+        Predict a batch of model input rows with the trained model.
+        
+        Args:
+            features: Model input columns, in order
+            
+        Returns:
+            Array of model predictions
+        """
+        if self.compiled is not None:
+            # In the calling thread for small batches, over INFERENCE_N_JOBS workers for large ones
+            return self.compiled.predict(features.to_numpy(dtype=np.float64))
+        return self.pipeline.predict(features)
+    
+    def _input_row(self, request: Dict) -> np.ndarray:
+        """
+        Build the model input row for a prediction request.
+        
+        Args:
+            request: Feature values by name plus extra inputs such as insulin_history
+            
+        Returns:
+            Float64 array of the model's input columns, in order
+        """
+        # Compile the row builder once per loaded pipeline
+        if self.row_builder is None:
+            self.row_builder = self.feature_spec.row_builder(self.get_input_features())
+        
+        return self.row_builder(request)
+    
+    def _input_frame(self, request: Dict) -> pd.DataFrame:
+        """
+        Build the one-row model input for a prediction request.
+        
+        Args:
+            request: Feature values by name plus extra inputs such as insulin_history
+            
+        Returns:
+            Single-row DataFrame with the model's input columns
+        """
+        return pd.DataFrame(self._input_row(request)[np.newaxis, :], columns=self.get_input_features())
+    
     def _rule_based_calculation(self, current_glucose: float, insulin_dose: float = 0, 
                               carb_intake: float = 0, exercise_duration: float = 0, 
                               exercise_intensity: float = 0) -> Dict[str, Union[float, Dict[str, float]]]:
@@ -0,0 +1,178 @@
+# glucose_trends.py
+# Multi-scale glucose trend features (time-window statistics and EWMAs) shared by feature engineering and the models
+
+import numpy as np
+from typing import Dict, Tuple
+
+# Trailing time windows for mean, std, min, max and slope. A window of W minutes holds the
+# readings within W minutes minus half a CGM interval, i.e. W / 5 readings on a full grid.
+TREND_WINDOW_MINUTES = [15, 30, 60, 120, 240]
+TREND_STATISTICS = ['mean', 'std', 'min', 'max', 'slope']
+TREND_WINDOW_MARGIN_MINUTES = 2.5  # half a CGM interval
+
+# Exponentially weighted means: half-lives in minutes, truncated after TREND_EWMA_SPAN_HALF_LIVES
+TREND_EWMA_HALF_LIVES = [15, 30, 60]
+TREND_EWMA_SPAN_HALF_LIVES = 8
+
+# Every window is reduced from prefix sums that restart at blocks of this many minutes
+# (anchored at the epoch), so a window never spans more than two blocks
+TREND_WINDOW_BLOCK_MINUTES = max(TREND_WINDOW_MINUTES)
+
+# History a reading's trend features depend on: its longest window plus the block before it
+TREND_LOOKBACK_MINUTES = 2 * max(TREND_WINDOW_BLOCK_MINUTES,
+                                 TREND_EWMA_SPAN_HALF_LIVES * max(TREND_EWMA_HALF_LIVES))
+
+GLUCOSE_TREND_FEATURES = (
+    [f'glucose_{stat}_{window}min' for window in TREND_WINDOW_MINUTES for stat in TREND_STATISTICS] +
+    [f'glucose_ewma_{half_life}min' for half_life in TREND_EWMA_HALF_LIVES]
+)
+
+def _window_starts(minutes: np.ndarray, segment_starts: np.ndarray, span: float) -> np.ndarray:
+    """First position of each reading's window: readings within `span` minutes, same segment."""
+    return np.maximum(np.searchsorted(minutes, minutes - span), segment_starts)
+
+def block_prefix_sums(values: np.ndarray, blocks: np.ndarray) -> np.ndarray:
+    """
+    Cumulative sums of each column of values that restart at every block.
+
+    Args:
+        values: 2-D array (readings x quantities) in time order
+        blocks: Block number of each reading, ascending
+
+    Returns:
+        Array of block-local prefix sums, same shape as values
+    """
+    # Imported here: serving code imports the feature names above without pandas
+    import pandas as pd
+
+    return pd.DataFrame(values).groupby(blocks, sort=False).cumsum().to_numpy()
+
+def block_window_sums(prefix: np.ndarray, block_first: np.ndarray,
+                      starts: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Sum each quantity over positions starts[i]..i from block-local prefix sums.
+
+    A window's sum only depends on the readings of the (at most two) blocks it
+    overlaps and never on how much earlier history is present. Quantities that are
+    relative to the block start can be shifted by the caller, as the two blocks are
+    returned separately.
+
+    Args:
+        prefix: Block-local prefix sums from block_prefix_sums
+        block_first: Position of the first reading of each reading's block
+        starts: First position of each reading's window (at most one block boundary back)
+
+    Returns:
+        Tuple of (sums over the reading's own block, sums over the preceding block)
+    """
+    # Prefix sum just before the window start, within the block of the window start
+    start_first = block_first[starts]
+    before_start = np.where((starts > start_first)[:, None], prefix[np.maximum(starts - 1, 0)], 0.0)
+
+    in_block = (starts >= block_first)[:, None]
+    current = np.where(in_block, prefix - before_start, prefix)
+    previous_total = prefix[np.maximum(block_first - 1, 0)]
+    previous = np.where(in_block, 0.0, previous_total - before_start)
+
+    return current, previous
+
+def range_extrema(values: np.ndarray, starts: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Minimum and maximum of values[starts[i]..i] from a sparse table of power-of-two ranges.
+
+    Args:
+        values: Values in time order
+        starts: First position of each reading's window
+
+    Returns:
+        Tuple of (minimum, maximum) arrays
+    """
+    n = len(values)
+    positions = np.arange(n)
+    lengths = positions - starts + 1
+
+    # Level k holds the extrema of the 2**k values starting at each position
+    minima, maxima = [values], [values]
+    for k in range(1, int(lengths.max()).bit_length()):
+        half = 1 << (k - 1)
+        minima.append(np.minimum(minima[-1], np.concatenate([minima[-1][half:], np.full(half, np.inf)])))
+        maxima.append(np.maximum(maxima[-1], np.concatenate([maxima[-1][half:], np.full(half, -np.inf)])))
+
+    # Two overlapping ranges of the largest power of two that fits cover each window
+    level = np.frexp(lengths)[1] - 1
+    tail = positions - (1 << level) + 1
+    minima, maxima = np.stack(minima), np.stack(maxima)
+
+    return (np.minimum(minima[level, starts], minima[level, tail]),
+            np.maximum(maxima[level, starts], maxima[level, tail]))
+
+def glucose_trend_features(seconds: np.ndarray, values: np.ndarray,
+                           segments: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Compute the multi-scale trend features of one patient's glucose readings in one pass.
+
+    Windows are time-based and stop at the start of the reading's segment. Sums for
+    mean, std and slope come from block-local prefix sums and min/max from a sparse
+    table, so every window is reduced without a rolling call per window.
+
+    Args:
+        seconds: Reading times in epoch seconds, ascending
+        values: Glucose values
+        segments: Segment number of each reading (ascending)
+
+    Returns:
+        Dictionary mapping each name in GLUCOSE_TREND_FEATURES to an array of values
+    """
+    seconds = np.asarray(seconds, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64)
+    minutes = seconds / 60
+    segment_starts = np.searchsorted(segments, segments)
+    features = {}
+
+    # Moments of value and block-relative time for mean, std and least-squares slope
+    block_seconds = TREND_WINDOW_BLOCK_MINUTES * 60
+    blocks = seconds // block_seconds
+    local = (seconds - blocks * block_seconds) / 60
+    moments = np.column_stack([np.ones_like(values), values, values ** 2, local, local ** 2, local * values])
+    prefix = block_prefix_sums(moments, blocks)
+    block_first = np.searchsorted(blocks, blocks)
+
+    for window in TREND_WINDOW_MINUTES:
+        starts = _window_starts(minutes, segment_starts, window - TREND_WINDOW_MARGIN_MINUTES)
+        current, previous = block_window_sums(prefix, block_first, starts)
+
+        # Readings of the preceding block are shifted to the time origin of the current block
+        shift = TREND_WINDOW_BLOCK_MINUTES
+        n = current[:, 0] + previous[:, 0]
+        sum_x = current[:, 1] + previous[:, 1]
+        sum_xx = current[:, 2] + previous[:, 2]
+        sum_t = current[:, 3] + (previous[:, 3] - shift * previous[:, 0])
+        sum_tt = current[:, 4] + (previous[:, 4] - 2 * shift * previous[:, 3] + shift ** 2 * previous[:, 0])
+        sum_tx = current[:, 5] + (previous[:, 5] - shift * previous[:, 1])
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = sum_x / n
+            variance = np.maximum(sum_xx - sum_x * mean, 0.0) / (n - 1)
+            slope = (n * sum_tx - sum_t * sum_x) / (n * sum_tt - sum_t ** 2)
+
+        window_min, window_max = range_extrema(values, starts)
+        features[f'glucose_mean_{window}min'] = mean
+        features[f'glucose_std_{window}min'] = np.where(n > 1, np.sqrt(variance), np.nan)
+        features[f'glucose_min_{window}min'] = window_min
+        features[f'glucose_max_{window}min'] = window_max
+        features[f'glucose_slope_{window}min'] = np.where(n > 1, slope, np.nan)
+
+    # EWMA: weights 2 ** ((t - block start) / half-life) per block; the preceding block is
+    # scaled by the exact power of two 2 ** -span, and the reading's own factor cancels out
+    for half_life in TREND_EWMA_HALF_LIVES:
+        span = TREND_EWMA_SPAN_HALF_LIVES * half_life
+        ewma_blocks = seconds // (span * 60)
+        weights = np.exp2((seconds - ewma_blocks * span * 60) / 60 / half_life)
+        prefix = block_prefix_sums(np.column_stack([weights, weights * values]), ewma_blocks)
+        current, previous = block_window_sums(prefix, np.searchsorted(ewma_blocks, ewma_blocks),
+                                              _window_starts(minutes, segment_starts, span))
+        scale = 2.0 ** -TREND_EWMA_SPAN_HALF_LIVES
+        features[f'glucose_ewma_{half_life}min'] = ((current[:, 1] + scale * previous[:, 1]) /
+                                                    (current[:, 0] + scale * previous[:, 0]))
+
+    return features
@@ -95,6 +95,11 @@ from sklearn.ensemble import GradientBoostingRegressor, RandomForestRegressor
 from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
 import joblib
 
+from compiled_pipeline import compile_pipeline
+from lite_model import LiteModel, SHARED_MODEL_LOADING, lite_model_path, save_lite_model
+from model_registry import LoadBackoff
+from feature_spec import INSULIN_FEATURE_SPEC
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -112,34 +117,42 @@ MODEL_PATH = os.path.join(MODEL_DIR, 'insulin_model.joblib')
 SCALER_PATH = os.path.join(MODEL_DIR, 'insulin_scaler.joblib')
 FEATURE_IMPORTANCE_PATH = os.path.join(MODEL_DIR, 'insulin_feature_importance.csv')
 
+# Features the dose explanation and the rule-based calculation are computed from
+EXPLANATION_FEATURES = [
+    'blood_glucose', 'carb_intake', 'exercise_time', 'weight',
+    'insulin_sensitivity_factor', 'insulin_to_carb_ratio'
+]
+
 class InsulinPredictionModel:
     """Advanced machine learning model for insulin dosage prediction."""
     
-    def __init__(self, model_path: str = MODEL_PATH, scaler_path: str = SCALER_PATH):
+    def __init__(self, model_path: str = MODEL_PATH, scaler_path: str = SCALER_PATH,
+                 shared_loading: bool = SHARED_MODEL_LOADING):
         """
         Initialize the insulin prediction model.
         
         Args:
             model_path: Path to save/load the model
             scaler_path: Path to save/load the scaler
+            shared_loading: Serve from the memory-mapped lite artifact (see load_model)
         """
         self.model_path = model_path
         self.scaler_path = scaler_path
+        self.shared_loading = shared_loading
+        self.load_backoff = LoadBackoff()
         self.model = None
         self.pipeline = None
         self.feature_names = None
         self.feature_importances = None
         self.is_trained = False
-        self.categorical_features = [
-            'is_morning', 'is_afternoon', 'is_evening', 'is_night',
-            'is_weekend', 'is_correction_dose'
-        ]
-        self.numerical_features = [
-            'blood_glucose', 'carb_intake', 'exercise_time', 'weight',
-            'insulin_sensitivity_factor', 'insulin_to_carb_ratio',
-            'previous_insulin_dose', 'hours_since_last_insulin',
-            'total_insulin_past_24h', 'active_insulin'
-        ]
+        self.row_builder = None
+        self.batch_builder = None
+        self.compiled = None
+        
+        # Features with their derivations and serving defaults are declared in feature_spec.py
+        self.feature_spec = INSULIN_FEATURE_SPEC
+        self.categorical_features = self.feature_spec.flags
+        self.numerical_features = self.feature_spec.numerical
         
         # Create model directory if it doesn't exist
         os.makedirs(os.path.dirname(self.model_path), exist_ok=True)
@@ -203,7 +216,7 @@ class InsulinPredictionModel:
     
     def preprocess_data(self, df: pd.DataFrame) -> pd.DataFrame:
         """
-        Preprocess the data for training or prediction.
+        Preprocess a batch of data for training or evaluation.
         
         Args:
             df: DataFrame with features
@@ -211,90 +224,9 @@ class InsulinPredictionModel:
         Returns:
             Preprocessed DataFrame
         """
-        # Create a copy to avoid modifying the original
-        df_copy = df.copy()
-        
-        # Add derived features for insulin prediction
-        
-        # Time-based feature: time of day
-        if 'hour' in df_copy.columns:
-            # Add time of day category if not present
-            if 'is_morning' not in df_copy.columns:
-                df_copy['is_morning'] = ((df_copy['hour'] >= 5) & (df_copy['hour'] <= 11)).astype(int)
-            if 'is_afternoon' not in df_copy.columns:
-                df_copy['is_afternoon'] = ((df_copy['hour'] >= 12) & (df_copy['hour'] <= 17)).astype(int)
-            if 'is_evening' not in df_copy.columns:
-                df_copy['is_evening'] = ((df_copy['hour'] >= 18) & (df_copy['hour'] <= 23)).astype(int)
-            if 'is_night' not in df_copy.columns:
-                df_copy['is_night'] = ((df_copy['hour'] >= 0) & (df_copy['hour'] <= 4)).astype(int)
-        else:
-            # Default to zeros if hour not available
-            for time_feature in ['is_morning', 'is_afternoon', 'is_evening', 'is_night']:
-                if time_feature not in df_copy.columns:
-                    df_copy[time_feature] = 0
-        
-        # Time-based feature: weekend
-        if 'day_of_week' in df_copy.columns:
-            if 'is_weekend' not in df_copy.columns:
-                df_copy['is_weekend'] = df_copy['day_of_week'].isin([5, 6]).astype(int)
-        else:
-            if 'is_weekend' not in df_copy.columns:
-                df_copy['is_weekend'] = 0
-        
-        # Dose type
-        if 'carb_intake' in df_copy.columns and 'is_correction_dose' not in df_copy.columns:
-            df_copy['is_correction_dose'] = (df_copy['carb_intake'] == 0).astype(int)
-        elif 'is_correction_dose' not in df_copy.columns:
-            df_copy['is_correction_dose'] = 0
-        
-        # Calculate insulin sensitivity factor if not present
-        if 'insulin_sensitivity_factor' not in df_copy.columns and 'weight' in df_copy.columns:
-            # Standard formula: 1800 ÷ Total Daily Insulin (TDI)
-            # Estimated TDI as % of body weight (typical range 0.5-0.8 U/kg)
-            estimated_tdi = df_copy['weight'] * 0.55  # Use mid-range estimate
-            df_copy['insulin_sensitivity_factor'] = 1800 / estimated_tdi
-        
-        # Calculate insulin-to-carb ratio if not present
-        if 'insulin_to_carb_ratio' not in df_copy.columns and 'weight' in df_copy.columns:
-            # Standard formula: 500 ÷ Total Daily Insulin (TDI)
-            estimated_tdi = df_copy['weight'] * 0.55  # Use mid-range estimate
-            df_copy['insulin_to_carb_ratio'] = 500 / estimated_tdi
-        
-        # Calculate active insulin (insulin on board)
-        if ('previous_insulin_dose' in df_copy.columns and 
-            'hours_since_last_insulin' in df_copy.columns and 
-            'active_insulin' not in df_copy.columns):
-            
-            # Calculate active insulin using biexponential model
-            def calc_active_insulin(row):
-                prev_dose = row['previous_insulin_dose']
-                hours = row['hours_since_last_insulin']
-                
-                if pd.isna(prev_dose) or pd.isna(hours) or prev_dose == 0 or hours >= 5:
-                    return 0.0
-                
-                # Simple biexponential model (approximate)
-                if hours <= 1:
-                    factor = 1.0 - 0.05 * hours  # Mostly still active
-                elif hours <= 3:
-                    factor = 0.95 - 0.25 * (hours - 1)  # Linear decay in mid-phase
-                else:
-                    factor = 0.45 * math.exp(-(hours - 3))  # Exponential tail
-                
-                return prev_dose * factor
-            
-            df_copy['active_insulin'] = df_copy.apply(calc_active_insulin, axis=1)
-        
-        # Handle missing values
-        for col in df_copy.columns:
-            # Numerical columns
-            if col in self.numerical_features:
-                df_copy[col] = df_copy[col].fillna(0)
-            # Categorical columns
-            elif col in self.categorical_features:
-                df_copy[col] = df_copy[col].fillna(0)
-        
-        return df_copy
+        # Derive missing features (time flags, dose type, ISF/ICR from weight, active insulin)
+        # and fill missing values as declared in the feature spec
+        return self.feature_spec.transform(df)
     
     def extract_features_and_target(self, df: pd.DataFrame) -> Tuple[pd.DataFrame, pd.Series]:
         """
@@ -323,8 +255,9 @@ class InsulinPredictionModel:
             logger.error("No valid features found in DataFrame")
             raise ValueError("No valid features found in DataFrame")
         
-        # Extract features and target
-        X = df[available_features]
+        # Extract features and target; features as float64, the dtype of served rows
+        # (scaling the float32 storage dtype moves values near split thresholds)
+        X = df[available_features].astype(np.float64)
         y = df[target_col]
         
         # Save feature names
@@ -371,9 +304,13 @@ class InsulinPredictionModel:
         
         # Build pipeline
         self.pipeline = self.build_pipeline()
+        self.row_builder = None
+        self.batch_builder = None
+        self.compiled = None
         
         # Train the model
         self.pipeline.fit(X_train, y_train)
+        self._compile_inference()
         
         # Evaluate on test set
         y_pred = self.pipeline.predict(X_test)
@@ -489,6 +426,9 @@ class InsulinPredictionModel:
         
         # Build base pipeline
         self.pipeline = self.build_pipeline()
+        self.row_builder = None
+        self.batch_builder = None
+        self.compiled = None
         
         # Define parameter grid
         param_grid = {
@@ -530,6 +470,7 @@ class InsulinPredictionModel:
         
         # Train on full dataset
         self.pipeline.fit(X, y)
+        self._compile_inference()
         
         # Save model
         self.save_model()
@@ -548,8 +489,18 @@ class InsulinPredictionModel:
         """Save the trained model and preprocessing pipeline to disk."""
         try:
             os.makedirs(os.path.dirname(self.model_path), exist_ok=True)
-            joblib.dump(self.pipeline, self.model_path)
+            # Uncompressed, so its arrays can be memory-mapped (mmap_mode='r'); written to a
+            # temporary file and renamed, so a reloading server never reads a partial model
+            temporary_path = f"{self.model_path}.tmp"
+            joblib.dump(self.pipeline, temporary_path, compress=0)
+            os.replace(temporary_path, self.model_path)
             logger.info(f"Model saved to {self.model_path}")
+            
+            # Standalone artifact for the numpy-only runtime (see lite_model.py)
+            if self.compiled is not None and self.compiled.kind == 'flat-forest':
+                save_lite_model(lite_model_path(self.model_path), self.compiled, 'insulin',
+                                output={'step': 0.5, 'min': 0})
+                logger.info(f"Lite model saved to {lite_model_path(self.model_path)}")
         except Exception as e:
             logger.error(f"Error saving model: {str(e)}")
     
@@ -557,12 +508,20 @@ class InsulinPredictionModel:
         """
         Load a trained model from disk.
         
+        With shared loading, the model is served from its memory-mapped lite artifact
+        when there is an up-to-date one, and otherwise unpickled with its arrays mapped.
+        
         Returns:
             True if model loaded successfully, False otherwise
         """
         try:
+            if self.shared_loading and self._load_shared():
+                return True
+            
             if os.path.exists(self.model_path):
-                self.pipeline = joblib.load(self.model_path)
+                self.pipeline = joblib.load(self.model_path, mmap_mode='r' if self.shared_loading else None)
+                self.batch_builder = None
+                self._compile_inference()
                 self.is_trained = True
                 logger.info(f"Model loaded from {self.model_path}")
                 return True
@@ -573,6 +532,60 @@ class InsulinPredictionModel:
             logger.error(f"Error loading model: {str(e)}")
             return False
     
+    def _load_shared(self) -> bool:
+        """
+        Serve the model from the lite artifact saved with it, memory-mapped.
+        
+        Every process mapping the artifact shares its pages, whereas unpickled trees are
+        copied into each process. The pipeline is not loaded: predictions of every batch
+        size run on the flat forest.
+        
+        Returns:
+            True if the artifact was loaded, False to load the pipeline instead
+        """
+        lite_path = lite_model_path(self.model_path)
+        if not os.path.exists(lite_path):
+            logger.warning(f"No lite artifact at {lite_path}; loading the pipeline")
+            return False
+        if os.path.exists(self.model_path) and os.path.getmtime(lite_path) < os.path.getmtime(self.model_path):
+            logger.warning(f"Lite artifact {lite_path} is older than {self.model_path}; loading the pipeline")
+            return False
+        
+        try:
+            lite = LiteModel(lite_path, mmap=True)
+        except ValueError as e:
+            logger.warning(f"Cannot serve from {lite_path}: {str(e)}; loading the pipeline")
+            return False
+        if lite.model != 'insulin':
+            logger.warning(f"{lite_path} holds a {lite.model} model; loading the pipeline")
+            return False
+        
+        self.pipeline = None
+        self.compiled = lite.compiled
+        self.row_builder = lite.row_builder
+        self.batch_builder = None
+        self.is_trained = True
+        logger.info(f"Model memory-mapped from {lite_path}")
+        return True
+    
+    def _load_when_due(self) -> bool:
+        """
+        Load the model on demand, retrying a missing or unloadable one only after a backoff,
+        so requests meanwhile do not touch the filesystem.
+        
+        Returns:
+            True if the model is loaded
+        """
+        if not self.load_backoff.due():
+            return False
+        if self.load_model():
+            self.load_backoff.succeeded()
+            return True
+        
+        delay = self.load_backoff.failed()
+        logger.warning(f"Model not trained. Using fallback calculation (next load attempt in {delay:.0f}s).")
+        return False
+    
     def predict(self, **kwargs) -> Dict[str, Union[float, Dict[str, float]]]:
         """
         Predict insulin dosage based on input parameters.
@@ -587,20 +600,13 @@ class InsulinPredictionModel:
         Returns:
             Dictionary with prediction results
         """
-        # Try to load model if not trained
-        if not self.is_trained and not self.load_model():
-            logger.warning("Model not trained. Using fallback calculation.")
+        # Try to load model if not trained (a missing model is retried after a backoff)
+        if not self.is_trained and not self._load_when_due():
             return self._rule_based_calculation(**kwargs)
         
         try:
-            # Create input DataFrame
-            input_data = pd.DataFrame([kwargs])
-            
-            # Preprocess data
-            preprocessed_data = self.preprocess_data(input_data)
-            
-            # Make prediction
-            prediction = self.pipeline.predict(preprocessed_data)[0]
+            # Make prediction; the spec fills defaults and derived features of the request
+            prediction = self._predict_request(kwargs)
             
             # Round to nearest 0.5 units for realistic dosing
             prediction = round(prediction * 2) / 2
@@ -625,6 +631,176 @@ class InsulinPredictionModel:
             # Fallback to rule-based calculation
             return self._rule_based_calculation(**kwargs)
     
+    def predict_batch(self, data: Union[pd.DataFrame, List[Dict]]) -> pd.DataFrame:
+        """
+        Predict insulin dosages for many requests in one vectorized call.
+        
+        Features are built, predicted and rounded over whole arrays. Rows the model
+        cannot score (missing required values), or every row if the model is
+        unavailable or fails, get the rule-based calculation instead.
+        
+        Args:
+            data: DataFrame or list of records with the predict parameters
+                (blood_glucose, carb_intake, exercise_time, weight, current_insulin_dosage, ...)
+            
+        Returns:
+            DataFrame with recommendedDosage, the explanation components (currentGlucose,
+            glucoseDifference, carbEffect, exerciseReduction), method and confidence
+            for each request, in input order
+        """
+        requests = data if isinstance(data, pd.DataFrame) else pd.DataFrame.from_records(list(data))
+        
+        model_available = self.is_trained or self._load_when_due()
+        
+        # Model inputs plus the explanation features, with defaults and derived features filled
+        columns = self.get_input_features() if model_available else []
+        if self.batch_builder is None:
+            self.batch_builder = self.feature_spec.batch_builder(list(dict.fromkeys(columns + EXPLANATION_FEATURES)))
+        inputs = self.batch_builder(requests)
+        
+        # Explanation components
+        target_glucose = 120
+        glucose_difference = inputs['blood_glucose'].to_numpy() - target_glucose
+        carb_effect = inputs['carb_intake'].to_numpy() / inputs['insulin_to_carb_ratio'].to_numpy()
+        exercise_time = inputs['exercise_time'].to_numpy()
+        exercise_reduction = np.where(exercise_time > 0, exercise_time * 0.2, 0)
+        
+        # Rule-based calculation for every row: no correction for low glucose
+        if 'current_insulin_dosage' in requests.columns:
+            current_insulin_dosage = pd.to_numeric(requests['current_insulin_dosage'], errors='coerce')
+            current_insulin_dosage = current_insulin_dosage.fillna(0).to_numpy()
+        else:
+            current_insulin_dosage = np.zeros(len(requests))
+        with np.errstate(invalid='ignore'):
+            glucose_adjustment = np.where(
+                glucose_difference > 0,
+                np.ceil(glucose_difference / inputs['insulin_sensitivity_factor'].to_numpy()),
+                0
+            )
+        dosage = np.maximum(0, current_insulin_dosage + glucose_adjustment + carb_effect - exercise_reduction)
+        method = np.full(len(inputs), 'rule-based', dtype=object)
+        
+        if model_available:
+            features = inputs[columns]
+            scored = np.isfinite(features.to_numpy()).all(axis=1)
+            if not scored.all():
+                logger.warning(f"{(~scored).sum()} of {len(scored)} rows lack required features; "
+                               f"using the rule-based calculation for them")
+            
+            try:
+                if scored.any():
+                    ml_dosage = self._predict_rows(features[scored])
+                    dosage = dosage.copy()
+                    dosage[scored] = ml_dosage
+                    method[scored] = 'ml-model'
+            except Exception as e:
+                logger.error(f"Error in ML batch prediction: {str(e)}")
+                logger.info("Falling back to rule-based calculation")
+        
+        # Round to nearest 0.5 units for realistic dosing and ensure dosage is positive
+        return pd.DataFrame({
+            'recommendedDosage': np.maximum(0, np.round(dosage * 2) / 2),
+            'currentGlucose': inputs['blood_glucose'].to_numpy(),
+            'glucoseDifference': np.round(glucose_difference, 1),
+            'carbEffect': np.round(carb_effect, 1),
+            'exerciseReduction': np.round(exercise_reduction, 1),
+            'method': method,
+            'confidence': np.where(method == 'ml-model', 0.85, 0.6)
+        }, index=requests.index)
+    
+    def get_input_features(self) -> List[str]:
+        """
+        Get the input columns of the model, in the order it expects them.
+        
+        Returns:
+            Columns the trained model was fitted on, or all configured features
+        """
+        if self.pipeline is not None and hasattr(self.pipeline, 'feature_names_in_'):
+            return list(self.pipeline.feature_names_in_)
+        if self.compiled is not None:
+            return list(self.compiled.columns)
+        return self.numerical_features + self.categorical_features
+    
+    def get_inference_path(self) -> str:
+        """
+        Get the path single predictions take through the trained model.
+        
+        Returns:
+            'flat-forest' or 'compiled' for the precompiled numpy paths, 'pipeline' otherwise
+        """
+        return self.compiled.kind if self.compiled is not None else 'pipeline'
+    
+    def _compile_inference(self) -> None:
+        """
+        Precompile the single-row inference path for the current pipeline.
+        
+        The row builder and the pipeline's fitted scaler parameters, category maps and
+        feature order are compiled once here rather than per request. Pipelines that
+        cannot be compiled keep predicting through scikit-learn.
+        """
+        self.row_builder = self.feature_spec.row_builder(self.get_input_features())
+        self.compiled = compile_pipeline(self.pipeline)
+        if self.compiled is None:
+            logger.info("Pipeline has no compiled inference path; predicting through the pipeline")
+    
+    def _predict_request(self, request: Dict) -> float:
+        """
+        Predict a single request with the trained model.
+        
+        Args:
+            request: Feature values by name
+            
+        Returns:
+            Model prediction
+        """
+        if self.compiled is not None:
+            # One numpy row straight to the estimator, without a DataFrame or pipeline dispatch
+            return self.compiled.predict_row(self._input_row(request))
+        return self.pipeline.predict(self._input_frame(request))[0]
+    
+    def _predict_rows(self, features: pd.DataFrame) -> np.ndarray:
+        """
+        Predict a batch of model input rows with the trained model.
+        
+        Args:
+            features: Model input columns, in order
+            
+        Returns:
+            Array of model predictions
+        """
+        if self.compiled is not None:
+            # In the calling thread for small batches, over INFERENCE_N_JOBS workers for large ones
+            return self.compiled.predict(features.to_numpy(dtype=np.float64))
+        return self.pipeline.predict(features)
+    
+    def _input_row(self, request: Dict) -> np.ndarray:
+        """
+        Build the model input row for a prediction request.
+        
+        Args:
+            request: Feature values by name
+            
+        Returns:
+            Float64 array of the model's input columns, in order
+        """
+        # Compile the row builder once per loaded pipeline
+        if self.row_builder is None:
+            self.row_builder = self.feature_spec.row_builder(self.get_input_features())
+        
+        return self.row_builder(request)
+    
+    def _input_frame(self, request: Dict) -> pd.DataFrame:
+        """
+        Build the one-row model input for a prediction request.
+        
+        Args:
+            request: Feature values by name
+            
+        Returns:
+            Single-row DataFrame with the model's input columns
+        """
+        return pd.DataFrame(self._input_row(request)[np.newaxis, :], columns=self.get_input_features())
+    
     def _extract_prediction_components(self, **kwargs) -> Dict[str, float]:
         """
         Extract components that contribute to the insulin prediction.
@@ -0,0 +1,277 @@
+# lite_model.py
+# Standalone lite model artifact (JSON header plus binary arrays) and a numpy-only runtime serving it
+
+import os
+import sys
+import json
+import struct
+import numpy as np
+from datetime import datetime
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+from compiled_pipeline import CompiledPipeline, FlatForest
+from feature_spec import GLUCOSE_FEATURE_SPEC, INSULIN_FEATURE_SPEC
+
+# File layout: magic, header length (uint64, little-endian), JSON header, then the arrays,
+# each starting at a multiple of LITE_ALIGNMENT bytes from the start of the file
+LITE_MAGIC = b'DTLITE\x00\x00'
+LITE_FORMAT = 'diabetes-tracker-lite'
+LITE_FORMAT_VERSION = 1
+LITE_ALIGNMENT = 64
+LITE_EXTENSION = '.lite'
+
+# Shared loading: serve from memory-mapped lite artifacts instead of unpickling the pipelines,
+# so every server process maps the same pages of the forests
+SHARED_MODEL_LOADING = os.environ.get('SHARED_MODEL_LOADING', '0') == '1'
+
+# Feature specifications by model name; artifacts record the fingerprint of theirs
+LITE_FEATURE_SPECS = {
+    'glucose': GLUCOSE_FEATURE_SPEC,
+    'insulin': INSULIN_FEATURE_SPEC
+}
+
+def lite_model_path(model_path: str) -> str:
+    """Path of the lite artifact saved next to a joblib model."""
+    return os.path.splitext(model_path)[0] + LITE_EXTENSION
+
+def save_lite_model(path: str, compiled: CompiledPipeline, model: str, aliases: Optional[Dict[str, str]] = None,
+                    output: Optional[Dict[str, float]] = None, **metadata) -> None:
+    """
+    Save a compiled pipeline with a flat forest as a lite artifact.
+
+    Args:
+        path: Artifact path
+        compiled: Compiled pipeline whose estimator is a FlatForest
+        model: Model name, a key of LITE_FEATURE_SPECS
+        aliases: Request names accepted for features (e.g. insulin_dose for recent_insulin_dose)
+        output: Rounding step and range of served predictions ('step', 'min', 'max')
+        **metadata: Extra header fields, e.g. prediction_horizon
+
+    Raises:
+        ValueError: If the estimator is not a FlatForest or the model name is unknown
+    """
+    if not isinstance(compiled.estimator, FlatForest):
+        raise ValueError("Only compiled pipelines with a flat forest can be saved as lite artifacts")
+    if model not in LITE_FEATURE_SPECS:
+        raise ValueError(f"Unknown lite model '{model}'")
+
+    arrays = {}
+
+    def add(name: str, array: Optional[np.ndarray]) -> Optional[str]:
+        if array is None:
+            return None
+        arrays[name] = np.ascontiguousarray(array)
+        return name
+
+    blocks = [
+        {
+            'kind': kind,
+            'positions': add(f'block{index}_positions', positions),
+            'first': add(f'block{index}_first', first),
+            'second': add(f'block{index}_second', second)
+        }
+        for index, (kind, positions, first, second) in enumerate(compiled.blocks)
+    ]
+    interactions = None
+    if compiled.interactions is not None:
+        interactions = [add('interactions_first', compiled.interactions[0]),
+                        add('interactions_second', compiled.interactions[1])]
+
+    forest = compiled.estimator
+    estimator = {
+        'kind': 'flat-forest',
+        'depth': forest.depth,
+        'baseline': forest.baseline,
+        'scale': forest.scale,
+        'divisor': forest.divisor,
+        'arrays': {name: add(f'forest_{name}', getattr(forest, name))
+                   for name in ['roots', 'feature', 'threshold', 'children', 'value']}
+    }
+
+    # Lay the arrays out after the header, aligned
+    layout = {}
+    offset = 0
+    for name, array in arrays.items():
+        layout[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset += -(-array.nbytes // LITE_ALIGNMENT) * LITE_ALIGNMENT
+
+    header = {
+        'format': LITE_FORMAT,
+        'format_version': LITE_FORMAT_VERSION,
+        'model': model,
+        'feature_spec': LITE_FEATURE_SPECS[model].fingerprint(),
+        'columns': list(compiled.columns),
+        'aliases': aliases or {},
+        'output': output or {},
+        'created': datetime.now().isoformat(),
+        'metadata': metadata,
+        'blocks': blocks,
+        'interactions': interactions,
+        'estimator': estimator,
+        'arrays': layout
+    }
+    header_bytes = json.dumps(header).encode('utf-8')
+    data_start = -(-(len(LITE_MAGIC) + 8 + len(header_bytes)) // LITE_ALIGNMENT) * LITE_ALIGNMENT
+
+    # Written to a temporary file and renamed, so readers never see a partial artifact
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, 'wb') as file:
+        file.write(LITE_MAGIC + struct.pack('<Q', len(header_bytes)) + header_bytes)
+        for name, array in arrays.items():
+            file.seek(data_start + layout[name]['offset'])
+            file.write(array.tobytes())
+        file.truncate(data_start + offset)
+    os.replace(temporary_path, path)
+
+def read_lite_artifact(path: str, mmap: bool = False) -> Tuple[Dict[str, Any], Dict[str, np.ndarray]]:
+    """
+    Read the header and arrays of a lite artifact.
+
+    Args:
+        path: Artifact path
+        mmap: Memory-map the file instead of reading it, so processes mapping the same
+            artifact share its pages (and only the pages predictions touch are loaded)
+
+    Returns:
+        Tuple of (header, arrays by name); the arrays are read-only views of the file contents
+
+    Raises:
+        ValueError: If the file is not a lite artifact of a supported format version
+    """
+    header_start = len(LITE_MAGIC) + 8
+    with open(path, 'rb') as file:
+        prefix = file.read(header_start)
+        if len(prefix) < header_start or prefix[:len(LITE_MAGIC)] != LITE_MAGIC:
+            raise ValueError(f"{path} is not a lite model artifact")
+        (header_length,) = struct.unpack_from('<Q', prefix, len(LITE_MAGIC))
+        header_bytes = file.read(header_length)
+        content = None if mmap else prefix + header_bytes + file.read()
+
+    if mmap:
+        # A plain ndarray view of the mapping, so results of indexing are plain arrays
+        content = np.asarray(np.memmap(path, dtype=np.uint8, mode='r'))
+
+    header = json.loads(header_bytes.decode('utf-8'))
+    if header.get('format') != LITE_FORMAT or header.get('format_version') != LITE_FORMAT_VERSION:
+        raise ValueError(f"Unsupported lite artifact format {header.get('format')} "
+                         f"version {header.get('format_version')} in {path}")
+
+    data_start = -(-(header_start + header_length) // LITE_ALIGNMENT) * LITE_ALIGNMENT
+    arrays = {
+        name: np.frombuffer(content, dtype=np.dtype(layout['dtype']),
+                            count=int(np.prod(layout['shape'], dtype=np.int64)),
+                            offset=data_start + layout['offset']).reshape(layout['shape'])
+        for name, layout in header['arrays'].items()
+    }
+    return header, arrays
+
+class LiteModel:
+    """
+    Numpy-only runtime for a lite model artifact.
+
+    Requests are resolved by the same feature specification as the full models
+    (defaults, derived features, event histories), transformed by the compiled
+    preprocessing and evaluated on the flat forest; pandas and scikit-learn are never
+    imported. There is no rule-based fallback: invalid requests raise ValueError.
+    """
+
+    def __init__(self, path: str, mmap: bool = False):
+        """
+        Load a lite artifact.
+
+        Args:
+            path: Artifact path
+            mmap: Memory-map the artifact's arrays (see read_lite_artifact)
+
+        Raises:
+            ValueError: If the artifact is invalid or was built with a different feature specification
+        """
+        header, arrays = read_lite_artifact(path, mmap)
+
+        spec = LITE_FEATURE_SPECS.get(header['model'])
+        if spec is None:
+            raise ValueError(f"Unknown lite model '{header['model']}' in {path}")
+        if header['feature_spec'] != spec.fingerprint():
+            raise ValueError(f"{path} was built with a different {header['model']} feature specification; "
+                             f"retrain and save the model again")
+
+        def array(name: Optional[str]) -> Optional[np.ndarray]:
+            return None if name is None else arrays[name]
+
+        blocks = [(block['kind'], array(block['positions']), array(block['first']), array(block['second']))
+                  for block in header['blocks']]
+        interactions = None
+        if header['interactions'] is not None:
+            interactions = tuple(array(name) for name in header['interactions'])
+
+        estimator = header['estimator']
+        forest = FlatForest(depth=estimator['depth'], baseline=estimator['baseline'], scale=estimator['scale'],
+                            divisor=estimator['divisor'],
+                            **{name: arrays[key] for name, key in estimator['arrays'].items()})
+
+        self.path = path
+        self.header = header
+        self.model = header['model']
+        self.columns = header['columns']
+        self.aliases = header['aliases']
+        self.output = header['output']
+        self.metadata = header['metadata']
+        self.compiled = CompiledPipeline(self.columns, blocks, interactions, forest)
+        self.row_builder = spec.row_builder(self.columns)
+
+    def predict(self, request: Dict[str, Any]) -> float:
+        """
+        Predict a single request.
+
+        Args:
+            request: Feature values by name (or alias) plus extra inputs such as insulin_history
+
+        Returns:
+            Prediction, rounded and limited as the model's predict reports it
+
+        Raises:
+            ValueError: If a required feature is missing or a value is not finite
+        """
+        return float(self.predict_batch([request])[0])
+
+    def predict_batch(self, requests: Sequence[Dict[str, Any]]) -> np.ndarray:
+        """
+        Predict many requests in one vectorized evaluation.
+
+        Args:
+            requests: Requests as for predict
+
+        Returns:
+            Array of predictions, in request order
+
+        Raises:
+            ValueError: If a required feature is missing or a value is not finite
+        """
+        rows = np.empty((len(requests), len(self.columns)))
+        for index, request in enumerate(requests):
+            rows[index] = self.row_builder({self.aliases.get(name, name): value for name, value in request.items()})
+
+        predictions = self.compiled.predict(rows)
+
+        if 'step' in self.output:
+            predictions = np.round(predictions / self.output['step']) * self.output['step']
+        if 'min' in self.output or 'max' in self.output:
+            predictions = np.clip(predictions, self.output.get('min'), self.output.get('max'))
+        return predictions
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Predict with a lite model artifact')
+    parser.add_argument('artifact', type=str, help='Path to the .lite artifact')
+    parser.add_argument('requests', type=str, nargs='*',
+                        help='JSON requests (one object each); read one per line from stdin if omitted')
+
+    args = parser.parse_args()
+
+    lite_model = LiteModel(args.artifact)
+    lines = args.requests or [line for line in sys.stdin if line.strip()]
+    predictions = lite_model.predict_batch([json.loads(line) for line in lines])
+    for prediction in predictions:
+        print(json.dumps(float(prediction)))
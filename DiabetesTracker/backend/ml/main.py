@@ -52,7 +52,7 @@ import numpy as np
 from typing import Dict, List, Optional, Union
 
 # Import custom modules
-from feature_engineering import DiabetesDataProcessor
+from feature_engineering import DiabetesDataProcessor, STREAM_MEMORY_BUDGET_MB
 from insulin_prediction import InsulinPredictionModel
 from glucose_prediction_model import GlucosePredictionModel
 
@@ -72,13 +72,13 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DATA_DIR = os.path.join(BASE_DIR, 'data')
 RAW_DATA_DIR = os.path.join(DATA_DIR, 'raw')
 PROCESSED_DATA_DIR = os.path.join(DATA_DIR, 'processed')
+CACHE_DIR = os.path.join(DATA_DIR, 'cache')
+INCREMENTAL_STATE_DIR = os.path.join(DATA_DIR, 'incremental')
 MODELS_DIR = os.path.join(BASE_DIR, 'models')
 
 # Define processed data paths
 PROCESSED_GLUCOSE_DATA = os.path.join(PROCESSED_DATA_DIR, 'glucose_data.csv')
 PROCESSED_INSULIN_DATA = os.path.join(PROCESSED_DATA_DIR, 'insulin_data.csv')
-TRAINING_GLUCOSE_DATA = os.path.join(PROCESSED_DATA_DIR, 'training_glucose_data.csv')
-TRAINING_INSULIN_DATA = os.path.join(PROCESSED_DATA_DIR, 'training_insulin_data.csv')
 
 # Define model paths
 INSULIN_MODEL_PATH = os.path.join(MODELS_DIR, 'insulin_model.joblib')
@@ -91,21 +91,44 @@ def setup_directories() -> None:
         os.makedirs(directory, exist_ok=True)
         logger.info(f"Created directory: {directory}")
 
-def process_data(data_dir: str = RAW_DATA_DIR, use_example_data: bool = False) -> Dict[str, pd.DataFrame]:
+def process_data(data_dir: str = RAW_DATA_DIR, use_example_data: bool = False,
+                 workers: int = 1, use_cache: bool = True,
+                 incremental: bool = False,
+                 memory_budget_mb: Optional[float] = None,
+                 export_csv: bool = False) -> Optional[Dict[str, pd.DataFrame]]:
     """
     Process CSV files and create training datasets.
     
     Args:
         data_dir: Directory containing raw CSV files
         use_example_data: Whether to use example data instead of real data
+        workers: Number of worker processes for per-patient processing
+        use_cache: Whether to reuse cached frames for unchanged raw files
+        incremental: Whether to only process rows added since the last incremental run
+        memory_budget_mb: Stream raw files in chunks within this budget (default: load whole files)
+        export_csv: Whether to also write the training datasets as CSV files
         
     Returns:
-        Dictionary with processed datasets
+        Dictionary with processed datasets, or None when streaming (datasets are only written to disk)
+        
+    Raises:
+        ValueError: If streaming is combined with example data, incremental updates or workers
     """
+    if memory_budget_mb is not None:
+        # Streaming writes each patient's rows as they finish, so it cannot extend stored rows,
+        # fan patients out to workers or replace the raw files with example data
+        conflicts = [option for option, used in [('example data', use_example_data), ('incremental', incremental),
+                                                 ('workers', workers != 1)] if used]
+        if conflicts:
+            raise ValueError(f"Streaming cannot be combined with {', '.join(conflicts)}")
+        if use_cache:
+            logger.warning("Streaming does not use the processing cache; all raw files are reprocessed")
+    
     logger.info("Starting data processing...")
     
     # Create data processor
-    processor = DiabetesDataProcessor(output_dir=PROCESSED_DATA_DIR)
+    processor = DiabetesDataProcessor(output_dir=PROCESSED_DATA_DIR,
+                                      cache_dir=CACHE_DIR if use_cache else None)
     
     if use_example_data:
         logger.info("Using example data")
@@ -122,26 +145,73 @@ def process_data(data_dir: str = RAW_DATA_DIR, use_example_data: bool = False) -
             logger.error(f"No CSV files found in {data_dir}")
             raise FileNotFoundError(f"No CSV files found in {data_dir}")
         
-        # Process CSV files
-        glucose_df, insulin_df = processor.process_csv_files(csv_files)
+        if memory_budget_mb is not None:
+            # Write training datasets as patients finish instead of holding them in memory
+            processor.stream_csv_files(csv_files, memory_budget_mb, 'training')
+            logger.info("Data processing completed")
+            return None
+        
+        if incremental:
+            # Extend the stored training rows with new raw rows only
+            datasets = processor.update_training_datasets(csv_files, INCREMENTAL_STATE_DIR)
+        else:
+            # Process CSV files
+            glucose_df, insulin_df = processor.process_csv_files(csv_files, workers=workers)
     
     # Create training datasets
-    datasets = processor.create_training_datasets(glucose_df, insulin_df)
+    if not incremental or use_example_data:
+        datasets = processor.create_training_datasets(glucose_df, insulin_df)
+    
+    # Report dataset memory by column
+    for name, df in datasets.items():
+        report = processor.memory_report(df)
+        largest = ', '.join(f"{col} {nbytes / 1024:.0f} KB" for col, nbytes in report['bytes'].head(3).items())
+        logger.info(f"{name} training dataset: {len(df)} rows, {report['bytes'].sum() / 1024 ** 2:.1f} MB "
+                    f"(largest columns: {largest})")
     
     # Save datasets
-    paths = processor.save_datasets(datasets, 'training')
+    paths = processor.save_datasets(datasets, 'training', ['columnar', 'csv'] if export_csv else ['columnar'])
     
     logger.info("Data processing completed")
     
     return datasets
 
-def train_models(datasets: Dict[str, pd.DataFrame], tune_hyperparams: bool = False) -> Dict[str, Dict[str, float]]:
+def generate_data(output_dir: str, n_patients: int = 10, days: float = 30, seed: int = 42) -> List[str]:
+    """
+    Write a synthetic cohort as raw CSV exports, one file per patient.
+    
+    Args:
+        output_dir: Directory for the CSV files
+        n_patients: Number of patients
+        days: Days of data per patient
+        seed: Random seed
+        
+    Returns:
+        List of written file paths
+    """
+    processor = DiabetesDataProcessor(output_dir=PROCESSED_DATA_DIR)
+    raw_df = processor.generate_synthetic_cohort(n_patients=n_patients, days=days, seed=seed)
+    
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    for patient_id, patient_df in raw_df.groupby('id', sort=False):
+        path = os.path.join(output_dir, f"synthetic_{int(patient_id)}.csv")
+        patient_df.to_csv(path, index=False)
+        paths.append(path)
+    
+    logger.info(f"Wrote {len(raw_df)} synthetic rows for {n_patients} patients to {output_dir}")
+    
+    return paths
+
+def train_models(datasets: Dict[str, pd.DataFrame], tune_hyperparams: bool = False,
+                 use_trend_features: bool = False) -> Dict[str, Dict[str, float]]:
     """
     Train glucose and insulin prediction models.
     
     Args:
         datasets: Dictionary with training datasets
         tune_hyperparams: Whether to tune hyperparameters
+        use_trend_features: Whether the glucose models use the multi-scale trend features
         
     Returns:
         Dictionary with training results
@@ -168,7 +238,7 @@ def train_models(datasets: Dict[str, pd.DataFrame], tune_hyperparams: bool = Fal
         logger.info("Training glucose prediction model...")
         
         # Initialize model
-        glucose_model = GlucosePredictionModel(model_path=GLUCOSE_MODEL_PATH)
+        glucose_model = GlucosePredictionModel(model_path=GLUCOSE_MODEL_PATH, use_trend_features=use_trend_features)
         
         # Train or tune model
         if tune_hyperparams:
@@ -176,14 +246,16 @@ def train_models(datasets: Dict[str, pd.DataFrame], tune_hyperparams: bool = Fal
             results['glucose_model_30min'] = glucose_model.tune_hyperparameters(datasets['glucose'], 30)
             
             # Reinitialize with 60-min horizon
-            glucose_model = GlucosePredictionModel(model_path=GLUCOSE_MODEL_PATH.replace('.joblib', '_60min.joblib'), prediction_horizon=60)
+            glucose_model = GlucosePredictionModel(model_path=GLUCOSE_MODEL_PATH.replace('.joblib', '_60min.joblib'),
+                                                   prediction_horizon=60, use_trend_features=use_trend_features)
             results['glucose_model_60min'] = glucose_model.tune_hyperparameters(datasets['glucose'], 60)
         else:
             # Train for both 30-min and 60-min predictions
             results['glucose_model_30min'] = glucose_model.train(datasets['glucose'], 30)
             
             # Reinitialize with 60-min horizon
-            glucose_model = GlucosePredictionModel(model_path=GLUCOSE_MODEL_PATH.replace('.joblib', '_60min.joblib'), prediction_horizon=60)
+            glucose_model = GlucosePredictionModel(model_path=GLUCOSE_MODEL_PATH.replace('.joblib', '_60min.joblib'),
+                                                   prediction_horizon=60, use_trend_features=use_trend_features)
             results['glucose_model_60min'] = glucose_model.train(datasets['glucose'], 60)
     else:
         logger.warning("No glucose data available for training")
@@ -285,24 +357,25 @@ def test_glucose_prediction(current_glucose: float = 140, insulin_dose: float =
         print(f"  {key}: {value}")
     print("===============================\n")
 
-def start_api_server(port: int = 5002) -> None:
+def start_api_server(port: int = 5002, workers: int = 1) -> None:
     """
     Start the Flask API server.
     
     Args:
         port: Port to run the server on
+        workers: Worker processes, forked after the models are loaded
     """
     logger.info(f"Starting API server on port {port}...")
     
     try:
         # Import API module
-        from api import app
+        from api import serve
         
         # Set environment variables
         os.environ['PORT'] = str(port)
         
         # Run Flask app
-        app.run(host='0.0.0.0', port=port, debug=False)
+        serve(port=port, workers=workers)
     except Exception as e:
         logger.error(f"Error starting API server: {str(e)}")
         sys.exit(1)
@@ -316,10 +389,28 @@ def main() -> None:
     parser.add_argument('--process', action='store_true', help='Process raw data')
     parser.add_argument('--data-dir', type=str, default=RAW_DATA_DIR, help='Directory with raw CSV files')
     parser.add_argument('--example-data', action='store_true', help='Use example data instead of real data')
+    parser.add_argument('--workers', type=int, default=1, help='Worker processes for data processing (0 = all cores)')
+    parser.add_argument('--no-cache', action='store_true', help='Reprocess all raw files, ignoring the processing cache')
+    parser.add_argument('--incremental', action='store_true', help='Only process raw rows added since the last incremental run')
+    parser.add_argument('--stream', action='store_true',
+                        help='Stream raw files in chunks with bounded memory (no cache, workers or incremental updates)')
+    parser.add_argument('--memory-budget', type=float, default=STREAM_MEMORY_BUDGET_MB,
+                        help='Memory budget in MB for --stream')
+    parser.add_argument('--export-csv', action='store_true',
+                        help='Also write training datasets as CSV files (--stream always writes CSV)')
+    
+    # Synthetic data arguments
+    parser.add_argument('--generate-data', type=str, metavar='DIR',
+                        help='Write a synthetic cohort as raw CSV files to DIR (use with --data-dir DIR to process it)')
+    parser.add_argument('--patients', type=int, default=10, help='Number of synthetic patients')
+    parser.add_argument('--days', type=float, default=30, help='Days of synthetic data per patient')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed for synthetic data')
     
     # Model training arguments
     parser.add_argument('--train', action='store_true', help='Train prediction models')
     parser.add_argument('--tune', action='store_true', help='Tune model hyperparameters')
+    parser.add_argument('--trend-features', action='store_true',
+                        help='Train the glucose models with the multi-scale window and EWMA features')
     
     # Model testing arguments
     parser.add_argument('--test-insulin', action='store_true', help='Test insulin prediction')
@@ -328,35 +419,44 @@ def main() -> None:
     # API server arguments
     parser.add_argument('--api', action='store_true', help='Start API server')
     parser.add_argument('--port', type=int, default=5002, help='API server port')
+    parser.add_argument('--api-workers', type=int, default=1,
+                        help='API worker processes, forked after loading the models so they share them')
     
     # Parse arguments
     args = parser.parse_args()
     
+    if args.stream:
+        conflicts = [flag for flag, used in [('--example-data', args.example_data), ('--incremental', args.incremental),
+                                             ('--workers', args.workers != 1)] if used]
+        if conflicts:
+            parser.error(f"--stream cannot be combined with {', '.join(conflicts)}")
+    
     # Setup directories
     setup_directories()
     
+    # Generate synthetic raw data if requested
+    if args.generate_data:
+        generate_data(args.generate_data, args.patients, args.days, args.seed)
+    
     # Process data if requested
     datasets = None
     if args.process:
-        datasets = process_data(args.data_dir, args.example_data)
+        # Streaming reads every raw file anyway and does not use the cache
+        use_cache = not (args.no_cache or args.stream)
+        datasets = process_data(args.data_dir, args.example_data, args.workers, use_cache, args.incremental,
+                                args.memory_budget if args.stream else None, args.export_csv)
     
     # Train models if requested
     if args.train:
         if datasets is None:
             # Try to load processed data
             try:
-                datasets = {}
-                if os.path.exists(TRAINING_GLUCOSE_DATA):
-                    datasets['glucose'] = pd.read_csv(TRAINING_GLUCOSE_DATA)
-                    logger.info(f"Loaded glucose data from {TRAINING_GLUCOSE_DATA}")
-                
-                if os.path.exists(TRAINING_INSULIN_DATA):
-                    datasets['insulin'] = pd.read_csv(TRAINING_INSULIN_DATA)
-                    logger.info(f"Loaded insulin data from {TRAINING_INSULIN_DATA}")
+                # Columnar datasets are memory-mapped; CSV exports are parsed as a fallback
+                processor = DiabetesDataProcessor(output_dir=PROCESSED_DATA_DIR)
+                datasets = processor.load_datasets('training', mmap=True)
                 
                 if not datasets:
                     logger.warning("No processed data found. Using example data.")
-                    processor = DiabetesDataProcessor(output_dir=PROCESSED_DATA_DIR)
                     example_datasets = processor.create_example_dataset()
                     datasets = processor.create_training_datasets(example_datasets['glucose'], example_datasets['insulin'])
             except Exception as e:
@@ -367,7 +467,7 @@ def main() -> None:
                 datasets = processor.create_training_datasets(example_datasets['glucose'], example_datasets['insulin'])
         
         # Train models
-        train_models(datasets, args.tune)
+        train_models(datasets, args.tune, args.trend_features)
     
     # Test insulin prediction if requested
     if args.test_insulin:
@@ -380,10 +480,10 @@ def main() -> None:
     
     # Start API server if requested
     if args.api:
-        start_api_server(args.port)
+        start_api_server(args.port, args.api_workers)
     
     # If no action specified, provide usage information
-    if not any([args.process, args.train, args.test_insulin, args.test_glucose, args.api]):
+    if not any([args.generate_data, args.process, args.train, args.test_insulin, args.test_glucose, args.api]):
         parser.print_help()
         print("\nExample usage:")
         print("  # Process real data and train models")
@@ -392,6 +492,9 @@ def main() -> None:
         print("  # Use example data and train models")
         print("  python main.py --process --example-data --train")
         print()
+        print("  # Generate and process a synthetic cohort")
+        print("  python main.py --generate-data data/synthetic --patients 100 --days 30 --process --data-dir data/synthetic")
+        print()
         print("  # Start API server")
         print("  python main.py --api --port 5002")
 
@@ -88,19 +88,14 @@ def evaluate_insulin_model(test_data_path=None):
         # Add some noise
         actual_insulin += np.random.normal(0, 0.5, n_samples)
     
-    # Make predictions
-    predicted_insulin = []
-    for i in range(len(blood_glucose)):
-        prediction = insulin_model.predict(
-            # blood_glucose[i], carb_intake[i], exercise_time[i], weight[i]
-            blood_glucose=blood_glucose[i], 
-       carb_intake=carb_intake[i], 
-       exercise_time=exercise_time[i], 
-       weight=weight[i]
-        )
-        predicted_insulin.append(prediction['recommendedDosage'])
-    
-    predicted_insulin = np.array(predicted_insulin)
+    # Make predictions for all test rows in one vectorized call
+    predictions = insulin_model.predict_batch(pd.DataFrame({
+        'blood_glucose': blood_glucose,
+        'carb_intake': carb_intake,
+        'exercise_time': exercise_time,
+        'weight': weight
+    }))
+    predicted_insulin = predictions['recommendedDosage'].to_numpy()
     
     # Calculate metrics
     mae = mean_absolute_error(actual_insulin, predicted_insulin)
@@ -228,16 +223,15 @@ def evaluate_glucose_model(test_data_path=None):
         # Ensure glucose is in reasonable range
         actual_glucose = np.maximum(40, np.minimum(400, actual_glucose))
     
-    # Make predictions
-    predicted_glucose = []
-    for i in range(len(current_glucose)):
-        prediction = glucose_model.predict(
-            current_glucose[i], insulin_dose[i], carb_intake[i],
-            exercise_duration[i], exercise_intensity[i]
-        )
-        predicted_glucose.append(prediction['predictedGlucose'])
-    
-    predicted_glucose = np.array(predicted_glucose)
+    # Make predictions for all test rows in one vectorized call
+    predictions = glucose_model.predict_batch(pd.DataFrame({
+        'current_glucose': current_glucose,
+        'insulin_dose': insulin_dose,
+        'carb_intake': carb_intake,
+        'exercise_duration': exercise_duration,
+        'exercise_intensity': exercise_intensity
+    }))
+    predicted_glucose = predictions['predictedGlucose'].to_numpy()
     
     # Calculate metrics
     mae = mean_absolute_error(actual_glucose, predicted_glucose)
@@ -0,0 +1,362 @@
+# model_registry.py
+# Registry of served models: versioned artifacts, background loading with warmup, hot reload and negative caching
+
+import os
+import time
+import logging
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from lite_model import lite_model_path
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Seconds between checks of the artifacts for new versions (0 disables hot reload)
+MODEL_POLL_INTERVAL = float(os.environ.get('MODEL_POLL_INTERVAL', 10))
+
+# Backoff before retrying a missing or unloadable model, doubling per failure up to the maximum
+MODEL_LOAD_RETRY_SECONDS = float(os.environ.get('MODEL_LOAD_RETRY_SECONDS', 5))
+MODEL_LOAD_RETRY_MAX_SECONDS = float(os.environ.get('MODEL_LOAD_RETRY_MAX_SECONDS', 300))
+
+# Identity of an artifact version: modification time (ns) and size of the joblib model and of its lite artifact
+ArtifactStamp = Tuple[int, int, Optional[int], Optional[int]]
+
+def artifact_stamp(model_path: str) -> Optional[ArtifactStamp]:
+    """
+    Stamp of the artifacts saved at a model path.
+
+    Args:
+        model_path: Path of the joblib model
+
+    Returns:
+        Modification times and sizes of the model and its lite artifact, or None if there is no model
+    """
+    try:
+        model = os.stat(model_path)
+    except OSError:
+        return None
+    try:
+        lite = os.stat(lite_model_path(model_path))
+        lite_stamp = (lite.st_mtime_ns, lite.st_size)
+    except OSError:
+        lite_stamp = (None, None)
+    return (model.st_mtime_ns, model.st_size) + lite_stamp
+
+class LoadBackoff:
+    """Negative cache for a missing or unloadable model: when the next load attempt is due."""
+
+    def __init__(self, initial: float = MODEL_LOAD_RETRY_SECONDS, maximum: float = MODEL_LOAD_RETRY_MAX_SECONDS):
+        """
+        Initialize a backoff with no failed attempts.
+
+        Args:
+            initial: Seconds to wait after the first failure
+            maximum: Longest wait, reached by doubling per consecutive failure
+        """
+        self.initial = initial
+        self.maximum = maximum
+        self.delay = initial
+        self.failures = 0
+        self.retry_at = 0.0
+
+    def due(self) -> bool:
+        """Whether a load may be attempted now."""
+        return time.monotonic() >= self.retry_at
+
+    def retry_in(self) -> float:
+        """Seconds until the next attempt is due (0 if it is due)."""
+        return max(0.0, self.retry_at - time.monotonic())
+
+    def failed(self) -> float:
+        """
+        Record a failed attempt.
+
+        Returns:
+            Seconds until the next attempt is due
+        """
+        delay = self.delay
+        self.failures += 1
+        self.retry_at = time.monotonic() + delay
+        self.delay = min(delay * 2, self.maximum)
+        return delay
+
+    def disable(self) -> None:
+        """Never attempt again, e.g. for a model whose loading is managed elsewhere."""
+        self.retry_at = float('inf')
+
+    def succeeded(self) -> None:
+        """Record a successful attempt, resetting the backoff."""
+        self.delay = self.initial
+        self.failures = 0
+        self.retry_at = 0.0
+
+class ModelEntry:
+    """A served model: its current version and the load and warmup state of that version."""
+
+    def __init__(self, name: str, label: str, factory: Callable[[str], Any], path: str,
+                 warmup_request: Dict[str, Any]):
+        """
+        Initialize an entry whose model has not been loaded yet.
+
+        Args:
+            name: Key of the model in the registry and in API responses
+            label: Name of the model in log messages
+            factory: Creates an unloaded model for an artifact path
+            path: Path of the joblib model artifact
+            warmup_request: Synthetic predict arguments run on every version before it is served
+        """
+        self.name = name
+        self.label = label
+        self.factory = factory
+        self.path = path
+        self.warmup_request = warmup_request
+        self.model = factory(path)
+        self.version = 0
+        self.stamp = None
+        self.modified = None
+        self.loaded = False
+        self.warm = False
+        self.load_time = None
+        self.warmup_time = None
+        self.error = None
+        self.backoff = LoadBackoff()
+        self.failed_stamp = None
+        self.ready = threading.Event()
+        self.lock = threading.Lock()
+
+    def status(self) -> Dict[str, Any]:
+        """Version, load and warmup state for the health and readiness endpoints."""
+        return {
+            'loaded': self.loaded,
+            'warm': self.warm,
+            'version': self.version,
+            'modified': self.modified,
+            'load_time_ms': None if self.load_time is None else round(self.load_time * 1000),
+            'warmup_time_ms': None if self.warmup_time is None else round(self.warmup_time * 1000),
+            'error': self.error,
+            'retry_in': round(self.backoff.retry_in(), 1) if self.failed_stamp is not None else None
+        }
+
+class ModelRegistry:
+    """
+    Served models, loaded and warmed up in background threads and hot-reloaded from their artifacts.
+
+    Each model is read through get() per request. A new artifact version is built and warmed
+    up by the poller, off the request path, and then swapped in with a single reference
+    assignment: requests already holding the previous model finish on it. An artifact that
+    fails to load is not retried until it changes or its backoff has passed, and the
+    previous version keeps serving meanwhile.
+    """
+
+    def __init__(self, poll_interval: float = MODEL_POLL_INTERVAL):
+        """
+        Initialize an empty registry.
+
+        Args:
+            poll_interval: Seconds between checks for new artifact versions (0 disables hot reload)
+        """
+        self.poll_interval = poll_interval
+        self.entries = {}
+        self._lock = threading.Lock()
+        self._loading_started = False
+        self._polling_started = False
+        self._stop = threading.Event()
+
+    def register(self, name: str, label: str, factory: Callable[[str], Any], path: str,
+                 warmup_request: Dict[str, Any]) -> ModelEntry:
+        """
+        Register a model (see ModelEntry for the arguments).
+
+        Returns:
+            The model's entry
+        """
+        entry = ModelEntry(name, label, factory, path, warmup_request)
+        self.entries[name] = entry
+        return entry
+
+    def get(self, name: str) -> Any:
+        """Current version of a model; unloaded models serve their rule-based fallback."""
+        return self.entries[name].model
+
+    def is_ready(self) -> bool:
+        """
+        Whether every model is warmed up and serving.
+
+        An entry's ready event only marks the end of its initial load attempt, which is
+        also set when that attempt raised before warming a model up.
+        """
+        return all(entry.ready.is_set() and entry.warm for entry in self.entries.values())
+
+    def status(self) -> Dict[str, Dict[str, Any]]:
+        """Status of every model, by name."""
+        return {name: entry.status() for name, entry in self.entries.items()}
+
+    def start_loading(self) -> None:
+        """Start the initial load and warmup of all models concurrently in background threads (once)."""
+        with self._lock:
+            if self._loading_started:
+                return
+            self._loading_started = True
+
+        for entry in self.entries.values():
+            threading.Thread(target=self._initial_load, args=(entry,), name=f"load-{entry.name}",
+                             daemon=True).start()
+
+    def start_polling(self) -> None:
+        """
+        Start the background thread checking for new artifact versions (once per process).
+
+        Threads do not survive a fork, so forked workers call this themselves.
+        """
+        with self._lock:
+            if self._polling_started or self.poll_interval <= 0:
+                return
+            self._polling_started = True
+
+        threading.Thread(target=self._poll, name='model-poller', daemon=True).start()
+
+    def start(self) -> None:
+        """Start loading the models and polling for new versions."""
+        self.start_loading()
+        self.start_polling()
+
+    def stop(self) -> None:
+        """Stop polling for new versions."""
+        self._stop.set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Start loading the models if needed and wait until all of them are ready.
+
+        Args:
+            timeout: Seconds to wait in total, or None to wait indefinitely
+
+        Returns:
+            True if every model finished loading and is warmed up, False on timeout or
+            when a model could not be warmed up
+        """
+        self.start_loading()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for entry in self.entries.values():
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if not entry.ready.wait(remaining):
+                return False
+        return self.is_ready()
+
+    def reload(self, name: str, force: bool = False) -> bool:
+        """
+        Load a model's artifact if it changed since the served version, and swap it in.
+
+        Args:
+            name: Model name
+            force: Reload even if the artifact did not change or its backoff has not passed
+
+        Returns:
+            True if a new version is being served
+        """
+        entry = self.entries[name]
+        with entry.lock:
+            stamp = artifact_stamp(entry.path)
+            if not force:
+                if stamp == entry.stamp:
+                    return False
+                if stamp is not None and stamp == entry.failed_stamp and not entry.backoff.due():
+                    return False
+
+            if stamp is None and entry.loaded:
+                # Keep serving the loaded version; a new artifact is picked up when it appears
+                logger.warning(f"{entry.label} artifact {entry.path} disappeared; keeping version {entry.version}")
+                entry.stamp = None
+                return False
+
+            return self._load_version(entry, stamp)
+
+    def reload_changed(self) -> List[str]:
+        """
+        Reload every model whose artifact changed.
+
+        Returns:
+            Names of the models now serving a new version
+        """
+        reloaded = []
+        for name in self.entries:
+            try:
+                if self.reload(name):
+                    reloaded.append(name)
+            except Exception as e:
+                logger.error(f"Error reloading {self.entries[name].label}: {str(e)}")
+        return reloaded
+
+    def _initial_load(self, entry: ModelEntry) -> None:
+        """
+        Load and warm up the first version of a model, then set its ready event whatever the
+        outcome, so requests waiting for it go ahead (with the fallback if it did not load).
+        """
+        try:
+            with entry.lock:
+                self._load_version(entry, artifact_stamp(entry.path))
+        except Exception as e:
+            logger.error(f"Error loading {entry.label}: {str(e)}")
+            entry.error = str(e)
+        finally:
+            entry.ready.set()
+
+    def _poll(self) -> None:
+        """Check for new artifact versions every poll interval until stopped."""
+        while not self._stop.wait(self.poll_interval):
+            self.reload_changed()
+
+    def _load_version(self, entry: ModelEntry, stamp: Optional[ArtifactStamp]) -> bool:
+        """
+        Build, load and warm up a model for the current artifact, and serve it if it loaded.
+
+        The first load serves the model even when there is no artifact, so requests get the
+        rule-based fallback. Called with the entry's lock held.
+
+        Returns:
+            True if a new version is being served
+        """
+        candidate = entry.factory(entry.path)
+
+        start_time = time.perf_counter()
+        loaded = stamp is not None and candidate.load_model()
+        load_time = time.perf_counter() - start_time
+
+        if not loaded:
+            # Models retry loading themselves on predict; with hot reload the poller does it instead
+            if self.poll_interval > 0:
+                candidate.load_backoff.disable()
+            if stamp is not None:
+                entry.failed_stamp = stamp
+                delay = entry.backoff.failed()
+                entry.error = f"Could not load {entry.path}"
+                logger.warning(f"{entry.label}: could not load {entry.path}; next attempt in {delay:.0f}s")
+            if entry.version > 0 or entry.warm:
+                return False
+            logger.warning(f"{entry.label} not loaded. API will use fallback calculation.")
+
+        # Warm up before serving; predictions fall back to the rule-based calculation,
+        # so this warms whichever path the version serves
+        start_time = time.perf_counter()
+        candidate.predict(**entry.warmup_request)
+        warmup_time = time.perf_counter() - start_time
+
+        # Atomic swap: requests read entry.model once and finish on the version they read.
+        # A failed artifact's stamp is kept only in failed_stamp, so reload retries it after the backoff
+        entry.model = candidate
+        entry.stamp = stamp if loaded else None
+        entry.loaded = loaded
+        entry.warm = True
+        entry.load_time = load_time
+        entry.warmup_time = warmup_time
+        if loaded:
+            entry.version += 1
+            entry.modified = datetime.fromtimestamp(stamp[0] / 1e9).isoformat()
+            entry.error = None
+            entry.failed_stamp = None
+            entry.backoff.succeeded()
+            logger.info(f"{entry.label} version {entry.version} loaded in {load_time:.2f}s "
+                        f"(inference: {candidate.get_inference_path()})")
+        return loaded
@@ -0,0 +1,7 @@
+# conftest.py
+# Make the ml modules importable from the tests, as when the scripts run from the ml directory
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,55 @@
+# test_incremental_update.py
+# Incremental training dataset updates must match a full rebuild exactly
+
+import os
+
+import pandas as pd
+import pytest
+
+from feature_engineering import DiabetesDataProcessor
+
+RAW_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'raw')
+
+# (step, share of its time span revealed for the first patient, and for the second)
+STEPS = [
+    ('initial', 0.04, 0.04),
+    ('first patient grows', 0.06, 0.04),
+    ('both grow', 0.08, 0.07),
+    ('both grow again', 0.10, 0.10),
+    ('unchanged', 0.10, 0.10)
+]
+
+@pytest.fixture(scope='module')
+def export() -> pd.DataFrame:
+    """Two raw exports in one file, each patient's rows together as in the raw exports."""
+    paths = [os.path.join(RAW_DATA_DIR, name) for name in ['1.csv', '3.csv']]
+    if not all(os.path.exists(path) for path in paths):
+        pytest.skip("Raw exports 1.csv and 3.csv not found")
+    return pd.concat([pd.read_csv(path, dtype=str, keep_default_na=False) for path in paths], ignore_index=True)
+
+def test_incremental_update_matches_full_rebuild(export: pd.DataFrame, tmp_path) -> None:
+    processor = DiabetesDataProcessor(output_dir=str(tmp_path / 'processed'))
+    row_times = processor._row_event_times(export, {})
+    first_patient = export['id'] == export['id'].iloc[0]
+
+    # Revealed rows keep their order, so the second patient's rows move when the first grows
+    spans = {}
+    for patient_id, times in row_times.groupby(export['id']):
+        spans[patient_id] = (times.min(), times.max())
+    starts = export['id'].map(lambda patient_id: spans[patient_id][0])
+    ends = export['id'].map(lambda patient_id: spans[patient_id][1])
+
+    file_path = str(tmp_path / 'export.csv')
+    state_dir = str(tmp_path / 'state')
+    for step, first_share, second_share in STEPS:
+        share = first_patient.map({True: first_share, False: second_share})
+        cut = starts + (ends - starts) * share
+        export[(row_times <= cut) | row_times.isna()].to_csv(file_path, index=False)
+
+        incremental = processor.update_training_datasets([file_path], state_dir)
+        full = processor.create_training_datasets(*processor.process_csv_files([file_path]))
+
+        assert sorted(incremental) == sorted(full), step
+        for name, df in full.items():
+            pd.testing.assert_frame_equal(incremental[name], df.reset_index(drop=True), check_exact=True,
+                                          obj=f"{step}: {name} dataset")
@@ -0,0 +1,118 @@
+# test_model_registry.py
+# Served models are hot-reloaded from new artifact versions, retried after failed loads and ready once warm
+
+import os
+import shutil
+import time
+
+import pytest
+
+import insulin_prediction
+from feature_engineering import DiabetesDataProcessor
+from insulin_prediction import InsulinPredictionModel
+from model_registry import LoadBackoff, ModelRegistry
+
+WARMUP_REQUEST = {'blood_glucose': 180, 'carb_intake': 45, 'exercise_time': 0, 'weight': 70,
+                  'current_insulin_dosage': 0}
+
+@pytest.fixture(scope='module')
+def trained_model(tmp_path_factory) -> str:
+    """A small insulin model trained on a synthetic cohort, saved outside models/."""
+    tmp_path = tmp_path_factory.mktemp('trained')
+    processor = DiabetesDataProcessor(output_dir=str(tmp_path / 'processed'))
+    file_path = str(tmp_path / 'cohort.csv')
+    processor.generate_synthetic_cohort(n_patients=2, days=14).to_csv(file_path, index=False)
+    datasets = processor.create_training_datasets(*processor.process_csv_files([file_path]))
+
+    model_path = str(tmp_path / 'insulin_model.joblib')
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(insulin_prediction, 'FEATURE_IMPORTANCE_PATH', str(tmp_path / 'insulin_importance.csv'))
+        model = InsulinPredictionModel(model_path=model_path, scaler_path=str(tmp_path / 'insulin_scaler.joblib'))
+        model.train(datasets['insulin'])
+        model.save_model()
+    return model_path
+
+def test_hot_reload_swaps_new_version(trained_model: str, tmp_path) -> None:
+    model_path = str(tmp_path / 'insulin_model.joblib')
+    shutil.copy(trained_model, model_path)
+    registry = ModelRegistry(poll_interval=0)
+    entry = registry.register('insulin_model', 'Insulin model',
+                              lambda path: InsulinPredictionModel(model_path=path), model_path, WARMUP_REQUEST)
+
+    assert registry.wait(60)
+    assert registry.is_ready() and entry.loaded and entry.version == 1
+    first = registry.get('insulin_model')
+    assert not registry.reload('insulin_model')
+
+    # A new version of the artifact is loaded, warmed up and swapped in
+    shutil.copy(trained_model, model_path)
+    stat = os.stat(model_path)
+    os.utime(model_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert registry.reload('insulin_model')
+    assert entry.version == 2 and entry.warm
+    assert registry.get('insulin_model') is not first
+    assert registry.get('insulin_model').predict(**WARMUP_REQUEST)['method'] == 'ml-model'
+
+def test_failed_startup_load_is_retried(trained_model: str, tmp_path) -> None:
+    model_path = str(tmp_path / 'insulin_model.joblib')
+    shutil.copy(trained_model, model_path)
+
+    # The artifact does not change: the first load fails for another reason, e.g. a
+    # dependency that is not available yet
+    failing = [True]
+    def factory(path: str) -> InsulinPredictionModel:
+        model = InsulinPredictionModel(model_path=path)
+        if failing:
+            model.load_model = lambda: False
+        return model
+
+    registry = ModelRegistry(poll_interval=3600)
+    entry = registry.register('insulin_model', 'Insulin model', factory, model_path, WARMUP_REQUEST)
+    entry.backoff = LoadBackoff(initial=0.2)
+
+    assert registry.wait(60)
+    assert not entry.loaded and entry.warm and entry.version == 0
+    assert entry.error is not None and entry.failed_stamp is not None
+    assert registry.get('insulin_model').predict(**WARMUP_REQUEST)['method'] != 'ml-model'
+
+    # Negative cache: the same artifact is not retried before its backoff has passed
+    failing.clear()
+    assert not registry.reload('insulin_model')
+    time.sleep(0.3)
+    assert registry.reload('insulin_model')
+    assert entry.loaded and entry.version == 1 and entry.error is None
+    assert registry.get('insulin_model').predict(**WARMUP_REQUEST)['method'] == 'ml-model'
+
+def test_fallback_model_retries_itself_without_hot_reload(tmp_path) -> None:
+    registry = ModelRegistry(poll_interval=0)
+    registry.register('insulin_model', 'Insulin model', lambda path: InsulinPredictionModel(model_path=path),
+                      str(tmp_path / 'insulin_model.joblib'), WARMUP_REQUEST)
+
+    assert registry.wait(60)
+    # No poller will retry the load, so the served fallback model keeps its own backoff
+    assert registry.get('insulin_model').load_backoff.retry_at != float('inf')
+
+def test_not_ready_until_warm(trained_model: str, tmp_path) -> None:
+    model_path = str(tmp_path / 'insulin_model.joblib')
+    shutil.copy(trained_model, model_path)
+
+    # The warmup prediction of the first version raises, so the model is never warmed up
+    failing = [True]
+    def factory(path: str) -> InsulinPredictionModel:
+        model = InsulinPredictionModel(model_path=path)
+        if failing:
+            def predict(**kwargs):
+                raise RuntimeError("warmup failed")
+            model.predict = predict
+        return model
+
+    registry = ModelRegistry(poll_interval=0)
+    entry = registry.register('insulin_model', 'Insulin model', factory, model_path, WARMUP_REQUEST)
+
+    assert not registry.wait(60)
+    assert entry.ready.is_set() and not entry.warm
+    assert not registry.is_ready()
+
+    failing.clear()
+    assert registry.reload('insulin_model')
+    assert entry.warm and registry.is_ready()
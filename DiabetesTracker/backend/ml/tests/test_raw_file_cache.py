@@ -0,0 +1,52 @@
+# test_raw_file_cache.py
+# Cached per-patient frames are reused only for the same file path, contents and CSV parser
+
+import os
+
+import pandas as pd
+import pytest
+
+from feature_engineering import DiabetesDataProcessor
+
+@pytest.fixture
+def exports(tmp_path) -> list:
+    """Two different raw exports with the same file name in different directories."""
+    generator = DiabetesDataProcessor()
+    paths = []
+    for seed in [1, 2]:
+        os.makedirs(tmp_path / f"site_{seed}")
+        path = str(tmp_path / f"site_{seed}" / 'export.csv')
+        generator.generate_synthetic_cohort(n_patients=1, days=2, seed=seed,
+                                            first_patient_id=seed).to_csv(path, index=False)
+        paths.append(path)
+    return paths
+
+def test_same_file_name_in_two_directories(exports: list, tmp_path) -> None:
+    cache_dir = str(tmp_path / 'cache')
+    uncached = DiabetesDataProcessor(output_dir=str(tmp_path / 'processed'))
+    processor = DiabetesDataProcessor(output_dir=str(tmp_path / 'processed'), cache_dir=cache_dir)
+
+    # Processing one file must not drop the other's entry
+    for path in exports:
+        processor.process_csv_files([path])
+    assert len(os.listdir(cache_dir)) == 2
+
+    for path in exports:
+        glucose_df, insulin_df = processor.process_csv_files([path])
+        assert processor.cache_stats['hits'] == 1
+        expected_glucose, expected_insulin = uncached.process_csv_files([path])
+        pd.testing.assert_frame_equal(glucose_df, expected_glucose)
+        pd.testing.assert_frame_equal(insulin_df, expected_insulin)
+
+def test_csv_engine_is_part_of_the_key(exports: list, tmp_path) -> None:
+    cache_dir = str(tmp_path / 'cache')
+    DiabetesDataProcessor(output_dir=str(tmp_path / 'processed'), csv_engine='c',
+                          cache_dir=cache_dir).process_csv_files(exports[:1])
+
+    processor = DiabetesDataProcessor(output_dir=str(tmp_path / 'processed'), csv_engine='python',
+                                      cache_dir=cache_dir)
+    processor.process_csv_files(exports[:1])
+    assert processor.cache_stats['misses'] == 1
+
+    # The entry of the other parser is replaced, as for changed contents
+    assert len(os.listdir(cache_dir)) == 1
@@ -0,0 +1,39 @@
+# test_streaming.py
+# Streamed training CSVs must hold the rows and columns of the whole-file run
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from feature_engineering import DiabetesDataProcessor
+
+def test_streamed_datasets_match_whole_file_run(tmp_path) -> None:
+    processor = DiabetesDataProcessor(output_dir=str(tmp_path / 'processed'))
+    file_path = str(tmp_path / 'cohort.csv')
+    processor.generate_synthetic_cohort(n_patients=3, days=3).to_csv(file_path, index=False)
+
+    # A small budget splits patients across chunks
+    paths = processor.stream_csv_files([file_path], memory_budget_mb=1)
+    full = processor.create_training_datasets(*processor.process_csv_files([file_path]))
+
+    assert sorted(paths) == sorted(full)
+    for name, df in full.items():
+        streamed = pd.read_csv(paths[name])
+        assert list(streamed.columns) == list(df.columns), name
+        numeric = df.select_dtypes(include='number').columns
+        np.testing.assert_allclose(streamed[numeric].to_numpy(np.float64), df[numeric].to_numpy(np.float64),
+                                   rtol=1e-6, err_msg=name)
+
+def test_append_rejects_different_columns(tmp_path) -> None:
+    processor = DiabetesDataProcessor(output_dir=str(tmp_path / 'processed'))
+    file_path = str(tmp_path / 'dataset.csv')
+    processor._append_csv(pd.DataFrame({'a': [1], 'b': [2]}), file_path)
+
+    # Column order may differ; the header's order is kept
+    processor._append_csv(pd.DataFrame({'b': [4], 'a': [3]}), file_path)
+    assert pd.read_csv(file_path).to_dict('list') == {'a': [1, 3], 'b': [2, 4]}
+
+    with pytest.raises(ValueError, match="extra: \\['c'\\]"):
+        processor._append_csv(pd.DataFrame({'a': [5], 'b': [6], 'c': [7]}), file_path)
+    with pytest.raises(ValueError, match="missing: \\['b'\\]"):
+        processor._append_csv(pd.DataFrame({'a': [5]}), file_path)
@@ -0,0 +1,44 @@
+# test_worker_memory.py
+# Forked API workers must share the models instead of each holding a private copy
+
+import os
+
+import pytest
+
+import glucose_prediction_model
+import insulin_prediction
+from benchmark import WORKER_MEMORY_LIMIT_MB, benchmark_worker_memory
+from feature_engineering import DiabetesDataProcessor
+from glucose_prediction_model import GlucosePredictionModel
+from insulin_prediction import InsulinPredictionModel
+
+@pytest.mark.skipif(not os.path.exists('/proc/self/smaps_rollup') or not hasattr(os, 'fork'),
+                    reason="Needs fork and /proc/<pid>/smaps_rollup")
+def test_workers_share_models(tmp_path, monkeypatch) -> None:
+    # Small models trained on a synthetic cohort, so the check does not depend on models/
+    monkeypatch.setattr(glucose_prediction_model, 'FEATURE_IMPORTANCE_PATH', str(tmp_path / 'glucose_importance.csv'))
+    monkeypatch.setattr(insulin_prediction, 'FEATURE_IMPORTANCE_PATH', str(tmp_path / 'insulin_importance.csv'))
+    processor = DiabetesDataProcessor(output_dir=str(tmp_path / 'processed'))
+    file_path = str(tmp_path / 'cohort.csv')
+    processor.generate_synthetic_cohort(n_patients=2, days=14).to_csv(file_path, index=False)
+    datasets = processor.create_training_datasets(*processor.process_csv_files([file_path]))
+
+    glucose_model_path = str(tmp_path / 'models' / 'glucose_model.joblib')
+    insulin_model_path = str(tmp_path / 'models' / 'insulin_model.joblib')
+    glucose_model = GlucosePredictionModel(model_path=glucose_model_path,
+                                           scaler_path=str(tmp_path / 'models' / 'glucose_scaler.joblib'))
+    insulin_model = InsulinPredictionModel(model_path=insulin_model_path,
+                                           scaler_path=str(tmp_path / 'models' / 'insulin_scaler.joblib'))
+    glucose_model.train(datasets['glucose'].iloc[:500])
+    insulin_model.train(datasets['insulin'])
+    glucose_model.save_model()
+    insulin_model.save_model()
+
+    results = benchmark_worker_memory(workers=2, max_shared_growth_mb=WORKER_MEMORY_LIMIT_MB,
+                                      glucose_model_path=glucose_model_path,
+                                      insulin_model_path=insulin_model_path)
+
+    # benchmark_worker_memory checks the sharing modes; workers unpickling their own copy must
+    # exceed the limit, or the check could not tell sharing apart from small models
+    assert sorted(results) == ['preload', 'preload-shared', 'private', 'shared']
+    assert results['private']['max'] > WORKER_MEMORY_LIMIT_MB